@@ -0,0 +1,139 @@
+import os
+import random
+
+# Vocabulary used to build O-RAN-like specification text
+MEASUREMENTS = [
+    "DRB.UEThpDl", "DRB.UEThpUl", "DRB.RlcSduDelayDl", "DRB.PdcpSduVolumeDL_Filter", "RRU.PrbUsedDl",
+    "RRU.PrbAvailDl", "RRC.ConnEstabSucc", "RRC.ConnMean", "QosFlow.TotPdcpPduVolumeDl", "L1M.RS-SINR",
+]
+INFORMATION_ELEMENTS = [
+    "RAN Function Name", "E2SM-KPM Action Definition Format 1", "Measurement Information List",
+    "Granularity Period", "Cell Global ID", "UE ID", "Matching Condition", "RAN Parameter ID",
+    "Control Action ID", "Event Trigger Style Type", "Insert Indication ID", "Policy Condition",
+]
+TOPICS = [
+    "E2 Node", "Near-RT RIC", "xApp", "Non-RT RIC", "A1 policy", "RIC Subscription", "RIC Indication",
+    "RIC Control Request", "E2 Setup", "Service Model", "O-DU", "O-CU-CP", "O-CU-UP", "rApp",
+]
+VERBS = ["reports", "configures", "subscribes to", "triggers", "aggregates", "encodes", "exposes", "controls"]
+
+
+def _sentence(rng):
+    return (
+        f"The {rng.choice(TOPICS)} {rng.choice(VERBS)} the {rng.choice(INFORMATION_ELEMENTS)} "
+        f"using {rng.choice(MEASUREMENTS)} for each {rng.choice(TOPICS)}."
+    )
+
+
+def spec_lines(rng, sections, paragraphs_per_section=3):
+    """
+    Yield text lines shaped like an O-RAN WG3 specification: numbered clauses,
+    prose paragraphs and IE/measurement tables.
+    """
+    for section in range(1, sections + 1):
+        yield f"{section} {rng.choice(TOPICS)} procedures"
+        for clause in range(1, 4):
+            yield f"{section}.{clause} {rng.choice(INFORMATION_ELEMENTS)}"
+            for _ in range(paragraphs_per_section):
+                yield " ".join(_sentence(rng) for _ in range(3))
+            yield f"Table {section}.{clause}-1: {rng.choice(INFORMATION_ELEMENTS)} IE"
+            yield "IE/Group Name    Presence    Range    IE type and reference    Semantics description"
+            for _ in range(4):
+                yield f"{rng.choice(INFORMATION_ELEMENTS)}    M    1..maxnoofMeas    {rng.choice(MEASUREMENTS)}    {_sentence(rng)}"
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(line, width=95):
+    words, current = line.split(" "), ""
+    for word in words:
+        if current and len(current) + len(word) + 1 > width:
+            yield current
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        yield current
+
+
+def write_pdf(path, lines, lines_per_page=55):
+    """
+    Write a minimal, valid text-only PDF (Helvetica, one content stream per page).
+    """
+    wrapped = [part for line in lines for part in _wrap(line)]
+    pages = [wrapped[i:i + lines_per_page] for i in range(0, len(wrapped), lines_per_page)] or [[]]
+
+    objects = []
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for page_lines in pages:
+        content = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in page_lines) + " ET"
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects.append((content_id, f"<< /Length {len(content.encode('latin-1'))} >>\nstream\n{content}\nendstream"))
+        objects.append((page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_id} 0 R /Resources << /Font << /F1 {font_id} 0 R >> >> >>"))
+        page_ids.append(page_id)
+
+    objects = [
+        (1, "<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{' '.join(f'{p} 0 R' for p in page_ids)}] /Count {len(page_ids)} >>"),
+        (font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"),
+    ] + objects
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id, body in sorted(objects):
+        offsets[object_id] = len(out)
+        out += f"{object_id} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for object_id in range(1, len(objects) + 1):
+        out += f"{offsets[object_id]:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def write_html(path, title, lines, links=()):
+    body = "\n".join(f"<h2>{line}</h2>" if line[:1].isdigit() and len(line) < 80 else f"<p>{line}</p>" for line in lines)
+    anchors = "\n".join(f'<a href="{link}">{link}</a>' for link in links)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<html><head><title>{title}</title></head><body><h1>{title}</h1>\n{body}\n{anchors}\n</body></html>\n")
+
+
+def generate_corpus(root, pdfs=3, sections_per_pdf=6, html_pages=4, sections_per_page=2, seed=7):
+    """
+    Create `root/data/*.pdf` and `root/html/*.html` and return their paths.
+    """
+    rng = random.Random(seed)
+    data_dir = os.path.join(root, "data")
+    html_dir = os.path.join(root, "html")
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(html_dir, exist_ok=True)
+
+    for number in range(pdfs):
+        write_pdf(os.path.join(data_dir, f"O-RAN.WG3.SYNTH-{number:02d}.pdf"), list(spec_lines(rng, sections_per_pdf)))
+
+    page_names = ["index.html"] + [f"page-{number:02d}.html" for number in range(1, html_pages)]
+    for position, name in enumerate(page_names):
+        links = page_names[position + 1:position + 3]
+        write_html(os.path.join(html_dir, name), f"NONRTRIC synthetic page {position}", list(spec_lines(rng, sections_per_page)), links)
+
+    return data_dir, html_dir
+
+
+def sample_prompts(count, seed=11):
+    rng = random.Random(seed)
+    templates = [
+        "What does {m} measure and which IE carries it?",
+        "Explain the {ie} in the {t} procedure.",
+        "How does the {t} use {m}?",
+        "Describe the {ie} and its presence in the {t} messages.",
+    ]
+    return [
+        rng.choice(templates).format(m=rng.choice(MEASUREMENTS), ie=rng.choice(INFORMATION_ELEMENTS), t=rng.choice(TOPICS))
+        for _ in range(count)
+    ]
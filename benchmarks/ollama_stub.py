@@ -0,0 +1,85 @@
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal Ollama API (`/api/chat`, `/api/generate`, `/api/tags`) answering with a fixed text,
+    so LLM failover can be exercised without a local model: point OLLAMA_BASE_URL at it.
+    """
+
+    answer = "Local fallback answer."
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "stub", "model": "stub"}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        time.sleep(self.latency)
+        chat = self.path == "/api/chat"
+        model = request.get("model", "stub")
+
+        def chunk(text, done):
+            created = datetime.now(timezone.utc).isoformat()
+            payload = {"model": model, "created_at": created, "done": done}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload.update({"done_reason": "stop", "prompt_eval_count": 1, "eval_count": len(self.answer.split())})
+            return payload
+
+        if not request.get("stream", True):
+            self._send_json(chunk(self.answer, True))
+            return
+        # Streamed responses are NDJSON, one chunk per word
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for word in self.answer.split(" "):
+            self.wfile.write((json.dumps(chunk(word + " ", False)) + "\n").encode("utf-8"))
+        self.wfile.write((json.dumps(chunk("", True)) + "\n").encode("utf-8"))
+
+
+def serve(port=0, answer=None, latency=0.0):
+    # Start the stub on a background thread; returns the server (its port is server.server_address[1])
+    handler = type("Handler", (OllamaStubHandler,), {"answer": answer or OllamaStubHandler.answer, "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama API")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.port, latency=args.latency)
+    print(f"Ollama stub listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,184 @@
+"""
+Offline latency benchmark for ingestion, retrieval, synthesis, the /generate endpoint and
+PDF rendering. Groq and the HuggingFace model are replaced by deterministic local stand-ins,
+and the web index is served from a synthetic local site, so no network access is needed.
+
+    python -m benchmarks.run_bench --pdfs 5 --requests 40 --concurrency 8 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import functools
+import statistics
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate_corpus, sample_prompts
+from benchmarks.stubs import StubLLM, HashEmbedding
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(samples, wall_time=None, errors=0):
+    result = {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2) if samples else None,
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2) if samples else None,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2) if samples else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if wall_time:
+        result["throughput_per_s"] = round(len(samples) / wall_time, 2)
+    return result
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return time.perf_counter() - started, value
+
+
+def serve_directory(directory):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_concurrently(fn, items, concurrency):
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, elapsed in pool.map(lambda item: _call(fn, item), items):
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+    return latencies, time.perf_counter() - started, errors
+
+
+def _call(fn, item):
+    started = time.perf_counter()
+    try:
+        ok = fn(item) is not False
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", type=int, default=3, help="number of synthetic specification PDFs")
+    parser.add_argument("--sections", type=int, default=6, help="top-level clauses per PDF")
+    parser.add_argument("--html-pages", type=int, default=4, help="number of synthetic web pages")
+    parser.add_argument("--requests", type=int, default=20, help="queries per stage")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent /generate requests")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="simulated LLM latency in seconds")
+    parser.add_argument("--workdir", help="keep the corpus and indexes in this directory")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="oran-bench-")
+    data_dir, html_dir = generate_corpus(workdir, pdfs=args.pdfs, sections_per_pdf=args.sections, html_pages=args.html_pages)
+    server = serve_directory(html_dir)
+    web_url = f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+    # Everything the app reads relative to the CWD (data/, chroma_db/, reports/) lives in the workdir
+    os.chdir(workdir)
+    os.environ.update({"WEB_SOURCE_URL": web_url, "DATA_DIR": data_dir, "PRELOAD_VECTOR_STORES": "chroma,llamaindex", "WEB_CRAWL_DEPTH": "2"})
+
+    import config
+
+    config.use_models(llm=StubLLM(latency=args.llm_latency), embed_model=HashEmbedding(), llm_client=object())
+
+    import main_api
+    from fastapi.testclient import TestClient
+    from llama_index.core.schema import QueryBundle
+    from tools.report_generator import generate_report
+    from tools.renderers import pdf_renderers, render_html
+
+    prompts = sample_prompts(args.requests)
+    results = {"corpus": {"pdfs": args.pdfs, "sections_per_pdf": args.sections, "html_pages": args.html_pages, "workdir": workdir}}
+
+    # Ingestion: cold builds and warm reopens with nothing changed, for Chroma and the packed in-process store
+    ingestion = {}
+    for label, vector_store_type in [("chroma_cold", "chroma"), ("chroma_warm", "chroma"), ("llamaindex_cold", "llamaindex"), ("llamaindex_warm", "llamaindex")]:
+        elapsed, indexes = timed(main_api.load_indexes, vector_store_type)
+        ingestion[label] = {"seconds": round(elapsed, 3), "peak_rss_mb": peak_rss_mb()}
+    results["load_indexes"] = ingestion
+
+    guidelines_index, web_index = indexes
+    elapsed, engines = timed(main_api.create_query_engines, guidelines_index, web_index)
+    results["create_query_engines"] = {"seconds": round(elapsed, 4)}
+    guidelines_query_engines = engines[0]
+    guidelines_query_engine = guidelines_query_engines["hybrid"]
+
+    # Retrieval alone in each mode, then retrieval + synthesis through the query engine
+    for mode, engine in sorted(guidelines_query_engines.items()):
+        retrieval = [timed(engine.retrieve, QueryBundle(prompt))[0] for prompt in prompts]
+        results[f"retrieval_{mode}"] = summarize(retrieval, sum(retrieval))
+    synthesis = [timed(guidelines_query_engine.query, prompt)[0] for prompt in prompts]
+    results["query_engine"] = summarize(synthesis, sum(synthesis))
+
+    # The /generate endpoint through the ASGI test client (startup preloads the indexes)
+    with TestClient(main_api.app) as client:
+        def generate(prompt):
+            response = client.post("/generate", json={"prompt": prompt, "vectorStoreType": "chroma"})
+            return response.status_code == 200
+
+        latencies, wall_time, errors = run_concurrently(generate, prompts, args.concurrency)
+        results["generate_endpoint"] = summarize(latencies, wall_time, errors)
+        results["generate_endpoint"]["concurrency"] = args.concurrency
+
+    # PDF rendering on its own (fails fast and is reported as errors without any PDF renderer)
+    render_dir = tempfile.mkdtemp(prefix="render-", dir=workdir)
+    markdown = "# Benchmark report\n\n" + "\n\n".join(f"## {prompt}\n\n{prompt * 5}" for prompt in prompts[:5])
+    render_latencies, render_errors = [], 0
+    for number in range(min(args.requests, 5)):
+        output_file = os.path.join(render_dir, f"report-{number}.pdf")
+        elapsed, _ = timed(generate_report, markdown, output_file)
+        render_latencies.append(elapsed)
+        render_errors += 0 if os.path.exists(output_file) else 1
+    results["generate_report"] = summarize(render_latencies, sum(render_latencies), render_errors)
+    results["generate_report"]["backends"] = [renderer.name for renderer in pdf_renderers()]
+
+    # The inline HTML path used by outputFormat=html
+    html_latencies = [timed(render_html, markdown)[0] for _ in range(min(args.requests, 5))]
+    results["render_html"] = summarize(html_latencies, sum(html_latencies), 0)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    server.shutdown()
+    if not args.workdir:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
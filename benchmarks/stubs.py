@@ -0,0 +1,84 @@
+import re
+import time
+import asyncio
+import hashlib
+import math
+from typing import Any
+from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.embeddings import BaseEmbedding
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_.\-]+")
+
+
+class StubLLM(CustomLLM):
+    """
+    Deterministic local LLM: answers with the start of the retrieved context after a fixed
+    delay, so synthesis cost can be measured without a network round-trip.
+    """
+
+    latency: float = 0.0
+    answer_words: int = 120
+    context_window: int = 131072
+    num_output: int = 1024
+
+    @property
+    def metadata(self):
+        return LLMMetadata(context_window=self.context_window, num_output=self.num_output, model_name="stub-llm")
+
+    def _answer(self, prompt):
+        words = TOKEN_PATTERN.findall(prompt)
+        body = " ".join(words[-self.answer_words:])
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"Stub answer {digest}: {body}"
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.latency)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await asyncio.sleep(self.latency)
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        time.sleep(self.latency)
+        answer = self._answer(prompt)
+
+        def gen():
+            text = ""
+            for word in answer.split(" "):
+                delta = word + " "
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return gen()
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic bag-of-words embedding using the hashing trick. Texts sharing tokens get
+    similar vectors, which is enough to exercise retrieval without downloading a model.
+    """
+
+    dim: int = 384
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query: str):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str):
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query: str):
+        return self._embed(query)
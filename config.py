@@ -1,9 +1,9 @@
 import os
+import time
+import asyncio
+import threading
 from dotenv import load_dotenv
 from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.groq import Groq
-from openai import OpenAI
 import logging
 
 # Setup logging configuration
@@ -13,57 +13,251 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv()
 
-# Retrieve Groq API key
-groq_api_key = os.getenv("GroqCloud_API_TOKEN")
-if not groq_api_key:
-    logger.error("[!] Groq API Key not found in .env file")
-    raise ValueError("Please set GroqCloud_API_TOKEN in .env file")
-
-# Initialize Groq OpenAI-compatible client
-client = OpenAI(
-    api_key=groq_api_key,
-    base_url="https://api.groq.com/openai/v1"
-)
-
-# Test Groq API connection
-try:
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": "Test connection"}],
-        max_tokens=10
-    )
-    logger.info("[✔] Groq API is running successfully.")
-except Exception as e:
-    logger.error(f"[!] Error connecting to Groq API: {str(e)}")
-    exit(1)
-
-# Initialize embedding model using HuggingFace
-try:
-    Settings.embed_model = HuggingFaceEmbedding(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    logger.info("[✔] HuggingFace embedding model initialized successfully.")
-except Exception as e:
-    logger.error(f"[!] Error initializing embedding model: {str(e)}")
-    raise
-
-# Initialize Groq LLM
-try:
-    Settings.llm = Groq(
-        api_key=groq_api_key,
-        model="llama-3.3-70b-versatile",
-        api_base="https://api.groq.com/openai/v1"
-    )
-    logger.info("[✔] Groq LLM initialized successfully.")
-except Exception as e:
-    logger.error(f"[!] Error initializing Groq LLM: {str(e)}. Falling back to Ollama.")
-    from llama_index.llms.ollama import Ollama
-    
-    # Fallback to local LLM via Ollama if Groq fails
-    Settings.llm = Ollama(model="mistral:instruct", request_timeout=360.0, base_url="http://127.0.0.1:11434")
+# Model and endpoint settings
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GROQ_API_BASE = "https://api.groq.com/openai/v1"
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+OLLAMA_MODEL = "mistral:instruct"
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+
+# Groq budgets enforced by the LLM scheduler (0 = unlimited); calls fail over to Ollama when saturated
+LLM_SCHEDULER = os.getenv("LLM_SCHEDULER", "1") == "1"
+LLM_RPM = int(os.getenv("LLM_RPM", "30"))
+# LLM_TPM's default is a conservative guess, not Groq's published limit: set it to your account's quota
+LLM_TPM = int(os.getenv("LLM_TPM", "6000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_FAILOVER_WAIT = float(os.getenv("LLM_FAILOVER_WAIT", "5"))
+LLM_FAILOVER = os.getenv("LLM_FAILOVER", "1") == "1"
+
+# Optional local directory for the HuggingFace model, so restarts never re-download it
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR")
 
 # Define path for Chroma vector store
 CHROMA_DB_PATH = "./chroma_db"
 
-# Export the client for use in other modules
-Settings.llm_client = client
+# Nothing below is constructed at import time; each object is built on first use.
+# Importing this module never touches the network.
+_lock = threading.RLock()
+_llm_client = None
+_embed_model = None
+_llm = None
+_http_clients = None
+_settings_configured = False
+
+# Seconds spent on each step of the last warmup() call
+warmup_timings = {}
+
+
+def get_groq_api_key():
+    # Retrieve Groq API key
+    groq_api_key = os.getenv("GroqCloud_API_TOKEN")
+    if not groq_api_key:
+        logger.error("[!] Groq API Key not found in .env file")
+        raise ValueError("Please set GroqCloud_API_TOKEN in .env file")
+    return groq_api_key
+
+
+def _loop_local_async_client(**kwargs):
+    import httpx
+
+    class LoopLocalAsyncClient(httpx.AsyncClient):
+        """
+        AsyncClient that sends every request through a pool of the running event loop. Pooled
+        connections cannot outlive the loop that opened them, and the CLI runs each question in
+        its own `asyncio.run`.
+        """
+
+        def __init__(self):
+            super().__init__(**kwargs)
+            self._loop_clients = {}
+            self._loop_lock = threading.Lock()
+
+        async def send(self, request, **send_kwargs):
+            loop = asyncio.get_running_loop()
+            with self._loop_lock:
+                # Pools of finished loops are dropped; their sockets close when they are collected
+                for closed in [other for other in self._loop_clients if other.is_closed()]:
+                    del self._loop_clients[closed]
+                client = self._loop_clients.get(loop)
+                if client is None:
+                    client = self._loop_clients[loop] = httpx.AsyncClient(**kwargs)
+            return await client.send(request, **send_kwargs)
+
+    return LoopLocalAsyncClient()
+
+
+def get_http_clients():
+    global _http_clients
+    with _lock:
+        if _http_clients is None:
+            import httpx
+
+            # One keep-alive connection pool per process for sync Groq calls, one per event loop for async ones
+            limits = httpx.Limits(max_connections=LLM_MAX_CONCURRENCY * 2, max_keepalive_connections=LLM_MAX_CONCURRENCY, keepalive_expiry=60)
+            timeout = httpx.Timeout(120.0, connect=10.0)
+            _http_clients = (httpx.Client(limits=limits, timeout=timeout), _loop_local_async_client(limits=limits, timeout=timeout))
+        return _http_clients
+
+
+def get_llm_client():
+    global _llm_client
+    with _lock:
+        if _llm_client is None:
+            from openai import OpenAI
+
+            # Initialize Groq OpenAI-compatible client
+            _llm_client = OpenAI(api_key=get_groq_api_key(), base_url=GROQ_API_BASE, http_client=get_http_clients()[0])
+        return _llm_client
+
+
+def get_ollama_llm():
+    from llama_index.llms.ollama import Ollama
+
+    return Ollama(model=OLLAMA_MODEL, request_timeout=360.0, base_url=OLLAMA_BASE_URL)
+
+
+def ollama_alive():
+    # Cheap liveness probe for the failover target; the scheduler caches the result
+    import httpx
+
+    try:
+        return httpx.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=1.0).status_code == 200
+    except httpx.HTTPError:
+        return False
+
+
+def get_embed_model():
+    global _embed_model
+    with _lock:
+        if _embed_model is None:
+            # Initialize embedding model using HuggingFace
+            try:
+                from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+                _embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, cache_folder=EMBED_CACHE_DIR)
+                logger.info("[✔] HuggingFace embedding model initialized successfully.")
+            except Exception as e:
+                logger.error(f"[!] Error initializing embedding model: {str(e)}")
+                raise
+        return _embed_model
+
+
+def get_llm():
+    global _llm
+    with _lock:
+        if _llm is None:
+            groq_api_key = get_groq_api_key()
+
+            # Initialize Groq LLM
+            try:
+                from llama_index.llms.groq import Groq
+
+                sync_client, async_client = get_http_clients()
+                groq = Groq(
+                    api_key=groq_api_key, model=GROQ_MODEL, api_base=GROQ_API_BASE,
+                    # Retries are left to the scheduler, which knows about the rate limits
+                    max_retries=0 if LLM_SCHEDULER else 3,
+                    http_client=sync_client, async_http_client=async_client,
+                )
+                logger.info("[✔] Groq LLM initialized successfully.")
+            except Exception as e:
+                logger.error(f"[!] Error initializing Groq LLM: {str(e)}. Falling back to Ollama.")
+
+                # Fallback to local LLM via Ollama if Groq fails
+                _llm = get_ollama_llm()
+                return _llm
+
+            if not LLM_SCHEDULER:
+                _llm = groq
+                return _llm
+            from tools.llm_scheduler import LLMDispatcher, ScheduledLLM
+
+            # Queue, rate-limit and retry Groq calls; fail over per call to Ollama (built on first use)
+            dispatcher = LLMDispatcher(rpm=LLM_RPM or None, tpm=LLM_TPM or None, max_concurrency=LLM_MAX_CONCURRENCY)
+            _llm = ScheduledLLM(
+                groq, dispatcher,
+                fallback_factory=get_ollama_llm if LLM_FAILOVER else None,
+                fallback_check=ollama_alive,
+                max_retries=LLM_MAX_RETRIES,
+                failover_wait=LLM_FAILOVER_WAIT,
+            )
+        return _llm
+
+
+def llm_status():
+    # Queue depth, budgets and failover counts of the LLM scheduler (None when it is disabled)
+    llm = _llm
+    return llm.status() if hasattr(llm, "status") and hasattr(llm, "dispatcher") else None
+
+
+def configure_settings():
+    # Install the project's models into the global LlamaIndex Settings (idempotent)
+    global _settings_configured
+    with _lock:
+        if not _settings_configured:
+            from tools import metrics
+
+            # Time embedding, retrieval and LLM calls for the /metrics endpoint
+            metrics.install()
+            Settings.embed_model = get_embed_model()
+            Settings.llm = get_llm()
+
+            # Export the client for use in other modules
+            Settings.llm_client = get_llm_client()
+            _settings_configured = True
+
+
+def use_models(llm=None, embed_model=None, llm_client=None):
+    # Replace the lazily built models, e.g. with local stand-ins for offline benchmarks
+    global _llm, _embed_model, _llm_client, _settings_configured
+    from tools import metrics
+
+    with _lock:
+        metrics.install()
+        if llm is not None:
+            _llm = llm
+            Settings.llm = llm
+        if embed_model is not None:
+            _embed_model = embed_model
+            Settings.embed_model = embed_model
+        if llm_client is not None:
+            _llm_client = llm_client
+            Settings.llm_client = llm_client
+        _settings_configured = _llm is not None and _embed_model is not None and _llm_client is not None
+
+
+def check_groq_connection():
+    # Test Groq API connection with a tiny completion
+    try:
+        get_llm_client().chat.completions.create(
+            model=GROQ_MODEL,
+            messages=[{"role": "user", "content": "Test connection"}],
+            max_tokens=10
+        )
+        logger.info("[✔] Groq API is running successfully.")
+        return True
+    except Exception as e:
+        logger.error(f"[!] Error connecting to Groq API: {str(e)}")
+        return False
+
+
+def warmup(check_connection=None):
+    """
+    Construct the embedding model, LLM and Groq client up front and record how long each took.
+    Meant for application startup hooks; `check_connection` (or GROQ_CONNECTION_CHECK=1) also
+    sends a test completion to Groq.
+    """
+    if check_connection is None:
+        check_connection = os.getenv("GROQ_CONNECTION_CHECK", "0") == "1"
+
+    steps = [("embed_model", get_embed_model), ("llm", get_llm), ("llm_client", get_llm_client), ("settings", configure_settings)]
+    if check_connection:
+        steps.append(("groq_connection", check_groq_connection))
+
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        warmup_timings[name] = round(time.perf_counter() - started, 3)
+    logger.info(f"[✔] Warmup finished: {warmup_timings}")
+    return dict(warmup_timings)
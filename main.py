@@ -1,11 +1,15 @@
 import os
+import shutil
+import asyncio
+import argparse
 from dotenv import load_dotenv
 from llama_index.core import Settings
-from llama_index.core.agent import ReActAgent
 from llama_index.core.prompts import PromptTemplate
-from tools.guidelines import guidelines_engine
-from tools.web_reader import web_reader_engine
+from tools.guidelines import get_guidelines_engine
+from tools.web_reader import get_web_reader_engine
 from tools.report_generator import generate_report
+from tools.agent_runner import ParallelToolAgent
+from tools.batch import BatchLog, load_batch_items, run_batch, batch_item_id
 import config
 import logging
 
@@ -52,30 +56,98 @@ report_prompt = PromptTemplate(
     """
 )
 
-# Initialize the ReAct Agent with available tools and LLM
-agent = ReActAgent.from_tools(
-    tools=[
-        guidelines_engine,
-        web_reader_engine,
-        generate_report
-    ],
-    llm=Settings.llm,
-    verbose=True
-)
+def run_batch_file(batch_path, output_path=None, pdf_dir=None, vector_store_type="chroma", concurrency=4, collection=None):
+    """
+    Answer every prompt in a JSONL file (one {"prompt": ...} object or string per line) through the
+    same indexes, answer cache and render pool as the API. Results are appended to `output_path` as
+    they finish; running the same command again skips items that already completed.
+    """
+    # Imported here so the interactive agent does not load the API's indexes
+    import main_api
+
+    config.warmup()
+    defaults = {"vectorStoreType": vector_store_type, **({"collection": collection} if collection else {})}
+    items = [{**defaults, **item} for item in load_batch_items(batch_path)]
+    # Same checks as POST /generate/batch, so a typo fails before anything runs
+    for number, item in enumerate(items, start=1):
+        error = main_api.request_error(main_api.PromptRequest(**item))
+        if error:
+            raise SystemExit(f"Invalid batch item {number} in {batch_path}: {error}")
+    output_path = output_path or f"{os.path.splitext(batch_path)[0]}.results.jsonl"
+    log = BatchLog(output_path)
+    if pdf_dir:
+        os.makedirs(pdf_dir, exist_ok=True)
+
+    async def process(item, prompt_embedding):
+        result = await main_api.generate_batch_item(item, prompt_embedding)
+        if pdf_dir:
+            # Copy the rendered report next to the results under the item's id (rendering it now
+            # if the item asked for Markdown or HTML)
+            job = await main_api.ensure_report_pdf(main_api.report_queue.get(result["report_id"]))
+            pdf_path = os.path.join(pdf_dir, f"{batch_item_id(item)}.pdf")
+            shutil.copyfile(job.path, pdf_path)
+            result["pdf_path"] = pdf_path
+        return result
+
+    async def drive():
+        done = 0
+        async for record in run_batch(items, process, main_api.embed_queries, log, concurrency=concurrency):
+            done += 1
+            status = "resumed" if record.get("resumed") else record["status"]
+            print(f"[{done}/{len(items)}] {status}: {record['prompt'][:80]}")
 
-# Main interaction loop
-while True:
-    user_input = input("You: ")
-    if user_input.lower() == "quit":
-        break
     try:
-        # Generate the report using the custom prompt
-        response = agent.chat(report_prompt.format(user_input=user_input))
-        logger.info(f"Agent response: {str(response)[:100]}...")
-        # Save the generated report as a PDF
-        report_result = generate_report(str(response), "report.pdf")
-        logger.info(f"Report generation result: {report_result}")
-        print("Agent: ", response)
-    except Exception as e:
-        logger.error(f"Error generating report: {str(e)}")
-        print(f"Error: {str(e)}")
+        asyncio.run(drive())
+    finally:
+        main_api.report_queue.shutdown()
+    logger.info(f"Batch results written to {output_path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="O-RAN report assistant")
+    parser.add_argument("--batch", help="JSONL file of prompts to answer without the interactive agent")
+    parser.add_argument("--output", help="JSONL results file for --batch (default: <batch>.results.jsonl)")
+    parser.add_argument("--pdf-dir", help="copy each batch item's PDF report into this directory")
+    parser.add_argument("--vector-store", default="chroma", choices=["chroma", "llamaindex"], help="index used for --batch")
+    parser.add_argument("--collection", help="named collection used for --batch (default: the default collection)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")), help="batch items run at once")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        run_batch_file(args.batch, args.output, args.pdf_dir, args.vector_store, args.concurrency, args.collection)
+        return
+
+    # Build the models and tools explicitly, now that they are no longer created at import time
+    config.warmup()
+
+    # Initialize the agent with the retrieval tools and LLM. Independent lookups run in parallel and
+    # repeated ones are answered from the session memo; the PDF is rendered below, not by the agent.
+    agent = ParallelToolAgent(
+        tools=[
+            get_guidelines_engine(),
+            get_web_reader_engine(),
+        ],
+        llm=Settings.llm,
+        max_steps=int(os.getenv("AGENT_MAX_STEPS", "4")),
+        token_budget=int(os.getenv("AGENT_TOKEN_BUDGET", "24000")),
+        verbose=True
+    )
+
+    # Main interaction loop
+    while True:
+        user_input = input("You: ")
+        if user_input.lower() == "quit":
+            break
+        try:
+            # Generate the report using the custom prompt
+            response = agent.chat(report_prompt.format(user_input=user_input))
+            logger.info(f"Agent response: {str(response)[:100]}... ({agent.last_run})")
+            # Save the generated report as a PDF
+            report_result = generate_report(str(response), "report.pdf")
+            logger.info(f"Report generation result: {report_result}")
+            print("Agent: ", response)
+        except Exception as e:
+            logger.error(f"Error generating report: {str(e)}")
+            print(f"Error: {str(e)}")
+
+if __name__ == "__main__":
+    main()
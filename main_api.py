@@ -1,21 +1,40 @@
 import os
 import logging
 import re
-import time
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+import json
+import hashlib
+import asyncio
+from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from orjson import JSONDecodeError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from typing import List, Optional
 from llama_index.core import VectorStoreIndex, Settings, SimpleDirectoryReader
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core.prompts import PromptTemplate
-from llama_index.readers.web import SimpleWebPageReader
 from tools.guidelines import load_index as load_guidelines_index
 from tools.web_reader import load_index as load_web_index
-from tools.report_generator import generate_report
+from tools.report_jobs import ReportQueue
+from tools.renderers import render_html
+from tools.context_compression import context_compressor
+from tools.answer_cache import AnswerCache, normalize_prompt
+from tools.singleflight import SingleFlight
+from tools.metrics import METRICS, stage_timer, start_trace, trace_usage
+from tools.ingestion import IngestionManifest, hash_file, chroma_memory_limit_bytes, plan_sync, open_prepared, prepared_for, drop_old_versions, pdf_sources, web_sources
+from tools.index_registry import IndexRegistry
+from tools.index_maintenance import IndexMaintainer
+from tools.synthesis import ReportSynthesizer, abuild_query_bundle, node_sources
+from tools.keyword_index import hybrid_retriever, keyword_index_for, keyword_index_path
+from tools.spec_chunking import SpecChunker, PlainChunker, SectionStore, SectionExpansionPostprocessor
+from tools.packed_store import PackedVectorStore, packed_index
+from tools.query_router import QueryRouter
+from tools.crawler import WebCrawler
+from tools.batch import BatchLog, run_batch, batch_item_id
+from tools.llm_scheduler import llm_priority, BATCH_PRIORITY
+from tools.collection_config import DEFAULT_COLLECTION, load_collections
 import config
 import llama_index.core
 
@@ -26,21 +45,91 @@ logger = logging.getLogger(__name__)
 # Log current llama-index version
 logger.info(f"Llama-index version: {llama_index.core.__version__}")
 
+# Default URL used for web document index
+DEFAULT_URL = os.getenv("WEB_SOURCE_URL", "https://docs.o-ran-sc.org/projects/o-ran-sc-nonrtric/en/latest/overview.html#nonrtric-components")
+
+# Directory holding the guidelines PDFs
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# Serve the 'llamaindex' store type from packed, memory-mapped vector matrices (int8 with PACKED_INT8=1)
+PACKED_VECTOR_STORE = os.getenv("PACKED_VECTOR_STORE", "1") == "1"
+PACKED_INT8 = os.getenv("PACKED_INT8", "0") == "1"
+
+# Named collections (data directory, web source and retrieval settings each); 'default' is built
+# from DATA_DIR and WEB_SOURCE_URL
+COLLECTIONS_FILE = os.getenv("COLLECTIONS_FILE", "collections.json")
+COLLECTIONS = load_collections(COLLECTIONS_FILE, DATA_DIR, DEFAULT_URL)
+
+# Loaded collections are evicted, least recently used first, above this estimated size
+COLLECTION_MEMORY_MB = int(os.getenv("COLLECTION_MEMORY_MB", "2048"))
+MAX_LOADED_COLLECTIONS = int(os.getenv("MAX_LOADED_COLLECTIONS", "0"))
+
+# Hash of the guideline PDFs (name and content)
+def pdf_fingerprint(data_dir=DATA_DIR):
+    digest = hashlib.sha256()
+    for file_name in sorted(f for f in os.listdir(data_dir) if f.endswith('.pdf')):
+        digest.update(f"{file_name}\x00{hash_file(os.path.join(data_dir, file_name))}".encode("utf-8"))
+    return digest.hexdigest()
+
+# Hash of crawled web pages (or of nodes built from them), in crawl order
+def documents_digest(documents):
+    digest = hashlib.sha256()
+    for document in documents:
+        digest.update(f"{document.metadata.get('source', '')}\x00{document.get_content()}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+# A packed index is reused only if the sources, the chunking, the embedding model and the precision match
+def packed_fingerprint(chunker_name, content_digest):
+    key = f"{content_digest}\x00{chunker_name}\x00{Settings.embed_model.class_name()}:{Settings.embed_model.model_name}\x00{'int8' if PACKED_INT8 else 'float32'}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
 # Load indexes either from persistent Chroma DB or in-memory using LlamaIndex
-def load_indexes(vector_store_type):
+def load_indexes(vector_store_type, collection=DEFAULT_COLLECTION):
+    config.configure_settings()
+    settings = COLLECTIONS[collection]
     try:
         if vector_store_type == "chroma":
-            # Load vector indexes from Chroma
-            guidelines_index = load_guidelines_index("data", "guidelines")
-            web_index = load_web_index("https://docs.o-ran-sc.org/projects/o-ran-sc-nonrtric/en/latest/overview.html#nonrtric-components", "web")
+            # Load vector indexes from the collection's own Chroma collections. A maintenance
+            # refresh applies what its worker prepared instead, without parsing or crawling
+            guidelines_index = open_prepared(settings.index_name("guidelines"))
+            if guidelines_index is None:
+                guidelines_index = load_guidelines_index(settings.data_dir, settings.index_name("guidelines"))
+            web_index = open_prepared(settings.index_name("web"))
+            if web_index is None:
+                web_index = load_web_index(settings.web_url, settings.index_name("web"))
+        elif PACKED_VECTOR_STORE:
+            # Packed NumPy matrices persisted next to Chroma and memory-mapped, so every worker
+            # shares one copy and a restart re-embeds nothing unless the sources changed. After a
+            # maintenance refresh the worker has already written them; they are only mapped
+            chunker = SpecChunker()
+            guidelines_index = packed_index(
+                settings.index_name("guidelines"),
+                prepared_for(settings.index_name("guidelines")) or packed_fingerprint(chunker.name, pdf_fingerprint(settings.data_dir)),
+                lambda: chunker.get_nodes(SimpleDirectoryReader(input_dir=settings.data_dir, required_exts=['.pdf']).load_data()),
+                quantize=PACKED_INT8,
+            )
+
+            # The crawl itself is served from the page cache with conditional requests
+            web_chunker = PlainChunker()
+            web_fingerprint = prepared_for(settings.index_name("web"))
+            web_documents = None
+            if web_fingerprint is None:
+                web_documents = WebCrawler.from_env().crawl_documents([settings.web_url])
+                web_fingerprint = packed_fingerprint(web_chunker.name, documents_digest(web_documents))
+            web_index = packed_index(
+                settings.index_name("web"),
+                web_fingerprint,
+                lambda: web_chunker.get_nodes(web_documents if web_documents is not None else WebCrawler.from_env().crawl_documents([settings.web_url])),
+                quantize=PACKED_INT8,
+            )
         else:
             # Load guidelines index without Chroma (using LlamaIndex in-memory)
-            documents = SimpleDirectoryReader(input_dir="data", required_exts=['.pdf']).load_data()
-            guidelines_index = VectorStoreIndex.from_documents(documents)
+            documents = SimpleDirectoryReader(input_dir=settings.data_dir, required_exts=['.pdf']).load_data()
+            guidelines_index = VectorStoreIndex(SpecChunker().get_nodes(documents))
             logger.info("Created in-memory guidelines index for LlamaIndex")
             
-            # Load web index without Chroma
-            web_documents = SimpleWebPageReader(html_to_text=True).load_data(["https://docs.o-ran-sc.org/projects/o-ran-sc-nonrtric/en/latest/overview.html#nonrtric-components"])
+            # Load web index without Chroma (same crawler and page cache as the Chroma path)
+            web_documents = WebCrawler.from_env().crawl_documents([settings.web_url])
             web_index = VectorStoreIndex.from_documents(web_documents)
             logger.info("Created in-memory web index for LlamaIndex")
         
@@ -49,20 +138,191 @@ def load_indexes(vector_store_type):
         logger.error(f"[!] Error loading indexes: {str(e)}", exc_info=True)
         raise
 
-# Initialize retrievers and query engines
-def create_query_engines(guidelines_index, web_index):
-    guidelines_retriever = VectorIndexRetriever(index=guidelines_index, similarity_top_k=5)
-    web_retriever = VectorIndexRetriever(index=web_index, similarity_top_k=5)
+# Guidelines retrieval modes: dense only, or dense fused with BM25 keyword search
+RETRIEVAL_MODES = ["hybrid", "vector"]
+
+# Retrieval mode used when a request does not choose one
+DEFAULT_RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+# Largest clause (in characters) that is sent whole instead of its matching chunks
+SECTION_EXPAND_MAX_CHARS = int(os.getenv("SECTION_EXPAND_MAX_CHARS", "6000"))
+
+# Initialize retrievers and query engines with the collection's retrieval settings
+def create_query_engines(guidelines_index, web_index, collection=DEFAULT_COLLECTION):
+    settings = COLLECTIONS[collection]
+    top_k = settings.similarity_top_k
+    guidelines_retriever = VectorIndexRetriever(index=guidelines_index, similarity_top_k=top_k)
+    web_retriever = VectorIndexRetriever(index=web_index, similarity_top_k=top_k)
+    keyword_index = keyword_index_for(guidelines_index)
+    guidelines_retrievers = {
+        "hybrid": hybrid_retriever(guidelines_index, guidelines_retriever, similarity_top_k=top_k, keyword_index=keyword_index),
+        "vector": guidelines_retriever,
+    }
+
+    # Small clause chunks are searched; a clause several of them point into is sent whole
+    max_section_chars = settings.section_expand_max_chars if settings.section_expand_max_chars is not None else SECTION_EXPAND_MAX_CHARS
+    section_expansion = SectionExpansionPostprocessor(section_store=SectionStore(keyword_index), max_section_chars=max_section_chars)
+
+    # Deduplicate, re-rank, cut to the relevant sentences and fit the prompt token budget before synthesis
+    compressor = context_compressor(settings.context_token_budget)
+    compression = [compressor] if compressor is not None else []
     
-    guidelines_query_engine = RetrieverQueryEngine(retriever=guidelines_retriever)
-    web_query_engine = RetrieverQueryEngine(retriever=web_retriever)
+    # Retrieval only sees the user's question; the instruction template is applied by the synthesizer.
+    # The first engine is the collection's default retrieval mode
+    default_mode = settings.retrieval_mode or DEFAULT_RETRIEVAL_MODE
+    guidelines_query_engines = {
+        mode: RetrieverQueryEngine(retriever=guidelines_retrievers[mode], response_synthesizer=ReportSynthesizer(report_prompt), node_postprocessors=[section_expansion, *compression])
+        for mode in sorted(RETRIEVAL_MODES, key=lambda mode: mode != default_mode)
+    }
+    web_query_engine = RetrieverQueryEngine(retriever=web_retriever, response_synthesizer=ReportSynthesizer(report_prompt), node_postprocessors=compression)
     
-    return guidelines_query_engine, web_query_engine
+    return guidelines_query_engines, web_query_engine
 
-# Default URL used for web document index
-DEFAULT_URL = "https://docs.o-ran-sc.org/projects/o-ran-sc-nonrtric/en/latest/overview.html#nonrtric-components"
+# Minimum cosine similarity between a query and a source centroid for that index part to be queried
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.25"))
+
+# Per-source centroids of the chunk embeddings, used to route queries to the relevant indexes
+def create_router(guidelines_index, web_index, collection=DEFAULT_COLLECTION):
+    settings = COLLECTIONS[collection]
+    return QueryRouter.from_indexes(
+        {"guidelines": guidelines_index, "web": web_index},
+        default_sources={"web": settings.web_url},
+        threshold=settings.router_threshold if settings.router_threshold is not None else ROUTER_THRESHOLD,
+    )
+
+# Vector store types accepted by the API
+VECTOR_STORE_TYPES = ["chroma", "llamaindex"]
+
+# Vector store types whose indexes are built once when the server starts
+PRELOAD_VECTOR_STORES = [t.strip() for t in os.getenv("PRELOAD_VECTOR_STORES", "chroma,llamaindex").split(",") if t.strip()]
+
+# Content fingerprint of the sources behind the loaded indexes, so cached answers are tied to what
+# was indexed, web pages included
+def index_fingerprint(vector_store_type, collection=DEFAULT_COLLECTION, guidelines_index=None, web_index=None):
+    settings = COLLECTIONS[collection]
+    digest = hashlib.sha256(f"{vector_store_type}\x00{settings.web_url}".encode("utf-8"))
+    stores = [getattr(index, "vector_store", None) for index in (guidelines_index, web_index)]
+    if vector_store_type == "chroma":
+        # The web manifest changes whenever the fetched page content changes
+        web_manifest = IngestionManifest.load(settings.index_name("web"))
+        digest.update(pdf_fingerprint(settings.data_dir).encode("utf-8"))
+        digest.update(json.dumps(web_manifest.sources, sort_keys=True).encode("utf-8"))
+    elif all(isinstance(store, PackedVectorStore) and store.fingerprint for store in stores):
+        # Packed stores were built for a digest of their sources, chunking and model
+        digest.update("\x00".join(store.fingerprint for store in stores).encode("utf-8"))
+    else:
+        # In-memory indexes: the PDFs, and the crawled pages as they were split into nodes
+        digest.update(pdf_fingerprint(settings.data_dir).encode("utf-8"))
+        if web_index is not None:
+            digest.update(documents_digest(web_index.docstore.docs.values()).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+# Rough resident size of one index: its vectors and node texts, plus the keyword index
+def index_size_bytes(index):
+    store = index.vector_store
+    if isinstance(store, PackedVectorStore):
+        # Mapped matrix and records, plus the mapped keyword postings when the store was loaded
+        keyword_index = store.keyword_index
+        return store.nbytes + (keyword_index.nbytes if keyword_index is not None else 0)
+    collection = getattr(store, "client", None)
+    if collection is not None and hasattr(collection, "name"):
+        # Chroma loads the float32 vectors of a queried collection (at most CHROMA_MEMORY_LIMIT_MB
+        # when that is set); the keyword index, with the texts, is about the size of its pickle
+        vector_bytes = 0
+        count = collection.count()
+        if count:
+            sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+            vector_bytes = count * len(sample[0]) * 4 if sample is not None and len(sample) else 0
+        if chroma_memory_limit_bytes():
+            vector_bytes = min(vector_bytes, chroma_memory_limit_bytes())
+        path = keyword_index_path(collection.name)
+        keyword_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        text_bytes = sum(len(node.get_content()) for node in index.docstore.docs.values())
+        return vector_bytes + keyword_bytes + text_bytes
+    embeddings = getattr(getattr(store, "data", None), "embedding_dict", None) or {}
+    # Python float lists take about 32 bytes per value; texts are kept in the docstore and the keyword index
+    text_bytes = sum(len(node.get_content()) for node in index.docstore.docs.values())
+    return 32 * sum(len(vector) for vector in embeddings.values()) + 2 * text_bytes
 
-# Prompt used to generate factual Markdown responses from retrieved data
+def entry_size_bytes(entry):
+    return sum(index_size_bytes(index) for index in (entry.guidelines_index, entry.web_index))
+
+# Process-level registry so every request reuses the same indexes and query engines. Collections
+# are loaded on first use and the least recently used ones are dropped above COLLECTION_MEMORY_MB
+index_registry = IndexRegistry(
+    load_indexes,
+    create_query_engines,
+    fingerprint=index_fingerprint,
+    create_router=create_router,
+    entry_size=entry_size_bytes,
+    memory_limit_bytes=COLLECTION_MEMORY_MB * 2**20,
+    max_entries=MAX_LOADED_COLLECTIONS,
+)
+
+# Runs in the maintenance worker process: parse, crawl and embed what changed for one collection
+# and store type. Chroma changes come back as ingestion plans that the server's rebuild writes to
+# a new collection version; packed indexes are written to disk here and only mapped by the server
+def prepare_collection(vector_store_type, collection=DEFAULT_COLLECTION):
+    settings = COLLECTIONS[collection]
+    config.configure_settings()
+    if vector_store_type == "chroma":
+        web_documents = WebCrawler.from_env().crawl_documents([settings.web_url])
+        return {
+            settings.index_name("guidelines"): plan_sync(settings.index_name("guidelines"), pdf_sources(settings.data_dir), SpecChunker()),
+            settings.index_name("web"): plan_sync(settings.index_name("web"), web_sources(web_documents)),
+        }
+    if PACKED_VECTOR_STORE:
+        guidelines_index, web_index = load_indexes(vector_store_type, collection)
+        return {
+            settings.index_name("guidelines"): guidelines_index.vector_store.fingerprint,
+            settings.index_name("web"): web_index.vector_store.fingerprint,
+        }
+    # In-memory LlamaIndex indexes cannot be shared across processes; the rebuild embeds them
+    return {}
+
+# Runs after a refresh, once requests that started on the replaced Chroma versions have finished
+def retire_collection(vector_store_type, collection=DEFAULT_COLLECTION):
+    if vector_store_type == "chroma":
+        settings = COLLECTIONS[collection]
+        for part in ("guidelines", "web"):
+            drop_old_versions(settings.index_name(part))
+
+# Watches the data directories and refreshes web sources, swapping in new index versions
+INDEX_MAINTENANCE = os.getenv("INDEX_MAINTENANCE", "1") == "1"
+index_maintainer = IndexMaintainer(
+    index_registry,
+    COLLECTIONS,
+    prepare_collection,
+    poll_interval=float(os.getenv("MAINTENANCE_POLL_INTERVAL", "10")),
+    web_refresh_interval=float(os.getenv("WEB_REFRESH_INTERVAL", "86400")),
+    retire=retire_collection,
+    retire_delay=float(os.getenv("MAINTENANCE_RETIRE_DELAY", "300")),
+)
+
+# Exact + semantic answer cache in front of the query engines
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+    persist_path=os.getenv("ANSWER_CACHE_PATH"),
+)
+
+# Coalesces identical in-flight /generate requests
+inflight_requests = SingleFlight()
+
+# Drop answers computed against an index version that has just been replaced
+index_registry.add_listener(
+    lambda entry: answer_cache.invalidate(keep=lambda scope: scope[:2] != entry.key or scope[2] == entry.fingerprint)
+)
+
+# Bounded pool of PDF rendering worker processes; each report gets its own id and file
+report_queue = ReportQueue(max_workers=int(os.getenv("RENDER_WORKERS", "2")), max_pending=int(os.getenv("RENDER_QUEUE_SIZE", "32")))
+
+# Base URL used in links returned to clients
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000")
+
+# Prompt used to generate factual Markdown responses from retrieved data.
+# Only {query_str} is used for retrieval; {context_str} holds the retrieved chunks at synthesis time.
 report_prompt = PromptTemplate(
     """
     You are an expert assistant with access to guidelines documents (PDFs in the data directory) and web data. Based on the user input, retrieve and provide a clear, concise, and accurate description or explanation of the requested topic from the available data. The output should be in Markdown format and include:
@@ -79,14 +339,19 @@ report_prompt = PromptTemplate(
 
     Ensure the response is well-structured, professional, and suitable for conversion to a PDF. Avoid generating a content optimization report or recommendations unless explicitly requested. Focus on answering the query directly.
 
-    User Input: {user_input}
+    Retrieved context (numbered excerpts from the guidelines documents or web data):
+    ---------------------
+    {context_str}
+    ---------------------
+
+    User Input: {query_str}
     """
 )
 
 # Initialize FastAPI app
 app = FastAPI()
 
-# Serve static files (for downloading report.pdf)
+# Serve static files (for downloading report.pdf written by the CLI)
 app.mount("/static", StaticFiles(directory="."), name="static")
 
 # Enable CORS for frontend compatibility
@@ -98,15 +363,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Build the models and open the indexes once per process instead of on import or per request
+@app.on_event("startup")
+def preload_indexes():
+    config.warmup()
+    # Only the default collection is preloaded; the others load on their first request
+    index_registry.preload([t for t in PRELOAD_VECTOR_STORES if t in VECTOR_STORE_TYPES])
+
+@app.on_event("startup")
+async def start_index_maintenance():
+    if INDEX_MAINTENANCE:
+        index_maintainer.start()
+
+@app.on_event("shutdown")
+async def stop_index_maintenance():
+    await index_maintainer.stop()
+
 # Serve the frontend HTML page
 @app.get("/")
 async def serve_index():
     return FileResponse("index.html")
 
+# Report formats a request can ask for. Only 'pdf' renders before responding; with the others the
+# report is returned right away and pdf_url renders the PDF when it is first downloaded
+OUTPUT_FORMATS = ["markdown", "html", "pdf"]
+DEFAULT_OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "pdf")
+
 # Define the input schema
 class PromptRequest(BaseModel):
     prompt: str
     vectorStoreType: str # User can choose between 'chroma' or 'llamaindex'
+    rewriteQuery: bool = False # Let the LLM condense the prompt into a search query before retrieval
+    trace: bool = False # Include per-stage timings and token counts in the response
+    retrievalMode: Optional[str] = None # 'hybrid' (vector + BM25 keyword search) or 'vector'; defaults to the collection's mode
+    outputFormat: str = DEFAULT_OUTPUT_FORMAT # 'markdown', 'html' or 'pdf'; the PDF is otherwise rendered on first download
+    collection: str = DEFAULT_COLLECTION # Named collection to answer from (see GET /collections)
+
+# Check the collection and fill in its default retrieval mode; returns an error message or None
+def resolve_collection(request):
+    settings = COLLECTIONS.get(request.collection)
+    if settings is None:
+        return f"Unknown collection '{request.collection}'. Use one of: {', '.join(sorted(COLLECTIONS))}."
+    if request.retrievalMode is None:
+        request.retrievalMode = settings.retrieval_mode or DEFAULT_RETRIEVAL_MODE
+    return None
+
+# Why a request (or batch item) cannot be served, or None; fills in the collection's defaults
+def request_error(request):
+    if not request.prompt:
+        return "Prompt cannot be empty"
+    if request.vectorStoreType not in VECTOR_STORE_TYPES:
+        return "Invalid vector store type. Use 'chroma' or 'llamaindex'."
+    collection_error = resolve_collection(request)
+    if collection_error:
+        return collection_error
+    if request.retrievalMode not in RETRIEVAL_MODES:
+        return "Invalid retrieval mode. Use 'hybrid' or 'vector'."
+    if request.outputFormat not in OUTPUT_FORMATS:
+        return "Invalid output format. Use 'markdown', 'html' or 'pdf'."
+    return None
 
 # Format the Markdown response with sources
 def format_response(response, sources):
@@ -121,75 +436,139 @@ def format_response(response, sources):
         markdown_content += "- No specific sources identified.\n"
     return markdown_content
 
+# Embed the prompt once: the vector is reused by the semantic cache and by the retrievers.
+# Batches pass in an embedding computed together with the other prompts.
+async def prepare_query(request, prompt_embedding=None):
+    query_bundle = await abuild_query_bundle(request.prompt, rewrite=request.rewriteQuery)
+    if prompt_embedding is None:
+        with stage_timer("embed_query"):
+            prompt_embedding = await Settings.embed_model.aget_query_embedding(request.prompt)
+    if not request.rewriteQuery:
+        query_bundle.embedding = prompt_embedding
+    return query_bundle, prompt_embedding
+
+# Cache scope: answers are only reused for the same index contents and retrieval settings
+def cache_scope(entry, part, request):
+    return (entry.collection, entry.vector_store_type, entry.fingerprint, part, request.rewriteQuery, request.retrievalMode if part == "guidelines" else None)
+
+# Answer one index part, going through the answer cache first
+async def query_part(part, query_engine, query_bundle, prompt_embedding, entry, request):
+    scope = cache_scope(entry, part, request)
+    cached, tier = answer_cache.lookup(request.prompt, scope, prompt_embedding)
+    METRICS.increment("answer_cache_lookups", {"result": tier or "miss"})
+    if cached is not None:
+        logger.info(f"Answer cache {tier} hit for {part}")
+        return cached
+
+    response = await query_engine.aquery(query_bundle)
+    answer = {"response": response.response or "", "sources": node_sources(response.source_nodes)}
+    if answer["response"]:
+        answer_cache.store(request.prompt, scope, answer, prompt_embedding)
+    return answer
+
+# Pick the index parts worth querying from the prompt embedding; every part when no router is built
+def route_query(entry, prompt_embedding):
+    if entry.router is None:
+        return ["guidelines", "web"], {}
+    with stage_timer("route"):
+        parts, scores = entry.router.route(prompt_embedding)
+    logger.info(f"Routing query to: {', '.join(parts)}")
+    return parts, scores
+
+# Source labels for the report, e.g. "PDF: spec.pdf (pages 3, 4)" or "Web: https://..."
+def source_labels(sources):
+    labels = []
+    for source in sources:
+        kind = "PDF" if source["source"].endswith(".pdf") else "Web"
+        pages = f" (pages {', '.join(source['pages'])})" if source.get("pages") else ""
+        labels.append(f"{kind}: {source['source']}{pages}")
+    return labels
+
+# Combine per-part source lists, keeping the first occurrence of each source
+def merge_sources(source_lists):
+    merged = {}
+    for sources in source_lists:
+        for source in sources:
+            merged.setdefault(source["source"], source)
+    return list(merged.values())
+
+# Run retrieval, synthesis and rendering for one request
+async def run_generation(request, prompt_embedding=None):
+    user_input = request.prompt
+    vector_store_type = request.vectorStoreType
+    trace = start_trace()
+
+    # Reuse the process-level indexes for this collection and vector store type (built off-loop on first use)
+    entry = await asyncio.to_thread(index_registry.get, vector_store_type, request.collection)
+    engines = {"guidelines": entry.guidelines_engine(request.retrievalMode), "web": entry.web_query_engine}
+
+    # Send the question only to the indexes whose sources are close to it, concurrently
+    query_bundle, prompt_embedding = await prepare_query(request, prompt_embedding)
+    parts, routing_scores = route_query(entry, prompt_embedding)
+    answers = await asyncio.gather(*[query_part(part, engines[part], query_bundle, prompt_embedding, entry, request) for part in parts])
+
+    # Attribute the report to the sources that were actually retrieved
+    response_parts = [answer["response"] for answer in answers if answer["response"]]
+    used_sources = merge_sources(answer["sources"] for answer in answers if answer["response"])
+    sources = source_labels(used_sources)
+
+    # Combine responses
+    combined_response = "\n\n".join(response_parts) if response_parts else "No relevant information found in the provided data."
+    markdown_content = format_response(combined_response, sources)
+    logger.info(f"Query engine response: {combined_response[:100]}...")
+
+    full_markdown_content = (
+        f"# Response to '{user_input}'\n\n"
+        f"{markdown_content}"
+    )
+    if request.outputFormat == "pdf":
+        # Render in the worker pool; the endpoint waits without blocking the event loop
+        job = await render_report(full_markdown_content)
+        if job.status != "done":
+            logger.error(f"[!] Report {job.id} failed: {job.error}")
+            raise HTTPException(status_code=500, detail="Failed to generate PDF report. Check the PDF renderers (WeasyPrint, wkhtmltopdf or pandoc with pdflatex).")
+    else:
+        # Respond now; the PDF is rendered only if pdf_url is requested
+        job = report_queue.register(full_markdown_content)
+
+    pdf_url = report_download_url(job)
+    logger.info(f"Returning PDF URL: {pdf_url}")
+    return {
+        "report": combined_response,
+        "summary": combined_response[:150] + "..." if len(combined_response) > 150 else combined_response,
+        "report_id": job.id,
+        "pdf_url": pdf_url,
+        "sources": used_sources,
+        "routing": {"parts": parts, "scores": routing_scores},
+        "usage": trace_usage(trace),
+        **(await report_body(full_markdown_content, request.outputFormat)),
+        **({"trace": trace} if request.trace else {})
+    }
+
+# The full report in the requested format, for formats returned inline
+async def report_body(markdown_content, output_format):
+    if output_format == "markdown":
+        return {"markdown": markdown_content}
+    if output_format == "html":
+        with stage_timer("render", format="html"):
+            return {"html": await asyncio.to_thread(render_html, markdown_content)}
+    return {}
+
 # Main endpoint for generating the report
 @app.post("/generate")
 async def generate_report_endpoint(request: PromptRequest):
     user_input = request.prompt
     vector_store_type = request.vectorStoreType
-    if not user_input:
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
-    if vector_store_type not in ["chroma", "llamaindex"]:
-        raise HTTPException(status_code=400, detail="Invalid vector store type. Use 'chroma' or 'llamaindex'.")
+    error = request_error(request)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
     try:
-        # Load indexes based on vector store type
-        guidelines_index, web_index = load_indexes(vector_store_type)
-        guidelines_query_engine, web_query_engine = create_query_engines(guidelines_index, web_index)
-
-        # Query both engines to retrieve relevant information
-        sources = []
-        response_parts = []
-
-        # Query guidelines index
-        user_input_formatted = report_prompt.format(user_input=user_input)
-        guidelines_response = guidelines_query_engine.query(user_input_formatted).response
-        if guidelines_response:
-            response_parts.append(guidelines_response)
-            pdf_files = [f for f in os.listdir("data") if f.endswith('.pdf')]
-            sources.extend([f"PDF: {f}" for f in pdf_files])
-
-        # Query web index if relevant
-        if "web page" in user_input.lower() or "nonrtric" in user_input.lower():
-            logger.info(f"Using default URL: {DEFAULT_URL}")
-            web_response = web_query_engine.query(user_input_formatted).response
-            if web_response:
-                response_parts.append(web_response)
-                sources.append(f"Web: {DEFAULT_URL}")
-
-        # Combine responses
-        combined_response = "\n\n".join(response_parts) if response_parts else "No relevant information found in the provided data."
-        markdown_content = format_response(combined_response, sources)
-        logger.info(f"Query engine response: {combined_response[:100]}...")
-
-        # Generate PDF
-        full_markdown_content = (
-            f"# Response to '{user_input}'\n\n"
-            f"{markdown_content}"
-        )
-        report_result = generate_report(full_markdown_content, output_file="report.pdf")
-        logger.info(f"Report generation result: {report_result}")
-
-        # Add a delay to ensure the PDF is fully written
-        time.sleep(1)  # Wait for 1 second to ensure file system sync
-
-        # Check if PDF exists and is accessible
-        pdf_path = os.path.abspath("report.pdf")
-        if not os.path.exists(pdf_path):
-            logger.error(f"[!] PDF file not found at {pdf_path}")
-            raise HTTPException(status_code=500, detail="Failed to generate PDF report. Check pandoc and pdflatex installation.")
-
-        # Verify the PDF file is not empty and accessible
-        if os.path.getsize(pdf_path) == 0:
-            logger.error(f"[!] PDF file at {pdf_path} is empty")
-            raise HTTPException(status_code=500, detail="Generated PDF is empty. Check report generation process.")
-
-        logger.info(f"Returning PDF URL: http://localhost:8000/static/report.pdf")
-        return {
-            "report": combined_response,
-            "summary": combined_response[:150] + "..." if len(combined_response) > 150 else combined_response,
-            "pdf_url": "http://localhost:8000/static/report.pdf"
-        }
-
+        # Identical concurrent requests share one retrieval, LLM and render pass
+        key = (normalize_prompt(user_input), request.collection, vector_store_type, request.rewriteQuery, request.retrievalMode, request.outputFormat, request.trace)
+        return await inflight_requests.do(key, lambda: run_generation(request))
+    except HTTPException:
+        raise
     except JSONDecodeError as e:
         logger.error(f"⚠️ JSON decode error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=400, detail=f"Invalid JSON data: {str(e)}")
@@ -197,6 +576,290 @@ async def generate_report_endpoint(request: PromptRequest):
         logger.error(f"⚠️ Error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}. Check logs for details.")
 
+# Queue a PDF render and wait for it without blocking the event loop
+async def render_report(markdown_content):
+    try:
+        job = report_queue.submit(markdown_content)
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    with stage_timer("render"):
+        return await report_queue.wait(job)
+
+def report_download_url(job, output_format="pdf"):
+    suffix = "" if output_format == "pdf" else f"&format={output_format}"
+    return f"{PUBLIC_BASE_URL}/reports/{job.id}?download=true{suffix}"
+
+# Render a deferred report's PDF (or join its running render) and wait for it
+async def ensure_report_pdf(job):
+    try:
+        report_queue.start(job)
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    with stage_timer("render"):
+        await report_queue.wait(job)
+    if job.status != "done":
+        raise HTTPException(status_code=500, detail=f"Failed to generate PDF report: {job.error}")
+    return job
+
+# Status of a report, or the report itself with ?download=true. The PDF of a report generated as
+# Markdown/HTML is rendered on this first download; ?format=html or markdown is served immediately
+@app.get("/reports/{report_id}")
+async def get_report(report_id: str, download: bool = False, format: str = "pdf"):
+    job = report_queue.get(report_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use 'markdown', 'html' or 'pdf'.")
+    if not download:
+        return {**job.to_dict(), "pdf_url": report_download_url(job) if job.status in ("done", "deferred") else None}
+    if format == "markdown":
+        return FileResponse(report_queue.artifact_path(job.content_hash, "md"), media_type="text/markdown", filename=f"report-{job.id}.md")
+    if format == "html":
+        return FileResponse(await asyncio.to_thread(report_queue.html_path, job), media_type="text/html")
+    if job.status == "failed":
+        raise HTTPException(status_code=409, detail=f"Report is not ready (status: {job.status})")
+    await ensure_report_pdf(job)
+    return FileResponse(job.path, media_type="application/pdf", filename=f"report-{job.id}.pdf")
+
+@app.on_event("shutdown")
+def stop_render_workers():
+    report_queue.shutdown()
+
+# Encode one Server-Sent Event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming variant of /generate: sources first, then answer tokens, then the PDF URL
+@app.post("/generate/stream")
+async def generate_report_stream_endpoint(request: PromptRequest):
+    user_input = request.prompt
+    vector_store_type = request.vectorStoreType
+    error = request_error(request)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    async def event_stream():
+        trace = start_trace()
+        try:
+            entry = await asyncio.to_thread(index_registry.get, vector_store_type, request.collection)
+            query_bundle, prompt_embedding = await prepare_query(request)
+
+            # Serve cached parts as-is and retrieve the rest concurrently, before any LLM call
+            part_engines = {"guidelines": entry.guidelines_engine(request.retrievalMode), "web": entry.web_query_engine}
+            parts, routing_scores = route_query(entry, prompt_embedding)
+            engines = [(part, part_engines[part]) for part in parts]
+            cached = [answer_cache.lookup(user_input, cache_scope(entry, part, request), prompt_embedding)[0] for part, _ in engines]
+
+            async def retrieve(engine, cached_answer):
+                return [] if cached_answer is not None else await engine.aretrieve(query_bundle)
+
+            retrieved = await asyncio.gather(*[retrieve(engine, answer) for (_, engine), answer in zip(engines, cached)])
+            part_sources = [answer["sources"] if answer is not None else node_sources(nodes) for answer, nodes in zip(cached, retrieved)]
+            all_sources = merge_sources(part_sources)
+            yield sse_event("sources", {"sources": all_sources, "routing": {"parts": parts, "scores": routing_scores}})
+
+            # Stream each part's answer as the LLM produces it
+            synthesizer = ReportSynthesizer(report_prompt, streaming=True)
+            response_parts, used_sources = [], []
+            for (part, _), nodes, cached_answer, sources in zip(engines, retrieved, cached, part_sources):
+                if cached_answer is not None:
+                    text = cached_answer["response"]
+                    yield sse_event("token", {"part": part, "text": text, "cached": True})
+                elif nodes:
+                    tokens = []
+                    async for token in await synthesizer.astream_response(user_input, nodes):
+                        tokens.append(token)
+                        yield sse_event("token", {"part": part, "text": token})
+                    text = "".join(tokens)
+                    if text:
+                        answer_cache.store(user_input, cache_scope(entry, part, request), {"response": text, "sources": sources}, prompt_embedding)
+                else:
+                    continue
+                response_parts.append(text)
+                if text:
+                    used_sources.append(sources)
+                yield sse_event("part_end", {"part": part})
+
+            combined_response = "\n\n".join(response_parts) if response_parts else "No relevant information found in the provided data."
+            sources = source_labels(merge_sources(used_sources))
+            full_markdown_content = f"# Response to '{user_input}'\n\n{format_response(combined_response, sources)}"
+
+            if request.outputFormat != "pdf":
+                # No render wait: the PDF is rendered if and when pdf_url is downloaded
+                job = report_queue.register(full_markdown_content)
+                body = await report_body(full_markdown_content, request.outputFormat)
+                yield sse_event("done", {"report": combined_response, "report_id": job.id, "pdf_url": report_download_url(job), "usage": trace_usage(trace), **body})
+                return
+
+            # Tell the client rendering has started, then send the URL once the PDF exists
+            job = report_queue.submit(full_markdown_content)
+            yield sse_event("rendering", {"report_id": job.id})
+            with stage_timer("render"):
+                await report_queue.wait(job)
+            if job.status != "done":
+                yield sse_event("error", {"detail": f"Failed to generate PDF report: {job.error}"})
+                return
+            yield sse_event("done", {"report": combined_response, "report_id": job.id, "pdf_url": report_download_url(job), "usage": trace_usage(trace)})
+        except Exception as e:
+            logger.error(f"⚠️ Streaming error: {str(e)}", exc_info=True)
+            yield sse_event("error", {"detail": f"Error processing request: {str(e)}. Check logs for details."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Where batch progress logs are kept, and how many batch items run at once
+BATCH_DIR = os.getenv("BATCH_DIR", "batches")
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+class BatchRequest(BaseModel):
+    items: List[PromptRequest]
+    batchId: Optional[str] = None # Re-send the same id to resume an interrupted batch
+    concurrency: Optional[int] = None
+
+def batch_log_path(batch_id):
+    if not re.fullmatch(r"[A-Za-z0-9_.-]{1,64}", batch_id) or batch_id.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid batch id.")
+    return os.path.join(BATCH_DIR, f"{batch_id}.jsonl")
+
+# Query-side embeddings of several prompts, identical to what /generate computes for one.
+# HuggingFaceEmbedding embeds a query as `_embed([query], prompt_name="query")`, so the whole
+# list goes through one encoder call; other models are asked one prompt at a time
+def query_embeddings(prompts):
+    model = Settings.embed_model
+    if model.class_name() == "HuggingFaceEmbedding":
+        return model._embed(list(prompts), prompt_name="query")
+    return [model.get_query_embedding(prompt) for prompt in prompts]
+
+# Embed a chunk of batch prompts so the answer cache and the router see the same vectors as
+# /generate; in a thread, so the event loop keeps serving /generate meanwhile
+async def embed_queries(prompts):
+    with stage_timer("embed_query", batch_size=len(prompts)):
+        return await asyncio.to_thread(query_embeddings, prompts)
+
+# Run one batch item through the same pipeline as /generate
+async def generate_batch_item(item, prompt_embedding):
+    # Batch LLM calls queue behind interactive ones when Groq is at its rate limit
+    request = PromptRequest(**item)
+    error = request_error(request)
+    if error:
+        raise ValueError(error)
+    with llm_priority(BATCH_PRIORITY):
+        result = await run_generation(request, prompt_embedding)
+    return {key: result[key] for key in ("report_id", "pdf_url", "summary", "sources")}
+
+# Bulk /generate: results are streamed as NDJSON lines in completion order and logged per batch id,
+# so re-posting an interrupted batch only runs the items that did not finish
+@app.post("/generate/batch")
+async def generate_batch_endpoint(request: BatchRequest):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    for position, item in enumerate(request.items):
+        error = request_error(item)
+        if error:
+            raise HTTPException(status_code=400, detail=f"Invalid batch item {position}: {error}")
+
+    items = [item.model_dump() for item in request.items]
+    batch_id = request.batchId or hashlib.sha256("\n".join(batch_item_id(item) for item in items).encode("utf-8")).hexdigest()[:16]
+    log = BatchLog(batch_log_path(batch_id))
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+
+    async def result_stream():
+        yield json.dumps({"batch_id": batch_id, "total": len(items), "completed": len(log.completed)}) + "\n"
+        async for record in run_batch(items, generate_batch_item, embed_queries, log, concurrency=concurrency):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+# Finished items of a batch
+@app.get("/batches/{batch_id}")
+async def batch_status(batch_id: str):
+    path = batch_log_path(batch_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    log = BatchLog(path)
+    return {"batch_id": batch_id, "completed": len(log.completed), "results": list(log.completed.values())}
+
+# Report which indexes are loaded, their versions and any rebuild in progress
+@app.get("/admin/indexes")
+async def index_status():
+    return {
+        "entries": index_registry.status(),
+        "loaded_bytes": index_registry.loaded_bytes(),
+        "memory_limit_bytes": index_registry.memory_limit_bytes,
+    }
+
+# Collections a request can select, with their settings and which store types are in memory
+@app.get("/collections")
+async def list_collections():
+    loaded = index_registry.loaded()
+    return {
+        name: {**settings.to_dict(), "loaded": [vst for collection, vst in loaded if collection == name]}
+        for name, settings in sorted(COLLECTIONS.items())
+    }
+
+# Prometheus-style metrics: per-stage latency histograms, token counters and queue gauges
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    cache_stats = answer_cache.stats()
+    gauges = {
+        "answer_cache_entries": cache_stats["entries"],
+        "inflight_requests": inflight_requests.in_flight(),
+        "render_queue_pending": report_queue.pending(),
+    }
+    llm_status = config.llm_status()
+    if llm_status:
+        gauges["llm_queue_depth"] = llm_status["queue_depth"]
+        gauges["llm_active_requests"] = llm_status["active"]
+    return METRICS.render(gauges=gauges)
+
+# LLM scheduler: queue depth, rate-limit usage, retries and failovers to Ollama
+@app.get("/admin/llm")
+async def llm_status():
+    return config.llm_status() or {"scheduler": "disabled"}
+
+# Answer cache hit/miss counters and request coalescing counters
+@app.get("/admin/cache")
+async def cache_status():
+    return {**answer_cache.stats(), "inflight": inflight_requests.in_flight(), "coalescing": inflight_requests.counters}
+
+# Drop every cached answer
+@app.delete("/admin/cache")
+async def clear_cache():
+    return {"invalidated": answer_cache.invalidate()}
+
+# Background index maintenance: poll settings and the last refresh of each loaded index
+@app.get("/admin/maintenance")
+async def maintenance_status():
+    return {**index_maintainer.status(), "enabled": INDEX_MAINTENANCE}
+
+# Report how long each startup step took
+@app.get("/admin/warmup")
+async def warmup_status():
+    return config.warmup_timings
+
+# Rebuild an index in the background and swap it in atomically once it is ready
+# Rebuild and swap in an index; the collection versions it replaced are dropped after the retire delay
+async def rebuild_and_retire(vector_store_type, collection):
+    entry = await asyncio.to_thread(index_registry.rebuild, vector_store_type, False, collection)
+    if entry is not None:
+        index_maintainer.retire_later(vector_store_type, collection)
+
+@app.post("/admin/rebuild/{vector_store_type}", status_code=202)
+async def rebuild_index(vector_store_type: str, background_tasks: BackgroundTasks, collection: str = DEFAULT_COLLECTION):
+    if vector_store_type not in VECTOR_STORE_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid vector store type. Use 'chroma' or 'llamaindex'.")
+    if collection not in COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown collection '{collection}'.")
+    if not index_registry.mark_rebuilding(vector_store_type, collection):
+        raise HTTPException(status_code=409, detail=f"A rebuild of '{collection}/{vector_store_type}' is already in progress.")
+
+    background_tasks.add_task(rebuild_and_retire, vector_store_type, collection)
+    logger.info(f"Scheduled background rebuild of '{collection}/{vector_store_type}' indexes")
+    return {"status": "rebuilding", "vectorStoreType": vector_store_type, "collection": collection}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,163 @@
+import re
+import json
+import asyncio
+import logging
+from llama_index.core import Settings
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.tools import QueryEngineTool
+from llama_index.core.utils import get_tokenizer
+from tools.answer_cache import normalize_prompt
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Each step the LLM either asks for a batch of independent tool calls or writes the answer
+AGENT_PROMPT = PromptTemplate(
+    """
+    You answer the task below using these tools:
+    {tool_descriptions}
+
+    To call tools, reply with a line "ACTIONS:" followed by a JSON list of calls, for example:
+    ACTIONS: [{{"tool": "guidelines_engine", "input": "E2SM-KPM measurement reporting"}}, {{"tool": "web_reader_engine", "input": "Non-RT RIC components"}}]
+    Request every lookup you need at once; all calls in a list run in parallel. Do not repeat a lookup whose result is already below.
+    When the results below are enough, reply with "ANSWER:" followed by the final answer.
+    {step_note}
+
+    Task:
+    {task}
+
+    Tool results so far:
+    {observations}
+    """
+)
+
+FINAL_NOTE = "No tool calls are left in the budget: reply with ANSWER: and the final answer now."
+
+ACTIONS_PATTERN = re.compile(r"ACTIONS:\s*(\[.*\])", re.DOTALL)
+ANSWER_PATTERN = re.compile(r"ANSWER:\s*(.*)", re.DOTALL)
+
+
+class ParallelToolAgent:
+    """
+    Plan-and-execute agent loop: each LLM round-trip may request several tool calls, which run
+    concurrently. QueryEngineTool results are memoized per (tool, normalized query) for the whole
+    session, and every task is bounded by `max_steps` LLM calls and `token_budget` prompt +
+    completion tokens (the last step is always a forced answer).
+    """
+
+    def __init__(self, tools, llm=None, max_steps=4, token_budget=24000, max_observation_chars=4000, verbose=False):
+        self.tools = {tool.metadata.name: tool for tool in tools}
+        self.llm = llm or Settings.llm
+        self.max_steps = max_steps
+        self.token_budget = token_budget
+        self.max_observation_chars = max_observation_chars
+        self.verbose = verbose
+        self._memo = {}
+        self._tokenizer = get_tokenizer()
+        self.last_run = {}
+
+    def _count_tokens(self, text):
+        return len(self._tokenizer(text))
+
+    def _tool_descriptions(self):
+        return "\n".join(f"- {name}: {tool.metadata.description}" for name, tool in self.tools.items())
+
+    def _format_observations(self, observations):
+        if not observations:
+            return "(none yet)"
+        return "\n\n".join(f"[{tool}] {query}\n{result}" for tool, query, result in observations)
+
+    async def _call_tool(self, name, query, stats):
+        tool = self.tools.get(name)
+        if tool is None:
+            return f"Unknown tool '{name}'. Available tools: {', '.join(self.tools)}"
+
+        # Only retrieval tools are memoized; other tools may have side effects
+        if not isinstance(tool, QueryEngineTool):
+            stats["tool_calls"] += 1
+            return str((await tool.acall(query)).content)
+        key = (name, normalize_prompt(query))
+        if key in self._memo:
+            stats["memo_hits"] += 1
+            return self._memo[key]
+        stats["tool_calls"] += 1
+        # Failures are not memoized, so a later step may retry the same lookup
+        self._memo[key] = str((await tool.acall(query)).content)
+        return self._memo[key]
+
+    async def _run_calls(self, calls, stats):
+        async def run(call):
+            name, query = str(call.get("tool", "")), str(call.get("input", ""))
+            try:
+                result = await self._call_tool(name, query, stats)
+            except Exception as e:
+                logger.error(f"[!] Tool {name} failed: {str(e)}")
+                result = f"Error: {str(e)}"
+            if self.verbose:
+                print(f"=== {name}({query}) -> {result[:200]}")
+            return name, query, result[:self.max_observation_chars]
+
+        return await asyncio.gather(*[run(call) for call in calls])
+
+    @staticmethod
+    def _parse(text):
+        # Returns (calls, answer); a reply without a usable ACTIONS list is taken as the answer
+        actions = ACTIONS_PATTERN.search(text)
+        if actions:
+            try:
+                calls = json.loads(actions.group(1))
+                if isinstance(calls, list) and calls:
+                    return calls, None
+            except ValueError:
+                logger.warning("[!] Could not parse the agent's tool calls, treating the reply as the answer")
+        answer = ANSWER_PATTERN.search(text)
+        return None, (answer.group(1) if answer else text).strip()
+
+    async def achat(self, task):
+        stats = {"llm_calls": 0, "tool_calls": 0, "memo_hits": 0, "tokens": 0}
+        observations = []
+        seen = set()
+        answer = None
+        for step in range(self.max_steps):
+            final = step == self.max_steps - 1 or stats["tokens"] >= self.token_budget
+            prompt = AGENT_PROMPT.format(
+                tool_descriptions=self._tool_descriptions(),
+                step_note=FINAL_NOTE if final else "",
+                task=task,
+                observations=self._format_observations(observations),
+            )
+            reply = (await self.llm.acomplete(prompt)).text
+            stats["llm_calls"] += 1
+            stats["tokens"] += self._count_tokens(prompt) + self._count_tokens(reply)
+
+            calls, answer = self._parse(reply)
+            if answer is not None or final:
+                break
+            # Skip duplicate lookups and those whose results are already in the observations
+            batch = {}
+            for call in calls:
+                if isinstance(call, dict):
+                    key = (str(call.get("tool", "")), normalize_prompt(str(call.get("input", ""))))
+                    if key not in seen:
+                        batch.setdefault(key, call)
+            if not batch:
+                continue
+            seen.update(batch)
+            calls = list(batch.values())
+            logger.info(f"Agent step {step + 1}: {len(calls)} tool call(s) in parallel")
+            observations.extend(await self._run_calls(calls, stats))
+
+        if answer is None:
+            # The budget ran out while the LLM still asked for tools: return what was gathered
+            answer = ACTIONS_PATTERN.sub("", reply).strip() or self._format_observations(observations)
+        self.last_run = stats
+        logger.info(f"Agent finished: {stats}")
+        return answer
+
+    def chat(self, task):
+        return asyncio.run(self.achat(task))
+
+    def reset(self):
+        # Forget memoized tool results, e.g. when the indexes change
+        self._memo.clear()
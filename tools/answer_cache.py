@@ -0,0 +1,166 @@
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt):
+    # Case, whitespace and trailing punctuation do not change the question being asked
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip("?.! ")
+
+
+class CacheEntry:
+    def __init__(self, scope, prompt, value, embedding, created_at):
+        self.scope = scope
+        self.prompt = prompt
+        self.value = value
+        self.embedding = embedding
+        self.created_at = created_at
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache. The exact tier matches the normalized prompt within a scope
+    (vector store type, index fingerprint, index part); the semantic tier reuses an answer
+    from the same scope whose prompt embedding has cosine similarity >= `similarity_threshold`.
+    Entries are evicted LRU beyond `max_entries` and expire after `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, similarity_threshold=0.95, persist_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        if persist_path:
+            self._open_db(persist_path)
+
+    @staticmethod
+    def _key(scope, normalized):
+        return json.dumps([*scope, normalized])
+
+    def _open_db(self, persist_path):
+        # Optional on-disk backing so answers survive restarts while the index is unchanged
+        self._db = sqlite3.connect(persist_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, scope TEXT, prompt TEXT, value TEXT, embedding BLOB, created_at REAL)"
+        )
+        self._db.commit()
+        rows = self._db.execute("SELECT key, scope, prompt, value, embedding, created_at FROM answers ORDER BY created_at").fetchall()
+        for key, scope, prompt, value, embedding, created_at in rows:
+            vector = np.frombuffer(embedding, dtype=np.float32) if embedding else None
+            self._entries[key] = CacheEntry(tuple(json.loads(scope)), prompt, json.loads(value), vector, created_at)
+        self._expire(time.time())
+        while len(self._entries) > self.max_entries:
+            self._evict_oldest()
+        logger.info(f"Loaded {len(self._entries)} cached answers from {persist_path}")
+
+    def _db_delete(self, keys):
+        if self._db is not None and keys:
+            self._db.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in keys])
+            self._db.commit()
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        self.counters["expirations"] += len(expired)
+        self._db_delete(expired)
+
+    def _evict_oldest(self):
+        key, _ = self._entries.popitem(last=False)
+        self.counters["evictions"] += 1
+        self._db_delete([key])
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, prompt, scope, embedding=None):
+        """
+        Return `(value, tier)` for a cached answer, or `(None, None)` on a miss.
+        """
+        normalized = normalize_prompt(prompt)
+        scope = tuple(scope)
+        with self._lock:
+            self._expire(time.time())
+
+            key = self._key(scope, normalized)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters["exact_hits"] += 1
+                return entry.value, "exact"
+
+            if embedding is not None and self.similarity_threshold is not None:
+                query = self._unit(embedding)
+                best_key, best_score = None, self.similarity_threshold
+                for candidate_key, candidate in self._entries.items():
+                    if candidate.scope != scope or candidate.embedding is None:
+                        continue
+                    score = float(np.dot(query, candidate.embedding))
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.counters["semantic_hits"] += 1
+                    logger.info(f"Semantic cache hit (cosine {best_score:.3f}) for: {prompt[:80]}")
+                    return self._entries[best_key].value, "semantic"
+
+            self.counters["misses"] += 1
+            return None, None
+
+    def store(self, prompt, scope, value, embedding=None):
+        normalized = normalize_prompt(prompt)
+        scope = tuple(scope)
+        vector = self._unit(embedding) if embedding is not None else None
+        now = time.time()
+        key = self._key(scope, normalized)
+        with self._lock:
+            self._entries[key] = CacheEntry(scope, normalized, value, vector, now)
+            self._entries.move_to_end(key)
+            self.counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, json.dumps(scope), normalized, json.dumps(value), vector.tobytes() if vector is not None else None, now),
+                )
+                self._db.commit()
+
+    def invalidate(self, keep=None):
+        """
+        Drop every entry whose scope does not satisfy `keep(scope)` (all entries when `keep` is None).
+        """
+        with self._lock:
+            dropped = [key for key, entry in self._entries.items() if keep is None or not keep(entry.scope)]
+            for key in dropped:
+                del self._entries[key]
+            self.counters["invalidations"] += len(dropped)
+            self._db_delete(dropped)
+        if dropped:
+            logger.info(f"Invalidated {len(dropped)} cached answers")
+        return len(dropped)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["exact_hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,118 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from tools.answer_cache import normalize_prompt
+from tools.collection_config import DEFAULT_COLLECTION
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Prompts embedded per encoder call
+EMBED_BATCH_SIZE = 64
+
+
+def batch_item_id(item):
+    # Stable id so a re-run recognises items that already finished
+    if item.get("id"):
+        return str(item["id"])
+    key = [normalize_prompt(item.get("prompt", "")), item.get("vectorStoreType"), item.get("rewriteQuery", False), item.get("retrievalMode"), item.get("outputFormat")]
+    if item.get("collection", DEFAULT_COLLECTION) != DEFAULT_COLLECTION:
+        # Only non-default collections change the id
+        key.append(item["collection"])
+    return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()[:16]
+
+
+def load_batch_items(path):
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON: {str(e)}")
+            # A bare string is shorthand for {"prompt": ...}
+            items.append({"prompt": item} if isinstance(item, str) else item)
+    return items
+
+
+class BatchLog:
+    """
+    Append-only JSONL file of finished batch items. Each record is flushed as soon as it is
+    written, so an interrupted batch can be resumed: items recorded as done are not run again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut off by the interruption; the item simply runs again
+                        continue
+                    if record.get("status") == "done":
+                        self.completed[record["id"]] = record
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def append(self, record):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if record.get("status") == "done":
+                self.completed[record["id"]] = record
+
+
+async def run_batch(items, process, embed_batch, log, concurrency=4):
+    """
+    Yield one result record per item as items finish. Items already done in `log` are yielded
+    first (marked `resumed`). The prompts of the remaining items are embedded with a few batched
+    `embed_batch(prompts)` calls, then `process(item, embedding)` runs at most `concurrency` at a time.
+    """
+    pending = []
+    for item in items:
+        item_id = batch_item_id(item)
+        if item_id in log.completed:
+            yield {**log.completed[item_id], "resumed": True}
+        else:
+            pending.append((item_id, item))
+    if not pending:
+        return
+
+    embeddings = []
+    prompts = [item.get("prompt", "") for _, item in pending]
+    for start in range(0, len(prompts), EMBED_BATCH_SIZE):
+        embeddings.extend(await embed_batch(prompts[start:start + EMBED_BATCH_SIZE]))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item_id, item, embedding):
+        async with semaphore:
+            try:
+                result = await process(item, embedding)
+                record = {"id": item_id, "prompt": item.get("prompt", ""), "status": "done", **result}
+            except Exception as e:
+                logger.error(f"[!] Batch item {item_id} failed: {str(e)}")
+                record = {"id": item_id, "prompt": item.get("prompt", ""), "status": "error", "error": str(getattr(e, "detail", e))}
+        log.append(record)
+        return record
+
+    tasks = [asyncio.ensure_future(run(item_id, item, embedding)) for (item_id, item), embedding in zip(pending, embeddings)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # A disconnected client or Ctrl+C stops the remaining items; finished ones stay in the log
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,67 @@
+import os
+import re
+import json
+import logging
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# The collection served when a request does not name one; it keeps the original index names
+DEFAULT_COLLECTION = "default"
+
+# Collection names end up in Chroma collection and file names
+COLLECTION_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+
+class CollectionConfig:
+    """
+    One named corpus: where its PDFs and web source live, the Chroma collections (and with them
+    the manifests and keyword indexes) it is stored in, and its retrieval settings.
+    """
+
+    def __init__(self, name, data_dir, web_url, retrieval_mode=None, similarity_top_k=5,
+                 router_threshold=None, context_token_budget=None, section_expand_max_chars=None):
+        if not COLLECTION_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid collection name '{name}': use lowercase letters, digits, '-' and '_'")
+        self.name = name
+        self.data_dir = data_dir
+        self.web_url = web_url
+        # None means the server-wide default for each setting
+        self.retrieval_mode = retrieval_mode
+        self.similarity_top_k = similarity_top_k
+        self.router_threshold = router_threshold
+        self.context_token_budget = context_token_budget
+        self.section_expand_max_chars = section_expand_max_chars
+
+    def index_name(self, part):
+        # The default collection keeps the "guidelines"/"web" names so existing stores are reused
+        return part if self.name == DEFAULT_COLLECTION else f"{self.name}__{part}"
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def load_collections(path, default_data_dir, default_web_url):
+    """
+    Read the collections file (a JSON object of name -> settings) and add the default collection
+    built from DATA_DIR and WEB_SOURCE_URL unless the file defines it. A missing file means only
+    the default collection exists.
+    """
+    entries = {}
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        if not isinstance(entries, dict):
+            raise ValueError(f"{path} must contain a JSON object of collection name -> settings")
+
+    collections = {}
+    for name, settings in entries.items():
+        settings = dict(settings)
+        if "data_dir" not in settings or "web_url" not in settings:
+            raise ValueError(f"Collection '{name}' in {path} needs 'data_dir' and 'web_url'")
+        collections[name] = CollectionConfig(name, **settings)
+    if DEFAULT_COLLECTION not in collections:
+        collections[DEFAULT_COLLECTION] = CollectionConfig(DEFAULT_COLLECTION, default_data_dir, default_web_url)
+    logger.info(f"Collections: {', '.join(sorted(collections))}")
+    return collections
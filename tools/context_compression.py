@@ -0,0 +1,307 @@
+import os
+import re
+import math
+import time
+import logging
+from typing import Any, List
+from pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, TextNode, MetadataMode
+from llama_index.core.utils import get_tokenizer
+from tools.keyword_index import tokenize
+from tools.metrics import METRICS, record
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Words that say nothing about which chunk or sentence answers a question
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it its me of on or please "
+    "show tell that the their this to was what when where which who why will with you your "
+    "explain describe give list about into between".split()
+)
+
+# Sentence boundaries in prose; Markdown table rows and list items are split on line breaks
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?;:])\s+(?=[A-Z0-9(\"'])")
+TABLE_SEPARATOR_PATTERN = re.compile(r"^\s*\|?\s*:?-{3,}")
+
+
+def _stem(token):
+    # Crude suffix stripping so "measures" matches "measure"; identifiers with digits are left alone
+    if any(ch.isdigit() for ch in token):
+        return token
+    for suffix in ("ing", "ed", "es", "s"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def terms(text):
+    return {_stem(token) for token in tokenize(text) if token not in STOPWORDS and len(token) > 1}
+
+
+def query_terms(query_bundle):
+    # Content terms of the question and of its rewritten search query, if any
+    texts = [query_bundle.query_str] + list(query_bundle.custom_embedding_strs or [])
+    return set().union(*(terms(text) for text in texts))
+
+
+def _with_text(node_with_score, text, score=None):
+    node = node_with_score.node
+    compressed = TextNode(
+        id_=node.node_id,
+        text=text,
+        metadata=dict(node.metadata),
+        excluded_embed_metadata_keys=node.excluded_embed_metadata_keys,
+        excluded_llm_metadata_keys=node.excluded_llm_metadata_keys,
+        relationships=node.relationships,
+    )
+    return NodeWithScore(node=compressed, score=node_with_score.score if score is None else score)
+
+
+def split_units(text):
+    """
+    Split a chunk into the units sentence extraction keeps or drops: prose sentences and single
+    Markdown table rows. Each unit is (text, table_id, is_header); header rows of a table are kept
+    whenever one of its rows is.
+    """
+    units = []
+    lines = text.split("\n")
+    table_id, table_start = None, 0
+    for number, line in enumerate(lines):
+        if line.lstrip().startswith("|"):
+            if table_id is None:
+                table_id, table_start = number, len(units)
+            if TABLE_SEPARATOR_PATTERN.match(line):
+                # The separator and every row above it in this table form the header
+                for position in range(table_start, len(units)):
+                    units[position] = (units[position][0], table_id, True)
+                units.append((line, table_id, True))
+            else:
+                units.append((line, table_id, False))
+            continue
+        table_id = None
+        for sentence in SENTENCE_PATTERN.split(line):
+            if sentence.strip():
+                units.append((sentence.strip(), None, False))
+    return units
+
+
+class NearDuplicatePostprocessor(BaseNodePostprocessor):
+    """
+    Drop chunks whose word shingles are mostly contained in a higher-ranked chunk, e.g. the same
+    boilerplate on several web pages or a chunk that is already part of an expanded section.
+    """
+
+    threshold: float = 0.85
+    shingle_size: int = 3
+
+    @classmethod
+    def class_name(cls):
+        return "NearDuplicatePostprocessor"
+
+    def _shingles(self, text):
+        tokens = tokenize(text)
+        if len(tokens) <= self.shingle_size:
+            return {tuple(tokens)}
+        return {tuple(tokens[i:i + self.shingle_size]) for i in range(len(tokens) - self.shingle_size + 1)}
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        kept, kept_shingles = [], []
+        for n in nodes:
+            shingles = self._shingles(n.node.get_content(metadata_mode=MetadataMode.NONE))
+            duplicate = any(
+                len(shingles & other) / max(1, min(len(shingles), len(other))) >= self.threshold
+                for other in kept_shingles
+            )
+            if not duplicate:
+                kept.append(n)
+                kept_shingles.append(shingles)
+        return kept
+
+
+class LexicalRerankPostprocessor(BaseNodePostprocessor):
+    """
+    Cheap local re-ranker: blends the retrieval score (min-max normalized) with how much of the
+    question's vocabulary, weighted by rarity among the candidates, each chunk contains. Exact
+    identifiers such as IE or measurement names therefore pull their chunks up.
+    """
+
+    weight: float = 0.5
+    top_n: int = 0
+
+    @classmethod
+    def class_name(cls):
+        return "LexicalRerankPostprocessor"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if query_bundle is None or len(nodes) < 2:
+            return nodes
+        wanted = query_terms(query_bundle)
+        if not wanted:
+            return nodes
+
+        token_sets = [terms(n.node.get_content(metadata_mode=MetadataMode.NONE)) for n in nodes]
+        idf = {term: math.log(1 + len(nodes) / (1 + sum(term in tokens for tokens in token_sets))) for term in wanted}
+        total_idf = sum(idf.values()) or 1.0
+        scores = [n.score if n.score is not None else 0.0 for n in nodes]
+        low, high = min(scores), max(scores)
+
+        reranked = []
+        for n, tokens, score in zip(nodes, token_sets, scores):
+            retrieval = (score - low) / (high - low) if high > low else 1.0
+            coverage = sum(weight for term, weight in idf.items() if term in tokens) / total_idf
+            reranked.append(NodeWithScore(node=n.node, score=(1 - self.weight) * retrieval + self.weight * coverage))
+        reranked.sort(key=lambda n: n.score, reverse=True)
+        return reranked[:self.top_n] if self.top_n else reranked
+
+
+class SentenceExtractionPostprocessor(BaseNodePostprocessor):
+    """
+    Keep only the sentences (and table rows, with their header) of a chunk that mention a query
+    term, plus `window` neighbouring sentences for context. Short chunks, and chunks where
+    nothing matches, are passed through unchanged.
+    """
+
+    window: int = 1
+    min_chars: int = 400
+
+    @classmethod
+    def class_name(cls):
+        return "SentenceExtractionPostprocessor"
+
+    def extract(self, text, wanted):
+        units = split_units(text)
+        matches = [bool(wanted & terms(unit)) for unit, _, _ in units]
+        if not any(matches):
+            return text
+        keep = set()
+        for position, matched in enumerate(matches):
+            if not matched:
+                continue
+            keep.add(position)
+            if units[position][1] is None:
+                # Neighbouring prose sentences, not neighbouring table rows
+                for neighbour in range(max(0, position - self.window), min(len(units), position + self.window + 1)):
+                    if units[neighbour][1] is None:
+                        keep.add(neighbour)
+        kept_tables = {units[position][1] for position in keep if units[position][1] is not None}
+        keep.update(position for position, (_, table_id, is_header) in enumerate(units) if is_header and table_id in kept_tables)
+
+        parts, previous = [], None
+        for position in sorted(keep):
+            unit, table_id, _ = units[position]
+            if previous is not None and position > previous + 1:
+                parts.append("\n…\n" if table_id is None else "\n")
+            elif previous is not None:
+                parts.append("\n" if table_id is not None or units[previous][1] is not None else " ")
+            parts.append(unit)
+            previous = position
+        return "".join(parts).strip()
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if query_bundle is None:
+            return nodes
+        wanted = query_terms(query_bundle)
+        if not wanted:
+            return nodes
+        results = []
+        for n in nodes:
+            text = n.node.get_content(metadata_mode=MetadataMode.NONE)
+            extracted = self.extract(text, wanted) if len(text) >= self.min_chars else text
+            results.append(n if extracted == text else _with_text(n, extracted))
+        return results
+
+
+class TokenBudgetPostprocessor(BaseNodePostprocessor):
+    """
+    Keep chunks in rank order until their LLM-visible text reaches `max_tokens`; the chunk that
+    crosses the budget is cut at a sentence boundary, and the rest are dropped.
+    """
+
+    max_tokens: int = 1500
+    _tokenizer: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls):
+        return "TokenBudgetPostprocessor"
+
+    def count(self, text):
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer()
+        return len(self._tokenizer(text))
+
+    def _truncate(self, n, max_tokens):
+        # Whole units from the start of the chunk while they fit (metadata counts too)
+        overhead = self.count(n.node.get_content(metadata_mode=MetadataMode.LLM)) - self.count(n.node.get_content(metadata_mode=MetadataMode.NONE))
+        parts, used = [], overhead
+        for unit, _, _ in split_units(n.node.get_content(metadata_mode=MetadataMode.NONE)):
+            cost = self.count(unit) + 1
+            if used + cost > max_tokens:
+                break
+            parts.append(unit)
+            used += cost
+        text = "\n".join(parts).strip()
+        return _with_text(n, text) if text else None
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if not self.max_tokens:
+            return nodes
+        results, used = [], 0
+        for n in nodes:
+            cost = self.count(n.node.get_content(metadata_mode=MetadataMode.LLM))
+            if used + cost <= self.max_tokens:
+                results.append(n)
+                used += cost
+                continue
+            truncated = self._truncate(n, self.max_tokens - used)
+            if truncated is not None:
+                results.append(truncated)
+            break
+        return results
+
+
+class ContextCompressor(BaseNodePostprocessor):
+    """
+    Runs the compression stages between retrieval and synthesis and reports, per request, how
+    many context tokens were retrieved and how many are sent to the LLM.
+    """
+
+    postprocessors: List[Any] = []
+
+    @classmethod
+    def class_name(cls):
+        return "ContextCompressor"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        budget = next((p for p in self.postprocessors if isinstance(p, TokenBudgetPostprocessor)), None) or TokenBudgetPostprocessor()
+        started = time.perf_counter()
+        tokens_before = sum(budget.count(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in nodes)
+        nodes_before = len(nodes)
+        for postprocessor in self.postprocessors:
+            nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+        tokens_after = sum(budget.count(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in nodes)
+
+        METRICS.increment("context_tokens", {"kind": "retrieved"}, tokens_before)
+        METRICS.increment("context_tokens", {"kind": "sent"}, tokens_after)
+        record("compress", time.perf_counter() - started, context_tokens_before=tokens_before, context_tokens_after=tokens_after, nodes_before=nodes_before, nodes_after=len(nodes))
+        return nodes
+
+
+def context_compressor(token_budget=None):
+    """
+    The default compression pipeline, configured from the environment:
+    CONTEXT_DEDUP_THRESHOLD, CONTEXT_RERANK_WEIGHT, CONTEXT_RERANK_TOP_N, CONTEXT_SENTENCE_WINDOW
+    and CONTEXT_TOKEN_BUDGET (0 turns the budget off). CONTEXT_COMPRESSION=0 returns None.
+    """
+    if os.getenv("CONTEXT_COMPRESSION", "1") != "1":
+        return None
+    if token_budget is None:
+        token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+    return ContextCompressor(postprocessors=[
+        NearDuplicatePostprocessor(threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))),
+        LexicalRerankPostprocessor(weight=float(os.getenv("CONTEXT_RERANK_WEIGHT", "0.5")), top_n=int(os.getenv("CONTEXT_RERANK_TOP_N", "0"))),
+        SentenceExtractionPostprocessor(window=int(os.getenv("CONTEXT_SENTENCE_WINDOW", "1"))),
+        TokenBudgetPostprocessor(max_tokens=token_budget),
+    ])
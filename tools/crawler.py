@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urldefrag, urlparse
+import httpx
+import html2text
+from llama_index.core import Document
+from tools.metrics import METRICS, stage_timer
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Links to these file types are never fetched as pages
+SKIPPED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".zip", ".gz", ".tar", ".css", ".js", ".ico", ".txt", ".xml", ".json")
+
+USER_AGENT = "oran-assistant-crawler/1.0"
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+
+def extract_links(base_url, html):
+    parser = _LinkParser()
+    try:
+        parser.feed(html)
+    except Exception as e:
+        logger.warning(f"[!] Could not parse links on {base_url}: {str(e)}")
+    links = []
+    for href in parser.links:
+        url = urldefrag(urljoin(base_url, href))[0]
+        if url.startswith(("http://", "https://")) and url not in links:
+            links.append(url)
+    return links
+
+
+class PageCache:
+    """
+    Raw pages on disk, one JSON file per URL with the HTML and its ETag/Last-Modified headers.
+    The directory doubles as an offline snapshot of the crawled site.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def get(self, url):
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"[!] Ignoring unreadable cached page {path}: {str(e)}")
+            return None
+
+    def put(self, url, html, etag=None, last_modified=None):
+        entry = {"url": url, "html": html, "etag": etag, "last_modified": last_modified, "fetched_at": time.time()}
+        path = self._path(url)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        return entry
+
+
+class WebCrawler:
+    """
+    Breadth-first crawler over a documentation site. Pages are fetched concurrently through one
+    pooled HTTP client with conditional requests against the page cache. With `offline=True`
+    only cached pages are used, and `mirror_dir` serves pages from a local mirror
+    (`<mirror_dir>/<host>/<path>`, e.g. made with `wget --mirror`) instead of the network.
+    """
+
+    def __init__(self, cache_dir, max_depth=0, max_pages=200, concurrency=8, allowed_domains=None,
+                 path_prefix=None, offline=False, mirror_dir=None, timeout=30.0):
+        self.cache = PageCache(cache_dir)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.allowed_domains = set(allowed_domains or [])
+        self.path_prefix = path_prefix
+        self.offline = offline
+        self.mirror_dir = mirror_dir
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls):
+        domains = [d.strip() for d in os.getenv("WEB_CRAWL_DOMAINS", "").split(",") if d.strip()]
+        return cls(
+            cache_dir=os.getenv("WEB_CACHE_DIR", "web_cache"),
+            max_depth=int(os.getenv("WEB_CRAWL_DEPTH", "0")),
+            max_pages=int(os.getenv("WEB_CRAWL_MAX_PAGES", "200")),
+            concurrency=int(os.getenv("WEB_CRAWL_CONCURRENCY", "8")),
+            allowed_domains=domains,
+            path_prefix=os.getenv("WEB_CRAWL_PREFIX") or None,
+            offline=os.getenv("WEB_OFFLINE", "0") == "1",
+            mirror_dir=os.getenv("WEB_MIRROR_DIR") or None,
+        )
+
+    def _in_scope(self, url, domains):
+        parsed = urlparse(url)
+        if parsed.hostname not in domains:
+            return False
+        if self.path_prefix and not url.startswith(self.path_prefix):
+            return False
+        return not parsed.path.lower().endswith(SKIPPED_EXTENSIONS)
+
+    def _mirror_path(self, url):
+        parsed = urlparse(url)
+        path = parsed.path.lstrip("/")
+        if not path or path.endswith("/"):
+            path += "index.html"
+        return os.path.join(self.mirror_dir, parsed.hostname or "", path)
+
+    async def _fetch(self, client, url):
+        # Returns the page HTML (or None) and how it was obtained
+        cached = self.cache.get(url)
+        if self.mirror_dir:
+            path = self._mirror_path(url)
+            if not os.path.exists(path):
+                return None, "missing"
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return f.read(), "mirror"
+        if self.offline:
+            return (cached["html"], "cached") if cached else (None, "missing")
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            response = await client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            logger.warning(f"[!] Fetching {url} failed: {str(e)}")
+            return (cached["html"], "cached") if cached else (None, "error")
+
+        if response.status_code == 304 and cached:
+            return cached["html"], "not_modified"
+        if response.status_code != 200:
+            logger.warning(f"[!] Fetching {url} returned HTTP {response.status_code}")
+            return (cached["html"], "cached") if cached else (None, "error")
+        if "html" not in response.headers.get("content-type", "text/html"):
+            return None, "skipped"
+        self.cache.put(url, response.text, response.headers.get("etag"), response.headers.get("last-modified"))
+        return response.text, "fetched"
+
+    async def crawl(self, start_urls):
+        """
+        Crawl from `start_urls` and return {url: html} for every page reached.
+        """
+        start_urls = [urldefrag(url)[0] for url in start_urls]
+        domains = self.allowed_domains or {urlparse(url).hostname for url in start_urls}
+        pages = {}
+        seen = set(start_urls)
+        frontier = list(start_urls)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout, follow_redirects=True, headers={"User-Agent": USER_AGENT}) as client:
+            async def fetch(url):
+                async with semaphore:
+                    return url, *(await self._fetch(client, url))
+
+            for depth in range(self.max_depth + 1):
+                if not frontier:
+                    break
+                next_frontier = []
+                for url, html, result in await asyncio.gather(*[fetch(url) for url in frontier]):
+                    METRICS.increment("web_fetches", {"result": result})
+                    if html is None:
+                        continue
+                    pages[url] = html
+                    if depth == self.max_depth:
+                        continue
+                    for link in extract_links(url, html):
+                        if link not in seen and self._in_scope(link, domains) and len(seen) < self.max_pages:
+                            seen.add(link)
+                            next_frontier.append(link)
+                frontier = next_frontier
+        return pages
+
+    def crawl_documents(self, start_urls):
+        """
+        Crawl synchronously and return one Document per page (Markdown text, metadata `source` = URL).
+        Safe to call from inside a running event loop: the crawl then runs on its own thread.
+        """
+        with stage_timer("web_fetch", url=start_urls[0] if start_urls else ""):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pages = asyncio.run(self.crawl(start_urls))
+            else:
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    pages = executor.submit(asyncio.run, self.crawl(start_urls)).result()
+        if not pages:
+            # Never hand an empty page set to ingestion: that would delete the whole web index
+            raise RuntimeError(f"No pages could be fetched from {', '.join(start_urls)}")
+        logger.info(f"Crawled {len(pages)} pages from {', '.join(start_urls)}")
+        return [Document(text=html2text.html2text(html), metadata={"source": url}) for url, html in pages.items()]
@@ -1,11 +1,14 @@
 import os
 import logging
+import threading
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
-from llama_index.vector_stores.chroma import ChromaVectorStore
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
-from llama_index.core import Settings
-import chromadb
 import config
+from tools.ingestion import sync_collection, pdf_sources
+from tools.keyword_index import hybrid_retriever, keyword_index_for
+from tools.spec_chunking import SpecChunker, SectionStore, SectionExpansionPostprocessor
+from tools.context_compression import context_compressor
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -23,38 +26,21 @@ def load_index(data_dir, index_name, use_chroma=True):
         logger.error(f"[!] No PDF files found in directory: {data_dir}")
         raise FileNotFoundError(f"No PDF files found in directory: {data_dir}")
 
-    # Ensure the embedding model is initialized
-    if not Settings.embed_model:
-        logger.error("[!] Embedding model not initialized")
-        raise ValueError("Embedding model not initialized")
-
-    # Ensure the LLM model is initialized
-    if not Settings.llm:
-        logger.error("[!] LLM not initialized")
-        raise ValueError("LLM not initialized")
+    # Ensure the embedding model and LLM are initialized (built lazily on first use)
+    config.configure_settings()
 
     try:
-        # Load all PDF documents from the specified directory
-        documents = SimpleDirectoryReader(input_dir=data_dir, required_exts=['.pdf']).load_data()
-        logger.info(f"Loaded {len(documents)} documents from {data_dir} (files: {', '.join(pdf_files)})")
-
         if use_chroma:
-            # Initialize Chroma client
-            chroma_client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
-            chroma_collection = chroma_client.get_or_create_collection(name=index_name)
-
-            # Create Chroma vector store
-            vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-
-            # Create and persist the index
-            index = VectorStoreIndex.from_documents(
-                documents,
-                vector_store=vector_store
-            )
-            logger.info(f"Created and persisted index for {index_name} in Chroma")
+            # Incrementally sync the PDFs into Chroma; unchanged files are never re-parsed or re-embedded
+            index = sync_collection(index_name, pdf_sources(data_dir), chunker=SpecChunker())
+            logger.info(f"Opened persistent index for {index_name} in Chroma (files: {', '.join(pdf_files)})")
         else:
-            # Create in-memory index for LlamaIndex
-            index = VectorStoreIndex.from_documents(documents)
+            # Load all PDF documents from the specified directory
+            documents = SimpleDirectoryReader(input_dir=data_dir, required_exts=['.pdf']).load_data()
+            logger.info(f"Loaded {len(documents)} documents from {data_dir} (files: {', '.join(pdf_files)})")
+
+            # Create in-memory index for LlamaIndex, split on clauses with tables kept whole
+            index = VectorStoreIndex(SpecChunker().get_nodes(documents))
             logger.info(f"Created in-memory index for {index_name} in LlamaIndex")
 
         return index
@@ -68,11 +54,17 @@ def asQueryEngineTool(index):
         raise ValueError("Index cannot be None")
     
     # Ensure the LLM model is initialized
-    if not Settings.llm:
-        logger.error("[!] LLM not initialized")
-        raise ValueError("LLM not initialized")
-    
-    query_engine = index.as_query_engine(similarity_top_k=5, response_mode="compact")
+    config.configure_settings()
+
+    # Fuse dense and BM25 results so exact identifiers (IE and measurement names) are found,
+    # expand clauses that several hits point into, then compress the context to the token budget
+    keyword_index = keyword_index_for(index)
+    compressor = context_compressor()
+    query_engine = RetrieverQueryEngine.from_args(
+        hybrid_retriever(index, similarity_top_k=5, keyword_index=keyword_index),
+        response_mode="compact",
+        node_postprocessors=[SectionExpansionPostprocessor(section_store=SectionStore(keyword_index)), *([compressor] if compressor else [])],
+    )
     return QueryEngineTool(
         query_engine=query_engine,
         metadata=ToolMetadata(
@@ -82,9 +74,25 @@ def asQueryEngineTool(index):
     )
 
 data_dir = "data"
-try:
-    guidelines_index = load_index(data_dir, index_name="guidelines", use_chroma=True)  # Default to Chroma
-    guidelines_engine = asQueryEngineTool(guidelines_index)
-except Exception as e:
-    logger.error(f"[!] Failed to initialize guidelines_engine: {str(e)}")
-    raise
+
+# The tool is built on first use so importing this module stays free of side effects
+_guidelines_engine = None
+_engine_lock = threading.Lock()
+
+def get_guidelines_engine():
+    global _guidelines_engine
+    with _engine_lock:
+        if _guidelines_engine is None:
+            try:
+                guidelines_index = load_index(data_dir, index_name="guidelines", use_chroma=True)  # Default to Chroma
+                _guidelines_engine = asQueryEngineTool(guidelines_index)
+            except Exception as e:
+                logger.error(f"[!] Failed to initialize guidelines_engine: {str(e)}")
+                raise
+        return _guidelines_engine
+
+def warmup():
+    get_guidelines_engine()
+
+if __name__ == "__main__":
+    warmup()
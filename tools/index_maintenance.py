@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from tools.ingestion import use_prepared
+from tools.metrics import METRICS
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def pdf_snapshot(data_dir):
+    # Name, size and modification time of every PDF: cheap to poll, changes whenever a file does
+    try:
+        with os.scandir(data_dir) as entries:
+            return {
+                entry.name: (entry.stat().st_size, entry.stat().st_mtime_ns)
+                for entry in entries
+                if entry.name.endswith(".pdf") and entry.is_file()
+            }
+    except FileNotFoundError:
+        return {}
+
+
+class IndexMaintainer:
+    """
+    Background task that keeps the loaded indexes current without a restart. It polls each loaded
+    collection's data directory and re-crawls its web source every `web_refresh_interval` seconds.
+    When something changed, `prepare(vector_store_type, collection)` runs in a worker process: it
+    parses, crawls and embeds, and returns what it prepared per index name (see `use_prepared`).
+    The registry then opens the new version from that alone and swaps it in. Requests that already
+    hold the previous version finish on it; `retire(vector_store_type, collection)` removes what
+    it replaced `retire_delay` seconds later.
+    """
+
+    def __init__(self, registry, collections, prepare, poll_interval=10.0, web_refresh_interval=86400.0, retire=None, retire_delay=300.0):
+        self.registry = registry
+        self.collections = collections
+        self.prepare = prepare
+        self.poll_interval = poll_interval
+        self.web_refresh_interval = web_refresh_interval
+        self.retire = retire
+        self.retire_delay = retire_delay
+        self._executor = None
+        self._task = None
+        self._retiring = set()
+        # Per collection: the PDF snapshot the loaded indexes were built from, the one seen at the
+        # previous poll (a change is ingested once it is stable for a poll), and the last web refresh
+        self._ingested = {}
+        self._seen = {}
+        self._web_refreshed = {}
+        self._runs = {}
+
+    def _get_executor(self):
+        # One spawned worker: embedding is CPU-bound and must not share the server's threads or GIL
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+            logger.info(f"Index maintenance started (poll every {self.poll_interval:.0f}s, web refresh every {self.web_refresh_interval:.0f}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._retiring):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"[!] Index maintenance check failed: {str(e)}", exc_info=True)
+
+    def _due(self, collection):
+        # Why `collection` needs a refresh now, or None
+        settings = self.collections[collection]
+        snapshot = pdf_snapshot(settings.data_dir)
+        previous = self._seen.get(collection)
+        self._seen[collection] = snapshot
+        if collection not in self._ingested:
+            # First poll since the collection was loaded: it was built from what is there now
+            self._ingested[collection] = snapshot
+            self._web_refreshed[collection] = time.time()
+            return None
+        if snapshot != self._ingested[collection]:
+            # Wait until a file being copied in has stopped changing
+            return "data" if snapshot == previous else None
+        if self.web_refresh_interval and time.time() - self._web_refreshed[collection] >= self.web_refresh_interval:
+            return "web"
+        return None
+
+    async def check(self):
+        loaded = {}
+        for collection, vector_store_type in self.registry.loaded():
+            loaded.setdefault(collection, []).append(vector_store_type)
+        for collection in set(self._ingested) - set(loaded):
+            # Evicted: it is built from the current files when it is loaded again
+            self._ingested.pop(collection)
+            self._seen.pop(collection, None)
+        for collection, vector_store_types in loaded.items():
+            reason = self._due(collection)
+            if reason is None:
+                continue
+            snapshot = self._seen[collection]
+            results = [await self.refresh(vector_store_type, collection, reason) for vector_store_type in vector_store_types]
+            if all(results):
+                self._ingested[collection] = snapshot
+                self._web_refreshed[collection] = time.time()
+
+    async def refresh(self, vector_store_type, collection, reason="manual"):
+        """
+        Ingest changes for one collection and store type off to the side and swap the result in.
+        Returns False when it failed or another rebuild was already running (it is retried on the
+        next poll).
+        """
+        if self.registry.is_rebuilding(vector_store_type, collection):
+            return False
+        run = {"reason": reason, "started_at": time.time(), "status": "running"}
+        self._runs[f"{collection}/{vector_store_type}"] = run
+        logger.info(f"Refreshing '{collection}/{vector_store_type}' indexes ({reason} changed)")
+        try:
+            loop = asyncio.get_running_loop()
+            prepared = await loop.run_in_executor(self._get_executor(), self.prepare, vector_store_type, collection)
+            run["prepared"] = {index_name: getattr(item, "stats", item) for index_name, item in prepared.items()}
+            # The rebuild only writes and opens what the worker prepared; nothing is parsed or crawled here
+            with use_prepared(prepared):
+                entry = await asyncio.to_thread(self.registry.rebuild, vector_store_type, False, collection)
+            if entry is None:
+                raise RuntimeError("rebuild failed, see the index registry status")
+            run.update(status="done", version=entry.version)
+            METRICS.increment("index_refreshes", {"reason": reason, "status": "done"})
+            self.retire_later(vector_store_type, collection)
+            return True
+        except Exception as e:
+            run.update(status="failed", error=str(e))
+            METRICS.increment("index_refreshes", {"reason": reason, "status": "failed"})
+            logger.error(f"[!] Refresh of '{collection}/{vector_store_type}' failed: {str(e)}", exc_info=True)
+            return False
+        finally:
+            run["seconds"] = round(time.time() - run["started_at"], 3)
+
+    def retire_later(self, vector_store_type, collection):
+        """
+        Schedule `retire` for what a swap of this collection and store type replaced (from a
+        refresh or any other rebuild); must be called on the event loop.
+        """
+        if self.retire is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._retire_later(vector_store_type, collection))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _retire_later(self, vector_store_type, collection):
+        # Requests that picked up the previous version before the swap get `retire_delay` seconds to finish
+        await asyncio.sleep(self.retire_delay)
+        try:
+            await asyncio.to_thread(self.retire, vector_store_type, collection)
+        except Exception as e:
+            logger.error(f"[!] Could not drop the replaced '{collection}/{vector_store_type}' indexes: {str(e)}", exc_info=True)
+
+    def status(self):
+        return {
+            "running": self._task is not None,
+            "poll_interval": self.poll_interval,
+            "web_refresh_interval": self.web_refresh_interval,
+            "retire_delay": self.retire_delay,
+            "web_refreshed_at": dict(self._web_refreshed),
+            "runs": dict(self._runs),
+        }
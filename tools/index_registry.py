@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from tools.metrics import METRICS, stage_timer
+from tools.collection_config import DEFAULT_COLLECTION
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+class IndexEntry:
+    """
+    Query-ready guidelines/web indexes, retrievers and query engines for one collection and
+    vector store type. Entries are never mutated after they are published, so a request that
+    holds one keeps working on it even while a rebuild (or an eviction) replaces it in the registry.
+    """
+
+    def __init__(self, vector_store_type, version, guidelines_index, web_index, guidelines_query_engines, web_query_engine, fingerprint=None, router=None, collection=DEFAULT_COLLECTION, size_bytes=0):
+        self.vector_store_type = vector_store_type
+        self.collection = collection
+        self.version = version
+        # Content hash of the indexed sources; stable across restarts when nothing changed
+        self.fingerprint = fingerprint or str(version)
+        self.guidelines_index = guidelines_index
+        self.web_index = web_index
+        # Guidelines engines keyed by retrieval mode; the first one is the default
+        self.guidelines_query_engines = guidelines_query_engines
+        self.guidelines_query_engine = next(iter(guidelines_query_engines.values()))
+        self.web_query_engine = web_query_engine
+        self.guidelines_retriever = self.guidelines_query_engine.retriever
+        self.web_retriever = web_query_engine.retriever
+        # Decides which index parts a query is sent to
+        self.router = router
+        # Estimated resident size, used to keep the loaded collections under the memory cap
+        self.size_bytes = size_bytes
+        self.built_at = time.time()
+
+    @property
+    def key(self):
+        return (self.collection, self.vector_store_type)
+
+    def guidelines_engine(self, retrieval_mode=None):
+        if retrieval_mode is None:
+            return self.guidelines_query_engine
+        return self.guidelines_query_engines[retrieval_mode]
+
+
+class IndexRegistry:
+    """
+    Process-level registry that builds each (collection, vector store type) pair on first use
+    and serves every request from the cached entry. Rebuilds happen off to the side and are
+    swapped in atomically. When the loaded entries exceed `memory_limit_bytes` (or
+    `max_entries`), the least recently used ones are dropped; they are rebuilt on next use.
+    """
+
+    def __init__(self, load_indexes, create_query_engines, fingerprint=None, create_router=None,
+                 entry_size=None, memory_limit_bytes=0, max_entries=0):
+        self._load_indexes = load_indexes
+        self._create_query_engines = create_query_engines
+        self._fingerprint = fingerprint
+        self._create_router = create_router
+        self._entry_size = entry_size
+        self.memory_limit_bytes = memory_limit_bytes
+        self.max_entries = max_entries
+        self._listeners = []
+        # Most recently used last
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._rebuilding = set()
+        self._last_errors = {}
+
+    def _build_lock(self, key):
+        with self._lock:
+            return self._build_locks.setdefault(key, threading.Lock())
+
+    def _build(self, vector_store_type, collection):
+        # Build a complete entry without touching the published one
+        key = (collection, vector_store_type)
+        started = time.perf_counter()
+        with stage_timer("index_load", vector_store_type=vector_store_type, collection=collection):
+            guidelines_index, web_index = self._load_indexes(vector_store_type, collection)
+        fingerprint = self._fingerprint(vector_store_type, collection, guidelines_index, web_index) if self._fingerprint else None
+        guidelines_query_engines, web_query_engine = self._create_query_engines(guidelines_index, web_index, collection)
+        router = self._create_router(guidelines_index, web_index, collection) if self._create_router else None
+        with self._lock:
+            version = self._versions.get(key, 0) + 1
+        entry = IndexEntry(vector_store_type, version, guidelines_index, web_index, guidelines_query_engines, web_query_engine, fingerprint, router, collection)
+        if self._entry_size:
+            try:
+                entry.size_bytes = self._entry_size(entry)
+            except Exception as e:
+                logger.warning(f"[!] Could not estimate the size of '{collection}/{vector_store_type}': {str(e)}")
+        logger.info(f"[✔] Built '{collection}/{vector_store_type}' indexes (version {version}, ~{entry.size_bytes / 2**20:.0f} MB) in {time.perf_counter() - started:.2f}s")
+        return entry
+
+    def add_listener(self, callback):
+        # `callback(entry)` runs after every swap, e.g. to invalidate caches tied to the old version
+        self._listeners.append(callback)
+
+    def _publish(self, entry):
+        with self._lock:
+            self._entries[entry.key] = entry
+            self._entries.move_to_end(entry.key)
+            self._versions[entry.key] = entry.version
+            self._last_errors.pop(entry.key, None)
+            evicted = self._evict(keep=entry.key)
+        for key in evicted:
+            METRICS.increment("index_evictions")
+            logger.info(f"Evicted '{key[0]}/{key[1]}' indexes (least recently used)")
+        for callback in self._listeners:
+            try:
+                callback(entry)
+            except Exception as e:
+                logger.error(f"[!] Index swap listener failed: {str(e)}", exc_info=True)
+
+    def _evict(self, keep):
+        # Called with the lock held; requests that still hold an evicted entry finish on it
+        evicted = []
+        while len(self._entries) > 1:
+            over_memory = self.memory_limit_bytes and self.loaded_bytes() > self.memory_limit_bytes
+            over_count = self.max_entries and len(self._entries) > self.max_entries
+            if not over_memory and not over_count:
+                break
+            key = next((k for k in self._entries if k != keep and k not in self._rebuilding), None)
+            if key is None:
+                break
+            del self._entries[key]
+            evicted.append(key)
+        return evicted
+
+    def loaded_bytes(self):
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def get(self, vector_store_type, collection=DEFAULT_COLLECTION):
+        key = (collection, vector_store_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        # First use: only one caller builds, the others wait for its result
+        with self._build_lock(key):
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._build(vector_store_type, collection)
+                self._publish(entry)
+            return entry
+
+    def preload(self, vector_store_types, collection=DEFAULT_COLLECTION):
+        for vector_store_type in vector_store_types:
+            try:
+                self.get(vector_store_type, collection)
+            except Exception as e:
+                self._last_errors[(collection, vector_store_type)] = str(e)
+                logger.error(f"[!] Failed to preload '{collection}/{vector_store_type}' indexes: {str(e)}", exc_info=True)
+
+    def is_rebuilding(self, vector_store_type, collection=DEFAULT_COLLECTION):
+        with self._lock:
+            return (collection, vector_store_type) in self._rebuilding
+
+    def mark_rebuilding(self, vector_store_type, collection=DEFAULT_COLLECTION):
+        # Returns False when a rebuild for this type is already queued or running
+        key = (collection, vector_store_type)
+        with self._lock:
+            if key in self._rebuilding:
+                return False
+            self._rebuilding.add(key)
+            return True
+
+    def rebuild(self, vector_store_type, raise_on_error=True, collection=DEFAULT_COLLECTION):
+        key = (collection, vector_store_type)
+        with self._lock:
+            self._rebuilding.add(key)
+        try:
+            with self._build_lock(key):
+                entry = self._build(vector_store_type, collection)
+                # Requests that already hold the previous entry finish on it
+                self._publish(entry)
+            logger.info(f"[✔] Swapped in '{collection}/{vector_store_type}' indexes version {entry.version}")
+            return entry
+        except Exception as e:
+            self._last_errors[key] = str(e)
+            logger.error(f"[!] Rebuild of '{collection}/{vector_store_type}' indexes failed: {str(e)}", exc_info=True)
+            if raise_on_error:
+                raise
+            return None
+        finally:
+            with self._lock:
+                self._rebuilding.discard(key)
+
+    def status(self):
+        with self._lock:
+            keys = set(self._versions) | set(self._rebuilding) | set(self._last_errors)
+            return {
+                f"{collection}/{vector_store_type}": {
+                    "collection": collection,
+                    "vector_store_type": vector_store_type,
+                    "loaded": (collection, vector_store_type) in self._entries,
+                    "version": self._versions.get((collection, vector_store_type), 0),
+                    "fingerprint": self._entries[(collection, vector_store_type)].fingerprint if (collection, vector_store_type) in self._entries else None,
+                    "built_at": self._entries[(collection, vector_store_type)].built_at if (collection, vector_store_type) in self._entries else None,
+                    "size_bytes": self._entries[(collection, vector_store_type)].size_bytes if (collection, vector_store_type) in self._entries else None,
+                    "rebuilding": (collection, vector_store_type) in self._rebuilding,
+                    "last_error": self._last_errors.get((collection, vector_store_type)),
+                }
+                for collection, vector_store_type in sorted(keys)
+            }
+
+    def loaded(self):
+        # (collection, vector_store_type) pairs in memory, least recently used first
+        with self._lock:
+            return list(self._entries)
@@ -0,0 +1,453 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import contextvars
+from contextlib import contextmanager
+import chromadb
+import chromadb.config
+from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
+from llama_index.core.schema import MetadataMode
+from llama_index.vector_stores.chroma import ChromaVectorStore
+import config
+from tools.keyword_index import sync_keyword_index, keyword_index_path
+from tools.spec_chunking import PlainChunker
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Bump when the chunking or id scheme changes so old manifests are re-ingested
+MANIFEST_VERSION = 2
+
+# Number of chunks embedded and written to Chroma per call
+EMBED_BATCH_SIZE = 64
+
+# What the maintenance worker process prepared for each index name: a SyncPlan for Chroma
+# collections, the fingerprint of the persisted files for packed indexes
+_prepared = contextvars.ContextVar("prepared_indexes", default={})
+
+
+@contextmanager
+def use_prepared(prepared):
+    """
+    Make `prepared` ({index name: SyncPlan or packed fingerprint}) available to the index loads
+    run in this context, so they open what the worker prepared instead of parsing and crawling
+    the sources again.
+    """
+    token = _prepared.set(prepared or {})
+    try:
+        yield
+    finally:
+        _prepared.reset(token)
+
+
+def prepared_for(index_name):
+    return _prepared.get().get(index_name)
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text):
+    return hash_bytes(text.encode("utf-8"))
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_path(collection_name):
+    return os.path.join(config.CHROMA_DB_PATH, "manifests", f"{collection_name}.json")
+
+
+def _live_path(index_name):
+    return os.path.join(config.CHROMA_DB_PATH, "manifests", f"{index_name}.live.json")
+
+
+def live_version(index_name):
+    """
+    (Chroma collection name, version) currently serving `index_name`. Each sync that changes
+    something writes a new `<index_name>__v<n>` collection and then points this file at it;
+    before the first such sync it is the bare `index_name` collection, version 0.
+    """
+    try:
+        with open(_live_path(index_name), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data["collection"], data["version"]
+    except (OSError, ValueError, KeyError):
+        return index_name, 0
+
+
+def _publish_live(index_name, collection_name, version):
+    # The rename is the swap: loads after it open the new collection, nothing else changes
+    path = _live_path(index_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"collection": collection_name, "version": version}, f)
+    os.replace(tmp_path, path)
+
+
+class IngestionManifest:
+    """
+    Records what has been written to a Chroma collection: a hash per source (file or URL),
+    per page and per chunk, plus the chunk ids stored for each page.
+    """
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self.data = data or {"version": MANIFEST_VERSION, "sources": {}}
+
+    @classmethod
+    def load(cls, index_name):
+        # The manifest of the collection version that currently serves `index_name`
+        path = _manifest_path(live_version(index_name)[0])
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"[!] Ignoring unreadable manifest {path}: {str(e)}")
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            logger.info(f"Manifest {path} has an old format, re-ingesting")
+            return cls(path)
+        return cls(path, data)
+
+    @property
+    def sources(self):
+        return self.data["sources"]
+
+    def chunk_ids(self, source_key=None):
+        keys = [source_key] if source_key else list(self.sources)
+        return [
+            chunk_id
+            for key in keys
+            for page in self.sources.get(key, {}).get("pages", {}).values()
+            for chunk_id in page["chunks"]
+        ]
+
+    def save(self):
+        # Write to a temporary file first so a crash never leaves a truncated manifest
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+class Source:
+    """
+    One ingestible unit (a PDF file or a web page). `fingerprint` is a cheap content hash used
+    to skip unchanged sources without parsing them; `load_documents` returns its page documents.
+    """
+
+    def __init__(self, key, fingerprint, load_documents):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.load_documents = load_documents
+
+
+def pdf_sources(data_dir):
+    sources = []
+    for file_name in sorted(f for f in os.listdir(data_dir) if f.endswith(".pdf")):
+        path = os.path.join(data_dir, file_name)
+        sources.append(Source(file_name, hash_file(path), lambda path=path: load_pdf_documents(path)))
+    return sources
+
+
+def load_pdf_documents(path):
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    for document in documents:
+        document.metadata["source"] = os.path.basename(path)
+    return documents
+
+
+def web_sources(documents):
+    # Web pages have to be fetched to be fingerprinted, so reuse the fetched documents
+    grouped = {}
+    for document in documents:
+        grouped.setdefault(document.metadata["source"], []).append(document)
+    return [
+        Source(key, hash_text("\n".join(d.text for d in docs)), lambda docs=docs: docs)
+        for key, docs in grouped.items()
+    ]
+
+
+def chroma_memory_limit_bytes():
+    return int(os.getenv("CHROMA_MEMORY_LIMIT_MB", "0")) * 2**20
+
+
+def chroma_settings():
+    # With CHROMA_MEMORY_LIMIT_MB, Chroma keeps only the most recently used collection segments in
+    # memory and unloads the others; every client of the process must use the same settings
+    limit_bytes = chroma_memory_limit_bytes()
+    if not limit_bytes:
+        return chromadb.config.Settings()
+    return chromadb.config.Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=limit_bytes)
+
+
+def _chroma_client():
+    return chromadb.PersistentClient(path=config.CHROMA_DB_PATH, settings=chroma_settings())
+
+
+def _collection_names(client):
+    # Older Chroma releases list Collection objects, newer ones only names
+    return [getattr(collection, "name", collection) for collection in client.list_collections()]
+
+
+def open_chroma_collection(index_name):
+    chroma_collection = _chroma_client().get_or_create_collection(name=live_version(index_name)[0])
+    return chroma_collection, ChromaVectorStore(chroma_collection=chroma_collection)
+
+
+def _chunk_id(source_key, page_key, text):
+    return hash_text(f"{source_key}\x00{page_key}\x00{text}")[:32]
+
+
+def _page_key(document, position):
+    return f"{position}:{document.metadata.get('page_label', '')}"
+
+
+def embed_nodes(nodes):
+    # Fill in missing node embeddings, EMBED_BATCH_SIZE chunks per model call
+    missing = [node for node in nodes if node.embedding is None]
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        embeddings = Settings.embed_model.get_text_embedding_batch(texts)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+    return nodes
+
+
+def _embed_and_add(vector_store, nodes):
+    for start in range(0, len(nodes), EMBED_BATCH_SIZE):
+        vector_store.add(embed_nodes(nodes[start:start + EMBED_BATCH_SIZE]))
+
+
+def _delete_ids(collection, ids):
+    for start in range(0, len(ids), 500):
+        collection.delete(ids=ids[start:start + 500])
+
+
+def _copy_chunks(source, target, ids):
+    # Copy stored chunks with their vectors, so nothing is re-embedded; returns the ids found
+    copied = set()
+    for start in range(0, len(ids), 500):
+        batch = source.get(ids=ids[start:start + 500], include=["embeddings", "documents", "metadatas"])
+        if len(batch["ids"]):
+            target.add(ids=batch["ids"], embeddings=batch["embeddings"], documents=batch["documents"], metadatas=batch["metadatas"])
+            copied.update(batch["ids"])
+    return copied
+
+
+def _diff_source(manifest, source, chunker):
+    # Chunk the pages of a changed source; returns its new page records and the nodes of changed pages
+    previous = manifest.sources.get(source.key)
+    previous_pages = previous["pages"] if previous else {}
+    pages = {}
+    new_nodes = []
+    documents = source.load_documents()
+    for position, (document, (context, nodes)) in enumerate(zip(documents, chunker.split(documents))):
+        page_key = _page_key(document, position)
+        # The context (e.g. the clause a page starts in) is part of its nodes' metadata
+        page_hash = hash_text(f"{context}\x00{document.text}")
+        if page_key in previous_pages and previous_pages[page_key]["hash"] == page_hash:
+            pages[page_key] = previous_pages[page_key]
+            continue
+
+        # Chunk ids are derived from content, so unchanged chunks keep their id
+        chunks = []
+        for node in nodes:
+            node.id_ = _chunk_id(source.key, page_key, f"{context}\x00{node.get_content()}")
+            if node.id_ in chunks:
+                continue
+            chunks.append(node.id_)
+            new_nodes.append(node)
+        pages[page_key] = {"hash": page_hash, "chunks": chunks}
+    return pages, new_nodes
+
+
+class SyncPlan:
+    """
+    Everything a sync of one index changes, computed without writing anything: the new manifest,
+    the new chunks (already embedded), the chunk ids kept from the live version and the ids that
+    go away. It is plain data, so the maintenance worker can prepare it and the server apply it.
+    """
+
+    def __init__(self, index_name, base_collection, manifest_data, added_nodes, kept_ids, deleted_ids, stats):
+        self.index_name = index_name
+        # The live collection the plan was diffed against
+        self.base_collection = base_collection
+        self.manifest_data = manifest_data
+        self.added_nodes = added_nodes
+        self.kept_ids = kept_ids
+        self.deleted_ids = deleted_ids
+        self.stats = stats
+
+    @property
+    def changed(self):
+        return bool(self.added_nodes or self.deleted_ids)
+
+
+def plan_sync(index_name, sources, chunker=None):
+    """
+    Diff `sources` against the manifest of the live version of `index_name` and embed the new
+    chunks. Only reads files and the manifest; Chroma is not opened.
+    """
+    config.configure_settings()
+    chunker = chunker or PlainChunker()
+    base_collection = live_version(index_name)[0]
+    manifest = IngestionManifest.load(index_name)
+    if manifest.data.get("chunker", chunker.name) != chunker.name:
+        # Chunks from another splitter cannot be diffed against the new ones
+        logger.info(f"Chunking for '{index_name}' changed to {chunker.name}, re-ingesting")
+        manifest = IngestionManifest(manifest.path)
+
+    stats = {"sources_skipped": 0, "chunks_added": 0, "chunks_kept": 0, "chunks_deleted": 0}
+    sources_data = {}
+    added_nodes = []
+    for source in sources:
+        previous = manifest.sources.get(source.key)
+        if previous and previous["hash"] == source.fingerprint:
+            sources_data[source.key] = previous
+            stats["sources_skipped"] += 1
+            stats["chunks_kept"] += len(manifest.chunk_ids(source.key))
+            continue
+
+        pages, new_nodes = _diff_source(manifest, source, chunker)
+        old_ids = set(manifest.chunk_ids(source.key))
+        new_ids = {chunk_id for page in pages.values() for chunk_id in page["chunks"]}
+        to_add = [node for node in new_nodes if node.id_ not in old_ids]
+        added_nodes.extend(to_add)
+        sources_data[source.key] = {"hash": source.fingerprint, "pages": pages}
+        stats["chunks_added"] += len(to_add)
+        stats["chunks_kept"] += len(new_ids) - len(to_add)
+        stats["chunks_deleted"] += len(old_ids - new_ids)
+
+    # Everything that belonged to sources which no longer exist goes away
+    for removed_key in sorted(set(manifest.sources) - set(sources_data)):
+        stats["chunks_deleted"] += len(manifest.chunk_ids(removed_key))
+        logger.info(f"Source {removed_key} was deleted, dropping its chunks from '{index_name}'")
+
+    plan_manifest = IngestionManifest(manifest.path, {"version": MANIFEST_VERSION, "chunker": chunker.name, "sources": sources_data})
+    added_ids = {node.id_ for node in added_nodes}
+    embed_nodes(added_nodes)
+    return SyncPlan(
+        index_name,
+        base_collection,
+        plan_manifest.data,
+        added_nodes,
+        [chunk_id for chunk_id in plan_manifest.chunk_ids() if chunk_id not in added_ids],
+        sorted(set(manifest.chunk_ids()) - set(plan_manifest.chunk_ids())),
+        stats,
+    )
+
+
+def apply_sync(plan):
+    """
+    Write `plan` as a new version of its Chroma collection and publish it. The live version is
+    only read (unchanged chunks are copied from it), so requests on it are unaffected; it is
+    dropped later by `drop_old_versions`. Returns the index opened on the published version and
+    whether it is complete: sources whose chunks were missing from the live version are left
+    out, for the next sync to ingest again.
+    """
+    client = _chroma_client()
+    live_name, version = live_version(plan.index_name)
+    if live_name != plan.base_collection:
+        raise RuntimeError(f"'{plan.index_name}' changed to '{live_name}' while the sync was prepared")
+    live = client.get_or_create_collection(name=live_name)
+    if not plan.changed and live.count() == len(plan.kept_ids):
+        # Same chunks; only source hashes can differ (e.g. a PDF that was saved again)
+        IngestionManifest(_manifest_path(live_name), plan.manifest_data).save()
+        logger.info(f"'{plan.index_name}' is up to date ({plan.stats['sources_skipped']} unchanged sources)")
+        return VectorStoreIndex.from_vector_store(ChromaVectorStore(chroma_collection=live)), True
+
+    name = f"{plan.index_name}__v{version + 1}"
+    if name in _collection_names(client):
+        # Left over from an interrupted sync; it was never published
+        client.delete_collection(name)
+    collection = client.create_collection(name=name)
+    copied = _copy_chunks(live, collection, plan.kept_ids)
+
+    manifest = IngestionManifest(_manifest_path(name), plan.manifest_data)
+    added_nodes = plan.added_nodes
+    missing = set(plan.kept_ids) - copied
+    if missing:
+        # A wiped or partly written collection: its sources are ingested again by the next sync
+        dropped = [key for key in manifest.sources if missing & set(manifest.chunk_ids(key))]
+        dropped_ids = {chunk_id for key in dropped for chunk_id in manifest.chunk_ids(key)}
+        for key in dropped:
+            del manifest.sources[key]
+        _delete_ids(collection, sorted(copied & dropped_ids))
+        added_nodes = [node for node in added_nodes if node.node_id not in dropped_ids]
+        logger.warning(f"[!] '{live_name}' is missing {len(missing)} chunks of its manifest; {len(dropped)} sources are re-ingested by the next sync")
+
+    vector_store = ChromaVectorStore(chroma_collection=collection)
+    _embed_and_add(vector_store, added_nodes)
+    manifest.save()
+    # Start from the live keyword index and apply the same diff
+    sync_keyword_index(name, collection, manifest.chunk_ids(), added_nodes, plan.deleted_ids, base_name=live_name)
+    _publish_live(plan.index_name, name, version + 1)
+    logger.info(
+        f"Published '{name}' for '{plan.index_name}': {plan.stats['chunks_added']} added, {plan.stats['chunks_kept']} kept, "
+        f"{plan.stats['chunks_deleted']} deleted, {plan.stats['sources_skipped']} unchanged sources"
+    )
+    return VectorStoreIndex.from_vector_store(vector_store), not missing
+
+
+def drop_old_versions(index_name):
+    """
+    Delete the Chroma collections (with their manifests and keyword indexes) of versions older
+    than the live one. Only call it once nothing queries them any more.
+    """
+    client = _chroma_client()
+    live_name, version = live_version(index_name)
+    pattern = re.compile(rf"^{re.escape(index_name)}(?:__v(\d+))?$")
+    for name in _collection_names(client):
+        match = pattern.match(name)
+        if not match or name == live_name or int(match.group(1) or 0) >= version:
+            continue
+        client.delete_collection(name)
+        for path in (_manifest_path(name), keyword_index_path(name)):
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"Dropped '{name}', replaced by '{live_name}'")
+
+
+def open_prepared(index_name):
+    """
+    Apply the SyncPlan the maintenance worker prepared for `index_name`; None when there is none.
+    """
+    plan = prepared_for(index_name)
+    if not isinstance(plan, SyncPlan):
+        return None
+    index, complete = apply_sync(plan)
+    if not complete:
+        raise RuntimeError(f"'{index_name}' was missing chunks; they are ingested again by the next refresh")
+    return index
+
+
+def sync_collection(index_name, sources, chunker=None):
+    """
+    Bring the Chroma collection `index_name` in line with `sources`, embedding only new or
+    changed chunks, and return an index opened on the collection. `chunker` splits each
+    source's pages into nodes (the Settings node parser by default). Changes are written to a
+    new version of the collection, which replaces the live one only once it is complete.
+    """
+    for _ in range(2):
+        index, complete = apply_sync(plan_sync(index_name, sources, chunker))
+        if complete:
+            break
+    # The replaced version may still serve requests (here or in another worker); it is dropped
+    # by `drop_old_versions` once a swap has had time to drain them
+    return index
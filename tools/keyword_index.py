@@ -0,0 +1,265 @@
+import os
+import re
+import math
+import pickle
+import asyncio
+import logging
+from collections import Counter
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode, MetadataMode
+import config
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Bump when tokenization or the on-disk layout changes
+KEYWORD_INDEX_VERSION = 2
+
+# Metadata shown to the LLM for keyword-only hits; the rest (file details, Chroma internals) is hidden
+LLM_METADATA_KEYS = ("source", "file_name", "page_label", "clause", "clause_title")
+
+# Identifier-aware tokens: keeps "DRB.UEThpDl", "E2SM-KPM" or "ran_parameter_id" whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        # Also index the parts of compound identifiers so "UEThpDl" matches "DRB.UEThpDl"
+        parts = re.split(r"[._\-/]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def keyword_index_path(index_name):
+    return os.path.join(config.CHROMA_DB_PATH, "keyword", f"{index_name}.pkl")
+
+
+class KeywordIndex:
+    """
+    Persistent inverted index with BM25 scoring. Stores node text and metadata so keyword hits
+    can be returned without touching the vector store, and supports incremental add/remove.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = {}
+        self.texts = {}
+        self.metadata = {}
+        self.total_length = 0
+
+    @property
+    def ids(self):
+        return set(self.doc_lengths)
+
+    def add(self, node_id, text, metadata=None):
+        if node_id in self.doc_lengths:
+            self.remove([node_id])
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[node_id] = frequency
+        length = sum(counts.values())
+        self.doc_lengths[node_id] = length
+        self.total_length += length
+        self.texts[node_id] = text
+        self.metadata[node_id] = metadata or {}
+
+    def add_nodes(self, nodes):
+        for node in nodes:
+            self.add(node.node_id, node.get_content(metadata_mode=MetadataMode.NONE), node.metadata)
+
+    def remove(self, node_ids):
+        for node_id in node_ids:
+            length = self.doc_lengths.pop(node_id, None)
+            if length is None:
+                continue
+            self.total_length -= length
+            for term in set(tokenize(self.texts.pop(node_id, ""))):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(node_id, None)
+                    if not postings:
+                        del self.postings[term]
+            self.metadata.pop(node_id, None)
+
+    def search(self, query, top_k=5):
+        if not self.doc_lengths:
+            return []
+        document_count = len(self.doc_lengths)
+        average_length = self.total_length / document_count or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for node_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[node_id] / average_length)
+                scores[node_id] = scores.get(node_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def sections(self):
+        # {section_id: [(position, chunk_index, node_id)]} for chunks that belong to a clause section
+        children = {}
+        for node_id, metadata in self.metadata.items():
+            section_id = (metadata or {}).get("section_id")
+            if section_id:
+                children.setdefault(section_id, []).append((metadata.get("position", 0), metadata.get("chunk_index", 0), node_id))
+        return children
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": KEYWORD_INDEX_VERSION, "index": self.__dict__}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # Local, self-written file; returns None when missing, unreadable or from an older format
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"[!] Ignoring unreadable keyword index {path}: {str(e)}")
+            return None
+        if data.get("version") != KEYWORD_INDEX_VERSION:
+            return None
+        index = cls()
+        index.__dict__.update(data["index"])
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, batch_size=1000):
+        # Rebuild from the texts already stored in Chroma; no embedding calls needed
+        index = cls()
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            for node_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                # Skip the serialized node Chroma keeps in metadata; the text is stored separately
+                metadata = {key: value for key, value in (metadata or {}).items() if not key.startswith("_")}
+                index.add(node_id, text or "", metadata)
+            offset += len(batch["ids"])
+        return index
+
+    @classmethod
+    def from_docstore(cls, docstore):
+        index = cls()
+        index.add_nodes(docstore.docs.values())
+        return index
+
+
+def sync_keyword_index(index_name, collection, expected_ids, added_nodes, deleted_ids, base_name=None):
+    """
+    Apply an ingestion diff to the on-disk keyword index for `index_name` (starting from the one
+    of `base_name` when given, e.g. the previous collection version), rebuilding it from the
+    Chroma collection when it is missing or does not match `expected_ids`.
+    """
+    path = keyword_index_path(index_name)
+    keyword_index = KeywordIndex.load(keyword_index_path(base_name or index_name))
+    if keyword_index is not None:
+        keyword_index.remove(deleted_ids)
+        keyword_index.add_nodes(added_nodes)
+    if keyword_index is None or keyword_index.ids != set(expected_ids):
+        logger.info(f"Rebuilding keyword index for '{index_name}' from Chroma")
+        keyword_index = KeywordIndex.from_collection(collection)
+    elif not added_nodes and not deleted_ids and base_name in (None, index_name):
+        return keyword_index
+    keyword_index.save(path)
+    return keyword_index
+
+
+def keyword_index_for(index):
+    # Chroma-backed indexes have a persisted keyword index; in-memory ones are built from their nodes
+    collection = getattr(index.vector_store, "client", None)
+    if collection is not None and hasattr(collection, "count"):
+        path = keyword_index_path(collection.name)
+        keyword_index = KeywordIndex.load(path)
+        if keyword_index is None or len(keyword_index.ids) != collection.count():
+            logger.info(f"Rebuilding keyword index for '{collection.name}' from Chroma")
+            keyword_index = KeywordIndex.from_collection(collection)
+            keyword_index.save(path)
+        return keyword_index
+    if getattr(index.vector_store, "keyword_index", None) is not None:
+        # Packed stores persist their postings next to the vectors and map them
+        return index.vector_store.keyword_index
+    if getattr(index.vector_store, "stores_text", False):
+        # In-process stores that were written to hold the nodes themselves; the docstore is empty
+        keyword_index = KeywordIndex()
+        keyword_index.add_nodes(index.vector_store.get_nodes())
+        return keyword_index
+    return KeywordIndex.from_docstore(index.docstore)
+
+
+class KeywordRetriever(BaseRetriever):
+    """
+    BM25 retriever over a KeywordIndex.
+    """
+
+    def __init__(self, keyword_index, similarity_top_k=5, **kwargs):
+        super().__init__(**kwargs)
+        self._keyword_index = keyword_index
+        self._similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle):
+        results = []
+        for node_id, score in self._keyword_index.search(query_bundle.query_str, self._similarity_top_k):
+            metadata = dict(self._keyword_index.metadata.get(node_id) or {})
+            node = TextNode(
+                id_=node_id,
+                text=self._keyword_index.texts[node_id],
+                metadata=metadata,
+                excluded_embed_metadata_keys=[key for key in metadata if key not in LLM_METADATA_KEYS],
+                excluded_llm_metadata_keys=[key for key in metadata if key not in LLM_METADATA_KEYS],
+            )
+            results.append(NodeWithScore(node=node, score=score))
+        return results
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses a dense retriever and a keyword retriever with reciprocal rank fusion.
+    """
+
+    def __init__(self, vector_retriever, keyword_retriever, similarity_top_k=5, rrf_k=60, **kwargs):
+        super().__init__(**kwargs)
+        self._vector_retriever = vector_retriever
+        self._keyword_retriever = keyword_retriever
+        self._similarity_top_k = similarity_top_k
+        self._rrf_k = rrf_k
+
+    def _fuse(self, result_lists):
+        fused, nodes = {}, {}
+        for results in result_lists:
+            for rank, result in enumerate(results):
+                node_id = result.node.node_id
+                fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (self._rrf_k + rank + 1)
+                nodes.setdefault(node_id, result.node)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:self._similarity_top_k]
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in ranked]
+
+    def _retrieve(self, query_bundle):
+        return self._fuse([self._vector_retriever.retrieve(query_bundle), self._keyword_retriever.retrieve(query_bundle)])
+
+    async def _aretrieve(self, query_bundle):
+        vector_results, keyword_results = await asyncio.gather(
+            self._vector_retriever.aretrieve(query_bundle),
+            asyncio.to_thread(self._keyword_retriever.retrieve, query_bundle),
+        )
+        return self._fuse([vector_results, keyword_results])
+
+
+def hybrid_retriever(index, vector_retriever=None, similarity_top_k=5, keyword_index=None):
+    vector_retriever = vector_retriever or index.as_retriever(similarity_top_k=similarity_top_k)
+    keyword_retriever = KeywordRetriever(keyword_index or keyword_index_for(index), similarity_top_k=similarity_top_k)
+    return HybridRetriever(vector_retriever, keyword_retriever, similarity_top_k=similarity_top_k)
@@ -0,0 +1,535 @@
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+from pydantic import PrivateAttr
+from llama_index.core.llms import LLM
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.utils import get_tokenizer
+from tools.metrics import METRICS, _token_usage
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Lower numbers are served first; interactive requests use the default, batches run at BATCH_PRIORITY
+DEFAULT_PRIORITY = 0
+BATCH_PRIORITY = 10
+
+_current_priority = contextvars.ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+
+# Error types worth retrying (openai/httpx names, matched by name so neither has to be imported)
+RETRYABLE_ERRORS = {
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "TimeoutException", "ConnectError", "ConnectTimeout", "ReadTimeout", "RemoteProtocolError",
+}
+
+
+@contextmanager
+def llm_priority(priority):
+    # Priority for every LLM call made in this context (and the tasks/threads it starts)
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error):
+    status = _status_code(error)
+    if status in (408, 409, 429) or (isinstance(status, int) and status >= 500):
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMDispatcher:
+    """
+    Priority queue in front of a rate-limited endpoint. A caller gets a slot when it is at the
+    head of the queue, fewer than `max_concurrency` calls are running, and the call fits the
+    requests-per-minute and tokens-per-minute budgets of the last 60 seconds.
+    Threads wait in `acquire`; coroutines wait in `aacquire` on their event loop, so queued async
+    calls never hold a thread of the default executor.
+    """
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=4):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._active = 0
+        # [timestamp, tokens] per call started in the last minute
+        self._window = deque()
+        self._cooldown_until = 0.0
+        # (loop, event) of every coroutine waiting in aacquire
+        self._async_waiters = set()
+
+    def _notify(self):
+        # Called with the lock held: wake waiting threads and coroutines
+        self._cond.notify_all()
+        for loop, event in list(self._async_waiters):
+            loop.call_soon_threadsafe(event.set)
+
+    def _prune(self, now):
+        while self._window and self._window[0][0] <= now - 60:
+            self._window.popleft()
+
+    def _budget_wait(self, tokens, now):
+        waits = [self._cooldown_until - now]
+        if self.rpm and len(self._window) >= self.rpm:
+            waits.append(self._window[len(self._window) - self.rpm][0] + 60 - now)
+        if self.tpm and self._window:
+            excess = sum(used for _, used in self._window) + tokens - self.tpm
+            # Wait until enough of the oldest calls leave the window
+            for started, used in self._window:
+                if excess <= 0:
+                    break
+                excess -= used
+                waits.append(started + 60 - now)
+        return max(0.0, *waits)
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def estimated_wait(self, tokens):
+        with self._cond:
+            now = time.monotonic()
+            self._prune(now)
+            return self._budget_wait(tokens, now)
+
+    def _grant(self, ticket, tokens, now):
+        # Called with the lock held: a usage record when `ticket` may start now, else how long to
+        # wait before checking again (0 when only a release can unblock it)
+        self._prune(now)
+        wait = self._budget_wait(tokens, now)
+        if self._queue[0] == ticket and self._active < self.max_concurrency and wait == 0:
+            heapq.heappop(self._queue)
+            self._active += 1
+            record = [now, tokens]
+            self._window.append(record)
+            self._notify()
+            return record, 0.0
+        return None, wait
+
+    def _abandon(self, ticket):
+        # Called with the lock held
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._notify()
+
+    def acquire(self, tokens, priority=DEFAULT_PRIORITY, timeout=None):
+        """
+        Wait for a slot; returns a usage record to pass to `release`, or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            while True:
+                now = time.monotonic()
+                record, wait = self._grant(ticket, tokens, now)
+                if record is not None:
+                    return record
+                if deadline is not None and now >= deadline:
+                    self._abandon(ticket)
+                    return None
+                timeout_left = None if deadline is None else deadline - now
+                step = wait if wait > 0 else 1.0
+                self._cond.wait(step if timeout_left is None else min(step, timeout_left))
+
+    async def aacquire(self, tokens, priority=DEFAULT_PRIORITY, timeout=None):
+        """
+        Coroutine version of `acquire`: waits on the event loop instead of blocking a thread.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = (priority, next(self._sequence))
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    record, wait = self._grant(ticket, tokens, now)
+                    if record is not None:
+                        return record
+                    if deadline is not None and now >= deadline:
+                        return None
+                    waiter[1].clear()
+                step = wait if wait > 0 else 1.0
+                if deadline is not None:
+                    step = min(step, deadline - now)
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), step)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Also runs when the waiting request is cancelled
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                self._abandon(ticket)
+
+    def release(self, record, tokens=None):
+        with self._cond:
+            self._active -= 1
+            if tokens is not None:
+                # Replace the estimate with the usage reported by the API
+                record[1] = tokens
+            self._notify()
+
+    def cooldown(self, seconds):
+        # Pause all calls, e.g. after a 429 with Retry-After
+        with self._cond:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+            self._notify()
+
+    def status(self):
+        with self._cond:
+            now = time.monotonic()
+            self._prune(now)
+            return {
+                "queue_depth": len(self._queue),
+                "active": self._active,
+                "requests_last_minute": len(self._window),
+                "tokens_last_minute": sum(used for _, used in self._window),
+                "cooldown_seconds": round(max(0.0, self._cooldown_until - now), 2),
+                "rpm_limit": self.rpm,
+                "tpm_limit": self.tpm,
+            }
+
+
+class ScheduledLLM(LLM):
+    """
+    LLM used as Settings.llm: every call to the primary (Groq) model goes through an
+    LLMDispatcher, retryable errors (429, timeouts, 5xx) are retried with exponential backoff,
+    and a call fails over to the fallback (local Ollama) model when the primary is saturated,
+    its queue wait exceeds `failover_wait` seconds, or the retries are exhausted. Failover only
+    happens while `fallback_check` reports the fallback reachable (checked at most every
+    `fallback_check_interval` seconds); otherwise calls keep waiting for the primary.
+    Streaming calls only fail over before the first token.
+    """
+
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 20.0
+    failover_wait: float = 5.0
+    max_queue: int = 64
+    expected_output_tokens: int = 512
+    fallback_check_interval: float = 30.0
+
+    _primary: Any = PrivateAttr()
+    _fallback: Any = PrivateAttr(default=None)
+    _fallback_factory: Optional[Callable] = PrivateAttr(default=None)
+    _fallback_lock: Any = PrivateAttr()
+    _fallback_check: Optional[Callable] = PrivateAttr(default=None)
+    _fallback_alive: bool = PrivateAttr(default=True)
+    _fallback_checked_at: float = PrivateAttr(default=float("-inf"))
+    _dispatcher: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _counters: dict = PrivateAttr()
+
+    def __init__(self, primary, dispatcher, fallback=None, fallback_factory=None, fallback_check=None, **kwargs):
+        super().__init__(**kwargs)
+        self._primary = primary
+        self._fallback = fallback
+        self._fallback_factory = fallback_factory
+        self._fallback_check = fallback_check
+        self._fallback_lock = threading.Lock()
+        self._dispatcher = dispatcher
+        self._tokenizer = get_tokenizer()
+        self._counters = {"primary_calls": 0, "fallback_calls": 0, "retries": 0, "failovers": {}}
+
+    @classmethod
+    def class_name(cls):
+        return "ScheduledLLM"
+
+    @property
+    def metadata(self):
+        return self._primary.metadata
+
+    @property
+    def dispatcher(self):
+        return self._dispatcher
+
+    def status(self):
+        counters = {**self._counters, "failovers": dict(self._counters["failovers"])}
+        return {
+            **self._dispatcher.status(), **counters,
+            "fallback_available": self._has_fallback(),
+            "fallback_reachable": self._has_fallback() and self._fallback_alive,
+        }
+
+    # --- helpers ---
+
+    def _has_fallback(self):
+        return self._fallback is not None or self._fallback_factory is not None
+
+    def _fallback_check_due(self):
+        return self._fallback_check is not None and time.monotonic() - self._fallback_checked_at >= self.fallback_check_interval
+
+    def _check_fallback(self):
+        try:
+            alive = bool(self._fallback_check())
+        except Exception:
+            alive = False
+        if alive != self._fallback_alive:
+            logger.warning(f"[!] Fallback LLM is {'reachable again' if alive else 'unreachable, waiting for the primary instead'}")
+        self._fallback_alive = alive
+        self._fallback_checked_at = time.monotonic()
+
+    def _fallback_ready(self):
+        # A fallback exists and its last health check (cached) succeeded
+        if not self._has_fallback():
+            return False
+        if self._fallback_check_due():
+            self._check_fallback()
+        return self._fallback_alive
+
+    async def _afallback_ready(self):
+        if not self._has_fallback():
+            return False
+        if self._fallback_check_due():
+            # A short HTTP probe, at most once per check interval
+            await asyncio.to_thread(self._check_fallback)
+        return self._fallback_alive
+
+    def _get_fallback(self):
+        with self._fallback_lock:
+            if self._fallback is None and self._fallback_factory is not None:
+                self._fallback = self._fallback_factory()
+            return self._fallback
+
+    def _estimate_tokens(self, payload, kwargs):
+        text = payload if isinstance(payload, str) else "\n".join(str(m.content or "") for m in payload)
+        return len(self._tokenizer(text)) + int(kwargs.get("max_tokens") or self.expected_output_tokens)
+
+    def _saturated(self, tokens):
+        if self._dispatcher.queue_depth() >= self.max_queue:
+            return "queue_full"
+        if self._dispatcher.estimated_wait(tokens) > self.failover_wait:
+            return "rate_limited"
+        return None
+
+    def _route(self, tokens):
+        # Returns a dispatcher record for the primary, or a failover reason
+        priority = _current_priority.get()
+        if self._fallback_ready():
+            reason = self._saturated(tokens)
+            if reason:
+                return None, reason
+            record = self._dispatcher.acquire(tokens, priority, timeout=self.failover_wait)
+            if record is not None:
+                return record, None
+            if self._fallback_ready():
+                return None, "queue_timeout"
+        # No reachable fallback: wait for the primary
+        return self._dispatcher.acquire(tokens, priority), None
+
+    async def _aroute(self, tokens):
+        priority = _current_priority.get()
+        if await self._afallback_ready():
+            reason = self._saturated(tokens)
+            if reason:
+                return None, reason
+            record = await self._dispatcher.aacquire(tokens, priority, timeout=self.failover_wait)
+            if record is not None:
+                return record, None
+            if await self._afallback_ready():
+                return None, "queue_timeout"
+        return await self._dispatcher.aacquire(tokens, priority), None
+
+    def _backoff(self, attempt, error):
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * (0.5 + random.random() / 2)
+        if _status_code(error) == 429:
+            self._dispatcher.cooldown(delay)
+        self._counters["retries"] += 1
+        METRICS.increment("llm_retries")
+        return delay
+
+    def _used_tokens(self, response):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        if prompt_tokens is None or completion_tokens is None:
+            return None
+        return prompt_tokens + completion_tokens
+
+    def _failover(self, reason, error=None, ready=True):
+        if not ready:
+            raise error
+        self._counters["failovers"][reason] = self._counters["failovers"].get(reason, 0) + 1
+        self._counters["fallback_calls"] += 1
+        METRICS.increment("llm_failovers", {"reason": reason})
+        logger.warning(f"[!] Failing over to the fallback LLM ({reason}{': ' + str(error) if error else ''})")
+        return self._get_fallback()
+
+    # --- dispatch ---
+
+    def _call(self, method, payload, **kwargs):
+        tokens = self._estimate_tokens(payload, kwargs)
+        record, reason = self._route(tokens)
+        error = None
+        if record is not None:
+            used = None
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self._counters["primary_calls"] += 1
+                        response = getattr(self._primary, method)(payload, **kwargs)
+                        used = self._used_tokens(response)
+                        return response
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        error = e
+                        if attempt < self.max_retries:
+                            time.sleep(self._backoff(attempt, e))
+            finally:
+                self._dispatcher.release(record, used)
+            return getattr(self._failover("errors", error, self._fallback_ready()), method)(payload, **kwargs)
+        return getattr(self._failover(reason), method)(payload, **kwargs)
+
+    async def _acall(self, method, payload, **kwargs):
+        tokens = self._estimate_tokens(payload, kwargs)
+        record, reason = await self._aroute(tokens)
+        error = None
+        if record is not None:
+            used = None
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self._counters["primary_calls"] += 1
+                        response = await getattr(self._primary, method)(payload, **kwargs)
+                        used = self._used_tokens(response)
+                        return response
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        error = e
+                        if attempt < self.max_retries:
+                            await asyncio.sleep(self._backoff(attempt, e))
+            finally:
+                self._dispatcher.release(record, used)
+            return await getattr(self._failover("errors", error, await self._afallback_ready()), method)(payload, **kwargs)
+        return await getattr(self._failover(reason), method)(payload, **kwargs)
+
+    def _stream(self, method, payload, **kwargs):
+        # Retries and failover happen before the first chunk; later errors reach the caller
+        tokens = self._estimate_tokens(payload, kwargs)
+        record, reason = self._route(tokens)
+        error = None
+        if record is not None:
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self._counters["primary_calls"] += 1
+                        stream = getattr(self._primary, method)(payload, **kwargs)
+                        first = next(stream, None)
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        error = e
+                        if attempt < self.max_retries:
+                            time.sleep(self._backoff(attempt, e))
+                        continue
+                    if first is not None:
+                        yield first
+                        yield from stream
+                    return
+            finally:
+                self._dispatcher.release(record)
+            yield from getattr(self._failover("errors", error, self._fallback_ready()), method)(payload, **kwargs)
+            return
+        yield from getattr(self._failover(reason), method)(payload, **kwargs)
+
+    async def _astream(self, method, payload, **kwargs):
+        tokens = self._estimate_tokens(payload, kwargs)
+        record, reason = await self._aroute(tokens)
+        error = None
+        if record is not None:
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self._counters["primary_calls"] += 1
+                        stream = await getattr(self._primary, method)(payload, **kwargs)
+                        first = await stream.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        error = e
+                        if attempt < self.max_retries:
+                            await asyncio.sleep(self._backoff(attempt, e))
+                        continue
+                    yield first
+                    async for chunk in stream:
+                        yield chunk
+                    return
+            finally:
+                self._dispatcher.release(record)
+            fallback = self._failover("errors", error, await self._afallback_ready())
+        else:
+            fallback = self._failover(reason)
+        async for chunk in await getattr(fallback, method)(payload, **kwargs):
+            yield chunk
+
+    # --- LLM interface ---
+
+    @llm_chat_callback()
+    def chat(self, messages, **kwargs):
+        return self._call("chat", messages, **kwargs)
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        return self._call("complete", prompt, formatted=formatted, **kwargs)
+
+    @llm_chat_callback()
+    def stream_chat(self, messages, **kwargs):
+        return self._stream("stream_chat", messages, **kwargs)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        return self._stream("stream_complete", prompt, formatted=formatted, **kwargs)
+
+    @llm_chat_callback()
+    async def achat(self, messages, **kwargs):
+        return await self._acall("achat", messages, **kwargs)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        return await self._acall("acomplete", prompt, formatted=formatted, **kwargs)
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages, **kwargs):
+        return self._astream("astream_chat", messages, **kwargs)
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt, formatted=False, **kwargs):
+        return self._astream("astream_complete", prompt, formatted=formatted, **kwargs)
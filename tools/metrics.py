@@ -0,0 +1,208 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from llama_index.core import Settings
+from llama_index.core.callbacks import CallbackManager, CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds, from a cached embedding lookup up to a cold index build
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Per-request trace: a list of stage records, or None outside a traced request
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+
+
+class MetricsRegistry:
+    """
+    Process-wide stage timings and counters, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, prefix="oran"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._histograms.setdefault(stage, Histogram()).observe(seconds)
+
+    def increment(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self, gauges=None):
+        # Prometheus text exposition format
+        name = f"{self.prefix}_stage_duration_seconds"
+        lines = [f"# HELP {name} Time spent in each pipeline stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                # Bucket counts are already cumulative
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+            counter_names = sorted({counter for counter, _ in self._counters})
+            for counter in counter_names:
+                full_name = f"{self.prefix}_{counter}_total"
+                lines.append(f"# TYPE {full_name} counter")
+                for (key_name, labels), value in sorted(self._counters.items()):
+                    if key_name == counter:
+                        lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+        for gauge, value in sorted((gauges or {}).items()):
+            full_name = f"{self.prefix}_{gauge}"
+            lines.append(f"# TYPE {full_name} gauge")
+            lines.append(f"{full_name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+def start_trace():
+    # Begin collecting stage records for the current request (and the tasks it spawns)
+    trace = []
+    _current_trace.set(trace)
+    return trace
+
+
+def record(stage, seconds, **details):
+    METRICS.observe(stage, seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append({"stage": stage, "seconds": round(seconds, 4), **details})
+
+
+def trace_usage(trace):
+    # Token totals of one request: LLM prompt/completion tokens and context tokens before/after compression
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "context_tokens_retrieved": 0, "context_tokens_sent": 0}
+    for entry in trace or []:
+        usage["prompt_tokens"] += entry.get("prompt_tokens") or 0
+        usage["completion_tokens"] += entry.get("completion_tokens") or 0
+        usage["context_tokens_retrieved"] += entry.get("context_tokens_before") or 0
+        usage["context_tokens_sent"] += entry.get("context_tokens_after") or 0
+    return usage
+
+
+@contextmanager
+def stage_timer(stage, **details):
+    started = time.perf_counter()
+    try:
+        yield details
+    finally:
+        record(stage, time.perf_counter() - started, **details)
+
+
+def _token_usage(response):
+    # Groq (OpenAI-compatible) responses carry usage in additional_kwargs or in the raw payload
+    if response is None:
+        return None, None
+    extra = getattr(response, "additional_kwargs", None) or {}
+    if "prompt_tokens" in extra:
+        return extra.get("prompt_tokens"), extra.get("completion_tokens")
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None, None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LlamaIndex callback handler that times embedding, vector search, LLM and synthesis events
+    and counts LLM prompt/completion tokens.
+    """
+
+    STAGES = {
+        CBEventType.EMBEDDING: "embed",
+        CBEventType.RETRIEVE: "vector_search",
+        CBEventType.LLM: "llm",
+        CBEventType.SYNTHESIZE: "synthesis",
+    }
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+        if event_type in self.STAGES:
+            with self._lock:
+                self._events[event_id] = {"started": time.perf_counter(), "parent_id": parent_id, "child_embed": 0.0}
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+        if event_type not in self.STAGES:
+            return
+        with self._lock:
+            event = self._events.pop(event_id, None)
+            if event is None:
+                return
+            seconds = time.perf_counter() - event["started"]
+            parent = self._events.get(event["parent_id"])
+            if event_type == CBEventType.EMBEDDING and parent is not None:
+                parent["child_embed"] += seconds
+
+        details = {}
+        if event_type == CBEventType.RETRIEVE:
+            # Query embedding inside the retriever is reported as its own stage
+            seconds = max(0.0, seconds - event["child_embed"])
+        elif event_type == CBEventType.LLM and payload:
+            prompt_tokens, completion_tokens = _token_usage(payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION))
+            if prompt_tokens is not None:
+                METRICS.increment("llm_tokens", {"kind": "prompt"}, prompt_tokens)
+                details["prompt_tokens"] = prompt_tokens
+            if completion_tokens is not None:
+                METRICS.increment("llm_tokens", {"kind": "completion"}, completion_tokens)
+                details["completion_tokens"] = completion_tokens
+            METRICS.increment("llm_calls")
+        record(self.STAGES[event_type], seconds, **details)
+
+    def start_trace(self, trace_id=None):
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None):
+        pass
+
+
+callback_handler = MetricsCallbackHandler()
+
+
+def install():
+    # Attach the handler to the global callback manager used by indexes, retrievers and LLMs
+    manager = Settings.callback_manager
+    if callback_handler not in manager.handlers:
+        Settings.callback_manager = CallbackManager([*manager.handlers, callback_handler])
@@ -0,0 +1,451 @@
+import os
+import json
+import glob
+import math
+import logging
+import numpy as np
+from collections import Counter
+from collections.abc import Mapping
+from typing import Any, List, Optional
+from pydantic import PrivateAttr
+from llama_index.core import VectorStoreIndex, StorageContext
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQueryResult
+from llama_index.core.vector_stores.utils import node_to_metadata_dict, metadata_dict_to_node
+from llama_index.core.schema import MetadataMode
+import config
+from tools.ingestion import embed_nodes
+from tools.keyword_index import tokenize
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes so old files are rebuilt
+PACKED_STORE_VERSION = 2
+
+# Rows of an int8 matrix converted to float32 at a time while scoring a query
+SCORE_BLOCK_ROWS = 4096
+
+
+def packed_index_dir():
+    return os.path.join(config.CHROMA_DB_PATH, "packed")
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _quantize(matrix):
+    # Symmetric int8 per row: row ≈ codes * scale
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class _NodeFieldView(Mapping):
+    # Read-only {node_id: text or metadata} over a packed store's records, decoded on access
+    def __init__(self, store, field):
+        self._store = store
+        self._field = field
+
+    def __getitem__(self, node_id):
+        row = self._store._row(node_id)
+        if row is None:
+            raise KeyError(node_id)
+        node = self._store._node(row)
+        return node.get_content(metadata_mode=MetadataMode.NONE) if self._field == "text" else node.metadata
+
+    def __iter__(self):
+        return iter(self._store._ids)
+
+    def __len__(self):
+        return len(self._store._ids)
+
+
+class PackedKeywordIndex:
+    """
+    BM25 over a persisted packed store, with the same search interface as KeywordIndex. The
+    postings are flat arrays written next to the vectors under the same fingerprint (a sorted
+    term table, each term's slice of document rows and frequencies, and one length per row),
+    so they are mapped read-only and shared between workers like the matrix. Texts and metadata
+    are read from the store's records for the hits only.
+    """
+
+    def __init__(self, store, terms, term_offsets, posting_offsets, rows, frequencies, lengths, total_length, sections, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.total_length = total_length
+        self._store = store
+        self._terms = terms
+        self._term_offsets = term_offsets
+        self._posting_offsets = posting_offsets
+        self._rows = rows
+        self._frequencies = frequencies
+        self._lengths = lengths
+        self._sections = sections
+        self.texts = _NodeFieldView(store, "text")
+        self.metadata = _NodeFieldView(store, "metadata")
+
+    @property
+    def ids(self):
+        return set(self._store._ids)
+
+    @property
+    def nbytes(self):
+        # Size of the term table, postings and document lengths (mapped)
+        arrays = (self._terms, self._term_offsets, self._posting_offsets, self._rows, self._frequencies, self._lengths)
+        return sum(array.nbytes for array in arrays)
+
+    @staticmethod
+    def build(records):
+        """
+        Flat postings for node records (in row order) as a dict of arrays plus the total length
+        and section map that go into the store's meta file.
+        """
+        postings, lengths, sections = {}, [], {}
+        for row, record in enumerate(records):
+            node = metadata_dict_to_node(json.loads(record))
+            counts = Counter(tokenize(node.get_content(metadata_mode=MetadataMode.NONE)))
+            for term, frequency in counts.items():
+                postings.setdefault(term.encode("utf-8"), []).append((row, frequency))
+            lengths.append(sum(counts.values()))
+            section_id = node.metadata.get("section_id")
+            if section_id:
+                sections.setdefault(section_id, []).append((node.metadata.get("position", 0), node.metadata.get("chunk_index", 0), row))
+
+        # Terms sorted by their UTF-8 bytes, so a lookup is a binary search over the mapped table
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(term) for term in terms])
+        posting_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        posting_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = [item for term in terms for item in postings[term]]
+        arrays = {
+            "terms": np.frombuffer(b"".join(terms), dtype=np.uint8),
+            "term_offsets": term_offsets,
+            "posting_offsets": posting_offsets,
+            "rows": np.asarray([row for row, _ in flat], dtype=np.int32),
+            "frequencies": np.asarray([frequency for _, frequency in flat], dtype=np.int32),
+            "lengths": np.asarray(lengths, dtype=np.int32),
+        }
+        meta = {"total_length": int(sum(lengths)), "sections": {key: sorted(value) for key, value in sections.items()}}
+        return arrays, meta
+
+    def _term_id(self, term):
+        # Binary search over the sorted term table without decoding it
+        key = term.encode("utf-8")
+        low, high = 0, len(self._term_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._terms[self._term_offsets[middle]:self._term_offsets[middle + 1]].tobytes() < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._term_offsets) - 1 and self._terms[self._term_offsets[low]:self._term_offsets[low + 1]].tobytes() == key:
+            return low
+        return None
+
+    def search(self, query, top_k=5):
+        document_count = len(self._lengths)
+        if not document_count:
+            return []
+        average_length = self.total_length / document_count or 1.0
+        scores = np.zeros(document_count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term)
+            if term_id is None:
+                continue
+            start, end = self._posting_offsets[term_id], self._posting_offsets[term_id + 1]
+            rows = self._rows[start:end]
+            frequencies = self._frequencies[start:end].astype(np.float32)
+            idf = math.log(1 + (document_count - (end - start) + 0.5) / ((end - start) + 0.5))
+            norms = self.k1 * (1 - self.b + self.b * self._lengths[rows] / average_length)
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norms)
+        hits = np.nonzero(scores)[0]
+        top = hits[np.argsort(-scores[hits], kind="stable")][:top_k]
+        return [(self._store._ids[row], float(scores[row])) for row in top]
+
+    def sections(self):
+        return {
+            section_id: [(position, chunk_index, self._store._ids[row]) for position, chunk_index, row in children]
+            for section_id, children in self._sections.items()
+        }
+
+
+class PackedVectorStore(BasePydanticVectorStore):
+    """
+    In-process vector store that keeps all embeddings in one contiguous, L2-normalized NumPy
+    matrix (float32, or int8 with a scale per row when `quantize` is set) and scores a query
+    against every row with a single matrix-vector product. Node text and metadata are kept as
+    serialized records next to the matrix instead of as node objects.
+
+    `persist` writes the matrix, the records and their offsets to flat files, together with the
+    BM25 postings of the records; `load` maps them read-only, so every worker process on the host
+    shares the same pages instead of holding its own copy, and nothing is re-embedded or
+    re-tokenized on startup.
+    """
+
+    stores_text: bool = True
+    is_embedding_query: bool = True
+    flat_metadata: bool = False
+    quantize: bool = False
+
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _vectors: Any = PrivateAttr(default=None)
+    _scales: Any = PrivateAttr(default=None)
+    _records: Any = PrivateAttr(default=None)
+    _offsets: Any = PrivateAttr(default=None)
+    # Rows added since the matrix was last packed, as (id, ref_doc_id, embedding, record bytes)
+    _pending: list = PrivateAttr(default_factory=list)
+    _deleted: set = PrivateAttr(default_factory=set)
+    _rows_by_id: Any = PrivateAttr(default=None)
+    _keyword_index: Any = PrivateAttr(default=None)
+    _fingerprint: Optional[str] = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls):
+        return "PackedVectorStore"
+
+    @property
+    def keyword_index(self):
+        # The mapped PackedKeywordIndex of a loaded store; None once the store is written to
+        return self._keyword_index
+
+    @property
+    def fingerprint(self):
+        # Fingerprint the mapped files were built for; None for a store that was not loaded
+        return self._fingerprint
+
+    @property
+    def client(self):
+        return None
+
+    def __len__(self):
+        self._pack()
+        return len(self._ids) - len(self._deleted)
+
+    @property
+    def nbytes(self):
+        # Size of the matrix, scales and serialized records (mapped or in memory)
+        arrays = (self._vectors, self._scales, self._records, self._offsets)
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    # --- writes ---
+
+    def add(self, nodes, **add_kwargs):
+        for node in nodes:
+            record = node_to_metadata_dict(node, remove_text=False, flat_metadata=self.flat_metadata)
+            self._pending.append((node.node_id, node.ref_doc_id, node.get_embedding(), json.dumps(record).encode("utf-8")))
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        self._pack()
+        self._deleted.update(row for row, doc_id in enumerate(self._ref_doc_ids) if doc_id == ref_doc_id)
+
+    def _pack(self, compact=False):
+        # Fold pending rows into fresh arrays (and with `compact`, drop deleted rows); a mapped
+        # store becomes an in-memory copy once it is written to
+        if not self._pending and not (compact and self._deleted):
+            return
+        keep = [row for row in range(len(self._ids)) if row not in self._deleted]
+        ids = [self._ids[row] for row in keep] + [item[0] for item in self._pending]
+        ref_doc_ids = [self._ref_doc_ids[row] for row in keep] + [item[1] for item in self._pending]
+        records = [self._record_bytes(row) for row in keep] + [item[3] for item in self._pending]
+
+        dim = self._vectors.shape[1] if self._vectors is not None else len(self._pending[0][2])
+        added = np.zeros((0, dim), dtype=np.float32)
+        if self._pending:
+            added = _normalize(np.asarray([item[2] for item in self._pending], dtype=np.float32))
+        matrix = np.concatenate([self._float_rows(keep), added]) if keep else added
+        if self.quantize:
+            self._vectors, self._scales = _quantize(matrix)
+        else:
+            self._vectors, self._scales = np.ascontiguousarray(matrix, dtype=np.float32), None
+
+        self._offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        self._offsets[1:] = np.cumsum([len(record) for record in records])
+        self._records = np.frombuffer(b"".join(records), dtype=np.uint8)
+        self._ids, self._ref_doc_ids = ids, ref_doc_ids
+        self._pending, self._deleted = [], set()
+        self._rows_by_id, self._keyword_index, self._fingerprint = None, None, None
+
+    def _float_rows(self, rows):
+        rows = np.asarray(rows)
+        if self._scales is None:
+            return np.asarray(self._vectors[rows], dtype=np.float32)
+        return self._vectors[rows].astype(np.float32) * self._scales[rows, None]
+
+    def _record_bytes(self, row):
+        return self._records[self._offsets[row]:self._offsets[row + 1]].tobytes()
+
+    # --- reads ---
+
+    def _row(self, node_id):
+        if self._rows_by_id is None:
+            self._rows_by_id = {node_id: row for row, node_id in enumerate(self._ids)}
+        return self._rows_by_id.get(node_id)
+
+    def _node(self, row):
+        record = json.loads(self._record_bytes(row))
+        return metadata_dict_to_node(record)
+
+    def get_nodes(self, node_ids=None, filters=None, **kwargs):
+        if filters is not None:
+            raise ValueError("Metadata filters are not supported by PackedVectorStore")
+        self._pack()
+        wanted = set(node_ids) if node_ids is not None else None
+        return [
+            self._node(row) for row, node_id in enumerate(self._ids)
+            if row not in self._deleted and (wanted is None or node_id in wanted)
+        ]
+
+    def iter_embeddings(self):
+        # (metadata, normalized embedding) per stored node, e.g. for source centroids
+        self._pack()
+        for row in range(len(self._ids)):
+            if row not in self._deleted:
+                yield self._node(row).metadata, self._float_rows([row])[0]
+
+    def query(self, query, **kwargs):
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported by PackedVectorStore")
+        self._pack()
+        if self._vectors is None or not len(self._ids) or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        vector = np.asarray(query.query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        if self._scales is None:
+            scores = self._vectors @ vector
+        else:
+            # Widen the int8 codes one block at a time so a query never copies the whole matrix;
+            # the row scale turns the product back into the cosine similarity
+            scores = np.empty(len(self._ids), dtype=np.float32)
+            for start in range(0, len(scores), SCORE_BLOCK_ROWS):
+                block = slice(start, start + SCORE_BLOCK_ROWS)
+                scores[block] = (self._vectors[block].astype(np.float32) @ vector) * self._scales[block]
+
+        if self._deleted or query.node_ids:
+            scores = np.array(scores, dtype=np.float32)
+            allowed = None if not query.node_ids else set(query.node_ids)
+            for row, node_id in enumerate(self._ids):
+                if row in self._deleted or (allowed is not None and node_id not in allowed):
+                    scores[row] = -np.inf
+
+        top_k = min(query.similarity_top_k, len(scores))
+        if top_k <= 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        top = [row for row in top if np.isfinite(scores[row])]
+        return VectorStoreQueryResult(
+            nodes=[self._node(row) for row in top],
+            similarities=[float(scores[row]) for row in top],
+            ids=[self._ids[row] for row in top],
+        )
+
+    # --- persistence ---
+
+    def persist(self, persist_path, fs=None, fingerprint=None):
+        """
+        Write the store as `<persist_path>.json` plus flat array files named after the fingerprint.
+        Every file is written to a temporary name and renamed, so workers that build the same
+        index at the same time never see a partial file.
+        """
+        self._pack(compact=True)
+        directory = os.path.dirname(persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        base = f"{persist_path}-{fingerprint or 'latest'}"
+
+        def write(path, save):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                save(f)
+            os.replace(tmp_path, path)
+
+        vectors = self._vectors if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        write(f"{base}.vectors.npy", lambda f: np.save(f, vectors))
+        write(f"{base}.offsets.npy", lambda f: np.save(f, self._offsets if self._offsets is not None else np.zeros(1, dtype=np.int64)))
+        write(f"{base}.records.bin", lambda f: f.write(self._records.tobytes() if self._records is not None else b""))
+        if self._scales is not None:
+            write(f"{base}.scales.npy", lambda f: np.save(f, self._scales))
+        keyword_arrays, keyword_meta = PackedKeywordIndex.build(self._record_bytes(row) for row in range(len(self._ids)))
+        for name, array in keyword_arrays.items():
+            write(f"{base}.keyword_{name}.npy", lambda f, array=array: np.save(f, array))
+        meta = {
+            "version": PACKED_STORE_VERSION,
+            "fingerprint": fingerprint,
+            "base": os.path.basename(base),
+            "quantize": self._scales is not None,
+            "ids": self._ids,
+            "ref_doc_ids": self._ref_doc_ids,
+            "keyword": keyword_meta,
+        }
+        write(f"{persist_path}.json", lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+        # Files of older builds can go: processes that still map them keep their pages until they exit
+        for path in glob.glob(f"{glob.escape(persist_path)}-*"):
+            if not os.path.basename(path).startswith(meta["base"] + ".") and not path.endswith(".tmp"):
+                os.remove(path)
+
+    @classmethod
+    def load(cls, persist_path, fingerprint=None):
+        """
+        Map a persisted store read-only; returns None when it is missing, unreadable or was built
+        for another fingerprint.
+        """
+        try:
+            with open(f"{persist_path}.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != PACKED_STORE_VERSION or (fingerprint is not None and meta.get("fingerprint") != fingerprint):
+            return None
+
+        base = os.path.join(os.path.dirname(persist_path), meta["base"])
+        store = cls(quantize=meta["quantize"])
+        try:
+            store._vectors = np.load(f"{base}.vectors.npy", mmap_mode="r")
+            store._offsets = np.load(f"{base}.offsets.npy", mmap_mode="r")
+            store._scales = np.load(f"{base}.scales.npy", mmap_mode="r") if meta["quantize"] else None
+            store._records = np.memmap(f"{base}.records.bin", dtype=np.uint8, mode="r") if store._offsets[-1] else np.zeros(0, dtype=np.uint8)
+            keyword_arrays = {
+                name: np.load(f"{base}.keyword_{name}.npy", mmap_mode="r")
+                for name in ("terms", "term_offsets", "posting_offsets", "rows", "frequencies", "lengths")
+            }
+        except (OSError, ValueError) as e:
+            logger.warning(f"[!] Ignoring unreadable packed index {persist_path}: {str(e)}")
+            return None
+        store._ids = meta["ids"]
+        store._ref_doc_ids = meta["ref_doc_ids"]
+        store._keyword_index = PackedKeywordIndex(store, **keyword_arrays, **meta["keyword"])
+        store._fingerprint = meta["fingerprint"]
+        return store
+
+
+def packed_index(index_name, fingerprint, build_nodes, quantize=False):
+    """
+    Open the packed index `index_name` from disk when it was built for `fingerprint`; otherwise
+    embed `build_nodes()` into a new one, persist it and open the persisted copy.
+    """
+    persist_path = os.path.join(packed_index_dir(), index_name)
+    store = PackedVectorStore.load(persist_path, fingerprint)
+    if store is None:
+        store = PackedVectorStore(quantize=quantize)
+        # Embedded in large batches up front; the index then only packs the vectors
+        nodes = embed_nodes(build_nodes())
+        VectorStoreIndex(nodes, storage_context=StorageContext.from_defaults(vector_store=store))
+        store.persist(persist_path, fingerprint=fingerprint)
+        logger.info(f"Built packed index '{index_name}' ({len(store)} vectors, {'int8' if quantize else 'float32'})")
+        # Reopen through the mapping so this worker shares pages with the others
+        store = PackedVectorStore.load(persist_path, fingerprint) or store
+    else:
+        logger.info(f"Mapped packed index '{index_name}' ({len(store)} vectors) from disk")
+    return VectorStoreIndex.from_vector_store(store)
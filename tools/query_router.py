@@ -0,0 +1,117 @@
+import logging
+import numpy as np
+from tools.metrics import METRICS
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def _source_name(metadata, default_source):
+    metadata = metadata or {}
+    return metadata.get("source") or metadata.get("file_name") or default_source
+
+
+def collection_embeddings(collection, default_source, batch_size=1000):
+    # Stored chunk vectors of a Chroma collection, paired with the source they came from
+    offset = 0
+    while True:
+        batch = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        for embedding, metadata in zip(batch["embeddings"], batch["metadatas"]):
+            yield _source_name(metadata, default_source), embedding
+        offset += len(batch["ids"])
+
+
+def docstore_embeddings(index, default_source):
+    # In-memory (SimpleVectorStore) indexes keep vectors in the store and metadata in the docstore
+    embedding_dict = index.vector_store.data.embedding_dict
+    for node_id, embedding in embedding_dict.items():
+        node = index.docstore.get_node(node_id, raise_error=False)
+        yield _source_name(node.metadata if node is not None else None, default_source), embedding
+
+
+def packed_embeddings(vector_store, default_source):
+    # PackedVectorStore keeps vectors and node metadata side by side
+    for metadata, embedding in vector_store.iter_embeddings():
+        yield _source_name(metadata, default_source), embedding
+
+
+def index_embeddings(index, default_source):
+    collection = getattr(index.vector_store, "client", None)
+    if collection is not None and hasattr(collection, "count"):
+        return collection_embeddings(collection, default_source)
+    if hasattr(index.vector_store, "iter_embeddings"):
+        return packed_embeddings(index.vector_store, default_source)
+    return docstore_embeddings(index, default_source)
+
+
+def source_centroids(pairs):
+    # Normalized mean chunk embedding per source
+    sums, counts = {}, {}
+    for source, embedding in pairs:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if source in sums:
+            sums[source] += vector
+        else:
+            sums[source] = vector.copy()
+        counts[source] = counts.get(source, 0) + 1
+    centroids = {}
+    for source, total in sums.items():
+        centroid = total / counts[source]
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroids[source] = centroid / norm
+    return centroids
+
+
+class QueryRouter:
+    """
+    Routes a query to the index parts (guidelines, web) whose sources are close to it. Each source
+    (a PDF or a crawled page) is represented by the centroid of its chunk embeddings; a part is
+    queried when any of its sources scores at least `threshold` against the query embedding.
+    Sources are scored individually but dispatch is per part: a queried part is searched across
+    all of its sources (the packed store has no metadata filters to narrow it down).
+    """
+
+    def __init__(self, centroids, threshold=0.25):
+        # {part: {source: unit vector}}
+        self.centroids = centroids
+        self.threshold = threshold
+
+    @classmethod
+    def from_indexes(cls, indexes, default_sources=None, threshold=0.25):
+        default_sources = default_sources or {}
+        centroids = {}
+        for part, index in indexes.items():
+            centroids[part] = source_centroids(index_embeddings(index, default_sources.get(part, part)))
+            logger.info(f"Router: {len(centroids[part])} source centroids for {part}")
+        return cls(centroids, threshold)
+
+    def scores(self, query_embedding):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        return {
+            part: {source: round(float(np.dot(centroid, query)), 4) for source, centroid in sources.items()}
+            for part, sources in self.centroids.items()
+        }
+
+    def route(self, query_embedding):
+        """
+        Return (parts to query, per-source scores). When no source clears the threshold the single
+        best-scoring part is used, and when no part has centroids at all every part is, so every
+        question still gets an answer.
+        """
+        scores = self.scores(query_embedding)
+        best = {part: max(part_scores.values()) for part, part_scores in scores.items() if part_scores}
+        parts = [part for part, score in best.items() if score >= self.threshold]
+        if not best:
+            parts = list(self.centroids) or ["guidelines", "web"]
+        elif not parts:
+            parts = [max(best, key=best.get)]
+        for part in self.centroids:
+            METRICS.increment("router_decisions", {"part": part, "result": "dispatched" if part in parts else "skipped"})
+        return parts, scores
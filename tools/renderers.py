@@ -0,0 +1,268 @@
+import os
+import re
+import html
+import shutil
+import logging
+import functools
+import subprocess
+from html.parser import HTMLParser
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# PDF backends in order of preference; unavailable or failing ones are skipped
+PDF_BACKENDS = [b.strip() for b in os.getenv("PDF_BACKENDS", "weasyprint,wkhtmltopdf,pdflatex").split(",") if b.strip()]
+
+# Pandoc options for the LaTeX path
+LATEX_ARGS = [
+    "--pdf-engine=pdflatex",
+    "--variable=geometry:margin=0.8in",
+    "--variable=fontsize:11pt",
+    "--variable=linestretch:1.1",
+    "--variable=tables",
+    "--variable=booktabs",
+]
+
+# Report text comes from the LLM, PDFs and crawled pages: raw HTML and LaTeX in it stay literal text
+PANDOC_HTML_FORMAT = "gfm-raw_html"
+PANDOC_LATEX_FORMAT = "markdown-raw_html-raw_tex-raw_attribute"
+
+# What the converters' output may contain; everything else is dropped (keeping its text)
+ALLOWED_TAGS = {
+    "a", "b", "blockquote", "br", "code", "dd", "del", "div", "dl", "dt", "em", "h1", "h2", "h3", "h4", "h5", "h6",
+    "hr", "i", "li", "ol", "p", "pre", "s", "span", "strong", "sub", "sup", "table", "tbody", "td", "tfoot", "th",
+    "thead", "tr", "ul",
+}
+ALLOWED_ATTRIBUTES = {"class", "id", "title", "align", "colspan", "rowspan", "start", "href", "style"}
+VOID_TAGS = {"br", "hr"}
+SAFE_URL_SCHEMES = {"", "http", "https", "mailto"}
+# Tables only ever need an alignment; any other inline style could load a URL
+SAFE_STYLE_PATTERN = re.compile(r"^\s*text-align:\s*(left|right|center)\s*;?\s*$", re.IGNORECASE)
+
+# Styles for the HTML (and HTML to PDF) output, close to the LaTeX layout
+REPORT_CSS = """
+@page { size: A4; margin: 0.8in; }
+body { font-family: "Helvetica Neue", Arial, sans-serif; font-size: 11pt; line-height: 1.45; color: #222; max-width: 60em; margin: 0 auto; }
+h1, h2, h3 { line-height: 1.2; }
+pre, code { font-family: "DejaVu Sans Mono", Consolas, monospace; font-size: 9.5pt; }
+pre { background: #f5f5f5; padding: 0.6em; white-space: pre-wrap; word-wrap: break-word; }
+table { border-collapse: collapse; margin: 1em 0; width: 100%; }
+th, td { border-top: 1px solid #999; border-bottom: 1px solid #999; padding: 0.3em 0.5em; text-align: left; vertical-align: top; }
+th { border-top: 2px solid #333; }
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def available_tools():
+    """
+    Probe once per process for the converters the renderers can use.
+    """
+    tools = {"pdflatex": shutil.which("pdflatex"), "wkhtmltopdf": shutil.which("wkhtmltopdf")}
+    try:
+        import pypandoc
+
+        tools["pandoc"] = pypandoc.get_pandoc_version()
+    except (ImportError, OSError):
+        tools["pandoc"] = None
+    for module in ("markdown", "weasyprint"):
+        try:
+            tools[module] = getattr(__import__(module), "__version__", "installed")
+        except Exception:
+            # WeasyPrint raises OSError when its system libraries are missing
+            tools[module] = None
+    logger.info(f"Report renderers: {', '.join(name for name, version in tools.items() if version) or 'none'}")
+    return tools
+
+
+@functools.lru_cache(maxsize=None)
+def html_template():
+    # Built once; the rendered report body is substituted into it
+    return (
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{title}</title>\n"
+        f"<style>{REPORT_CSS}</style>\n</head>\n<body>\n{{body}}\n</body>\n</html>\n"
+    )
+
+
+def _safe_url(url):
+    # Browsers ignore whitespace and control characters inside a scheme ("java\tscript:")
+    compact = re.sub(r"[\x00-\x20]+", "", html.unescape(url or "")).lower()
+    scheme = compact.split(":", 1)[0] if re.match(r"^[a-z][a-z0-9+.\-]*:", compact) else ""
+    return scheme in SAFE_URL_SCHEMES
+
+
+class _HtmlSanitizer(HTMLParser):
+    """
+    Re-serializes an HTML fragment keeping only ALLOWED_TAGS and ALLOWED_ATTRIBUTES, links with
+    a safe scheme and alignment styles. Images are replaced by their alt text, so rendering a
+    report never fetches anything.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def _attributes(self, attrs):
+        kept = []
+        for name, value in attrs:
+            if name not in ALLOWED_ATTRIBUTES or value is None:
+                continue
+            if name == "href" and not _safe_url(value):
+                continue
+            if name == "style" and not SAFE_STYLE_PATTERN.match(value):
+                continue
+            kept.append(f' {name}="{html.escape(value, quote=True)}"')
+        return "".join(kept)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+        elif tag == "img":
+            self.handle_data(dict(attrs).get("alt") or "")
+        elif tag in ALLOWED_TAGS and not self._skip:
+            self.parts.append(f"<{tag}{self._attributes(attrs)}>")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in ("script", "style"):
+            self._skip -= 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._skip = max(self._skip - 1, 0)
+        elif tag in ALLOWED_TAGS and tag not in VOID_TAGS and not self._skip:
+            self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(html.escape(data, quote=False))
+
+
+def sanitize_html(fragment):
+    sanitizer = _HtmlSanitizer()
+    sanitizer.feed(fragment)
+    sanitizer.close()
+    return "".join(sanitizer.parts)
+
+
+def _markdown_without_raw_html():
+    import markdown
+    from markdown.extensions import Extension
+
+    class EscapeRawHtml(Extension):
+        # Raw HTML blocks and inline tags are rendered as literal text
+        def extendMarkdown(self, md):
+            md.preprocessors.deregister("html_block")
+            md.inlinePatterns.deregister("html")
+
+    return markdown.Markdown(extensions=["tables", "fenced_code", "sane_lists", EscapeRawHtml()])
+
+
+def markdown_to_html(markdown_content):
+    """
+    HTML fragment: Python-Markdown in-process, else pandoc, else the escaped source. Raw HTML in
+    the Markdown is not passed through, and the output is sanitized, since the report mixes LLM
+    output with text from PDFs and crawled pages.
+    """
+    tools = available_tools()
+    if tools["markdown"]:
+        return sanitize_html(_markdown_without_raw_html().convert(markdown_content))
+    if tools["pandoc"]:
+        import pypandoc
+
+        return sanitize_html(pypandoc.convert_text(markdown_content, "html", format=PANDOC_HTML_FORMAT))
+    return f"<pre>{html.escape(markdown_content)}</pre>"
+
+
+def report_title(markdown_content):
+    for line in markdown_content.splitlines():
+        if line.startswith("# "):
+            return line[2:].strip()
+    return "Report"
+
+
+def render_html(markdown_content):
+    """
+    Return the report as a standalone HTML document.
+    """
+    head, tail = html_template().split("{body}", 1)
+    return head.replace("{title}", html.escape(report_title(markdown_content))) + markdown_to_html(markdown_content) + tail
+
+
+def _refuse_url(url, *args, **kwargs):
+    # The stylesheet is inline; a report must not make WeasyPrint fetch files or internal URLs
+    raise ValueError(f"Fetching {url} is disabled for reports")
+
+
+class WeasyPrintRenderer:
+    name = "weasyprint"
+
+    def available(self):
+        return bool(available_tools()["weasyprint"])
+
+    def render(self, markdown_content, output_file):
+        import weasyprint
+
+        weasyprint.HTML(string=render_html(markdown_content), url_fetcher=_refuse_url).write_pdf(output_file)
+
+
+class WkhtmltopdfRenderer:
+    name = "wkhtmltopdf"
+
+    def available(self):
+        return bool(available_tools()["wkhtmltopdf"])
+
+    def render(self, markdown_content, output_file):
+        # The HTML is piped on stdin, nothing is written besides the PDF
+        subprocess.run(
+            [
+                available_tools()["wkhtmltopdf"], "--quiet", "--encoding", "utf-8",
+                "--disable-javascript", "--disable-local-file-access", "-", output_file,
+            ],
+            input=render_html(markdown_content).encode("utf-8"),
+            check=True,
+            capture_output=True,
+            timeout=120,
+        )
+
+
+class LatexRenderer:
+    name = "pdflatex"
+
+    def available(self):
+        tools = available_tools()
+        return bool(tools["pandoc"] and tools["pdflatex"])
+
+    def render(self, markdown_content, output_file):
+        import pypandoc
+
+        pypandoc.convert_text(markdown_content, "pdf", format=PANDOC_LATEX_FORMAT, outputfile=output_file, extra_args=LATEX_ARGS)
+
+
+RENDERERS = {renderer.name: renderer for renderer in (WeasyPrintRenderer(), WkhtmltopdfRenderer(), LatexRenderer())}
+
+
+def pdf_renderers():
+    # Configured backends that are installed, in order of preference
+    return [RENDERERS[name] for name in PDF_BACKENDS if name in RENDERERS and RENDERERS[name].available()]
+
+
+def render_pdf(markdown_content, output_file):
+    """
+    Render Markdown to a PDF with the first backend that succeeds; returns the backend's name.
+    """
+    renderers = pdf_renderers()
+    if not renderers:
+        raise RuntimeError("No PDF renderer available. Install WeasyPrint, wkhtmltopdf, or pandoc with pdflatex.")
+    errors = []
+    for renderer in renderers:
+        try:
+            renderer.render(markdown_content, output_file)
+            if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+                return renderer.name
+            errors.append(f"{renderer.name}: no output")
+        except Exception as e:
+            logger.warning(f"[!] {renderer.name} could not render the report, trying the next renderer: {str(e)}")
+            errors.append(f"{renderer.name}: {str(e)}")
+    raise RuntimeError(f"Every PDF renderer failed ({'; '.join(errors)})")
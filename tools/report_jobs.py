@@ -0,0 +1,207 @@
+import os
+import uuid
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from tools.report_generator import generate_report
+from tools.renderers import render_html
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Directory holding rendered reports, named by the hash of their Markdown
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+
+
+class ReportJob:
+    """
+    One requested report. Every request gets its own id, while the PDF itself is
+    content-addressed: jobs with identical Markdown share one artifact and one render.
+    A `deferred` job has its Markdown stored but no PDF until someone asks for it.
+    """
+
+    def __init__(self, report_id, content_hash, path):
+        self.id = report_id
+        self.content_hash = content_hash
+        self.path = path
+        self.status = "queued"
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "content_hash": self.content_hash,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _render(markdown_content, path):
+    # Runs in a worker process: render to a temporary name, then publish atomically
+    tmp_path = f"{path}.{os.getpid()}.tmp.pdf"
+    result = generate_report(markdown_content, output_file=tmp_path)
+    if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise RuntimeError(result)
+    os.replace(tmp_path, path)
+    return result
+
+
+class ReportQueue:
+    """
+    Bounded pool of PDF rendering worker processes with a job table for status lookups.
+    """
+
+    def __init__(self, reports_dir=REPORTS_DIR, max_workers=2, max_pending=32, max_jobs=1000):
+        self.reports_dir = reports_dir
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._renders = {}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned, not forked: the server holds locks, HTTP clients and model handles
+                # that a forked child would inherit in an inconsistent state
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def artifact_path(self, content_hash, extension="pdf"):
+        return os.path.join(self.reports_dir, f"{content_hash}.{extension}")
+
+    def get(self, report_id):
+        return self._jobs.get(report_id)
+
+    def pending(self):
+        return sum(1 for future in self._renders.values() if not future.done())
+
+    def register(self, markdown_content):
+        """
+        Record a report without rendering it: its Markdown is stored and the PDF is only
+        rendered by `start`, e.g. when it is first downloaded.
+        """
+        content_hash = hashlib.sha256(markdown_content.encode("utf-8")).hexdigest()
+        job = ReportJob(uuid.uuid4().hex, content_hash, self.artifact_path(content_hash))
+        self._prune()
+        self._jobs[job.id] = job
+
+        os.makedirs(self.reports_dir, exist_ok=True)
+        markdown_path = self.artifact_path(content_hash, "md")
+        if not os.path.exists(markdown_path):
+            _write_atomic(markdown_path, markdown_content)
+
+        # Identical Markdown is never compiled twice: reuse the file or the running render
+        if os.path.exists(job.path):
+            job.status = "done"
+            job.finished_at = time.time()
+        elif content_hash in self._renders:
+            job.status = "rendering"
+            self._renders[content_hash].add_done_callback(lambda future, job=job: self._finish(job, future))
+        else:
+            job.status = "deferred"
+        return job
+
+    def submit(self, markdown_content):
+        """
+        Queue a render and return its job immediately. Must be called from the event loop.
+        Raises OverflowError when the queue is full.
+        """
+        job = self.register(markdown_content)
+        try:
+            return self.start(job, markdown_content)
+        except OverflowError:
+            del self._jobs[job.id]
+            raise
+
+    def markdown(self, job):
+        with open(self.artifact_path(job.content_hash, "md"), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def html_path(self, job):
+        # HTML is rendered in-process on first request (milliseconds), then served from disk
+        path = self.artifact_path(job.content_hash, "html")
+        if not os.path.exists(path):
+            _write_atomic(path, render_html(self.markdown(job)))
+        return path
+
+    def start(self, job, markdown_content=None):
+        """
+        Start rendering a deferred job's PDF (a no-op for other jobs). Must be called from the
+        event loop. Raises OverflowError when the queue is full.
+        """
+        if job.status != "deferred":
+            return job
+        content_hash = job.content_hash
+        if os.path.exists(job.path):
+            job.status = "done"
+            job.finished_at = time.time()
+            return job
+
+        render = self._renders.get(content_hash)
+        if render is None:
+            if self.pending() >= self.max_pending:
+                raise OverflowError("Too many reports are waiting to be rendered")
+            if markdown_content is None:
+                markdown_content = self.markdown(job)
+            loop = asyncio.get_running_loop()
+            render = asyncio.ensure_future(loop.run_in_executor(self._get_executor(), _render, markdown_content, job.path))
+            self._renders[content_hash] = render
+            render.add_done_callback(lambda _, content_hash=content_hash: self._renders.pop(content_hash, None))
+
+        job.status = "rendering"
+        render.add_done_callback(lambda future, job=job: self._finish(job, future))
+        return job
+
+    def _prune(self):
+        # Forget the oldest finished jobs; their PDFs stay on disk for content-addressed reuse
+        if len(self._jobs) < self.max_jobs:
+            return
+        finished = sorted((j for j in self._jobs.values() if j.status in ("done", "failed", "deferred")), key=lambda j: j.created_at)
+        for job in finished[:len(self._jobs) - self.max_jobs + 1]:
+            del self._jobs[job.id]
+
+    def _finish(self, job, future):
+        job.finished_at = time.time()
+        if future.cancelled() or future.exception() is not None:
+            job.status = "failed"
+            job.error = "Render was cancelled" if future.cancelled() else str(future.exception())
+            logger.error(f"[!] Report {job.id} failed: {job.error}")
+        else:
+            job.status = "done"
+            logger.info(f"✅ Report {job.id} ready at {job.path}")
+
+    async def wait(self, job):
+        render = self._renders.get(job.content_hash)
+        if render is not None and job.status == "rendering":
+            try:
+                await asyncio.shield(render)
+            except Exception:
+                pass
+        return job
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
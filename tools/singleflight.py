@@ -0,0 +1,41 @@
+import asyncio
+import logging
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller starts the computation and
+    every caller that arrives while it is running awaits the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.counters = {"started": 0, "coalesced": 0}
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def _forget(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not future.cancelled():
+            future.exception()
+
+    async def do(self, key, make_coroutine):
+        future = self._calls.get(key)
+        if future is None:
+            self.counters["started"] += 1
+            future = asyncio.ensure_future(make_coroutine())
+            self._calls[key] = future
+            future.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.counters["coalesced"] += 1
+            logger.info(f"Joining in-flight request for {key!r}")
+
+        # A disconnecting caller must not cancel the work other callers are waiting on
+        return await asyncio.shield(future)
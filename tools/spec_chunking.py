@@ -0,0 +1,281 @@
+import re
+import logging
+from typing import Any
+from llama_index.core import Settings
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, TextNode
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Clause headings such as "7.4.1 RAN Function Description"; dot leaders mark table-of-contents lines
+CLAUSE_PATTERN = re.compile(r"^(\d{1,2}(?:\.\d{1,2}){0,6})\.?\s+([A-Za-z][^\t]{0,118}?)(?<![.,;:])$")
+TOC_PATTERN = re.compile(r"\.{4,}|…")
+
+# Numbered lines that are not headings: a quantity with its unit ("10 ms ...", "3.5 dB"), a date
+# ("16 Mar 2023"), or, for top-level numbers, a sentence ("5 UEs are served by the cell")
+UNIT_PATTERN = re.compile(r"^(?:ms|us|µs|ns|min|bits?|bytes?|octets?|dBm?|k?Hz|MHz|GHz|[kMG]?bps|km|%)(?![\w-])")
+DATE_PATTERN = re.compile(r"^(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{4}\b")
+SENTENCE_VERB_PATTERN = re.compile(r"\b(?:is|are|was|were|be|been|being|shall|should|may|might|must|will|can|could|has|have|had|does|do)\b")
+
+# Table captions ("Table 7.4.1-1: ...") and column gaps in extracted text
+TABLE_CAPTION_PATTERN = re.compile(r"^Table\s+[\dA-Z][\w.\-]*\s*[:.\-–]")
+COLUMN_GAP = re.compile(r"\s{2,}|\t")
+
+# Metadata kept out of embeddings and LLM prompts; it is only used for grouping and ordering
+INTERNAL_METADATA = ["section_id", "node_type", "position", "chunk_index", "table_caption"]
+
+
+def match_clause(line):
+    """
+    Return (clause, title) when `line` is a clause heading, else None.
+
+    >>> match_clause("7.4.1 RAN Function Description")
+    ('7.4.1', 'RAN Function Description')
+    >>> match_clause("4 Definitions and abbreviations")
+    ('4', 'Definitions and abbreviations')
+    >>> [match_clause(line) for line in ("5 UEs are served by the cell", "1 The E2 Node shall include the IE",
+    ...                                  "10 ms granularity period", "8 bits", "16 Mar 2023", "3.5 dB")]
+    [None, None, None, None, None, None]
+    """
+    match = CLAUSE_PATTERN.match(line)
+    if not match or COLUMN_GAP.search(line) or TOC_PATTERN.search(line):
+        return None
+    clause, title = match.group(1), match.group(2).strip()
+    if UNIT_PATTERN.match(title) or DATE_PATTERN.match(title):
+        return None
+    if "." not in clause and (not title[0].isupper() or SENTENCE_VERB_PATTERN.search(title)):
+        # Top-level headings are short capitalised titles; numbered prose and list items are not
+        return None
+    return clause, title
+
+
+def _columns(line):
+    return [cell.strip() for cell in COLUMN_GAP.split(line.strip()) if cell.strip()]
+
+
+def _table_markdown(caption, rows):
+    # Render rows as a Markdown table so the header/column relationship survives chunking
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    lines = [caption] if caption else []
+    lines.append("| " + " | ".join(rows[0]) + " |")
+    lines.append("|" + "---|" * width)
+    lines.extend("| " + " | ".join(row) + " |" for row in rows[1:])
+    return "\n".join(lines)
+
+
+class SpecChunker:
+    """
+    Splits O-RAN specification pages on clause numbering and keeps IE/parameter tables intact.
+    Every node carries the clause it belongs to, so neighbouring chunks can later be expanded to
+    their whole section. Clause context is carried across page breaks.
+    """
+
+    name = "spec-v2"
+
+    def __init__(self, chunk_size=256, max_table_chars=4000):
+        self.max_table_chars = max_table_chars
+        self._splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=0)
+
+    def _segments(self, text, clause, title):
+        # Split one page into (clause, title, kind, text, caption) blocks; also returns the clause the page ends in
+        segments, prose, rows, caption = [], [], [], ""
+
+        def flush_prose():
+            block = "\n".join(prose).strip()
+            prose.clear()
+            return [(clause, title, "text", block, "")] if block else []
+
+        def flush_table():
+            nonlocal caption
+            blocks = []
+            if len(rows) >= 2:
+                blocks.append((clause, title, "table", rows[:], caption))
+            elif rows or caption:
+                prose.extend([caption] if caption else [])
+                prose.extend("  ".join(row) for row in rows)
+            rows.clear()
+            caption = ""
+            return blocks
+
+        lines = text.splitlines()
+        for number, line in enumerate(lines):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            heading = match_clause(stripped)
+            if heading:
+                segments.extend(flush_table())
+                segments.extend(flush_prose())
+                clause, title = heading
+                continue
+            if TABLE_CAPTION_PATTERN.match(stripped):
+                segments.extend(flush_table())
+                segments.extend(flush_prose())
+                caption = stripped
+                continue
+
+            cells = _columns(stripped)
+            upcoming = [_columns(l) for l in lines[number + 1:number + 3] if l.strip()]
+            starts_table = len(cells) >= 3 and len(upcoming) >= 1 and all(len(c) >= 2 for c in upcoming)
+            if len(cells) >= 2 and (rows or caption or starts_table):
+                if not rows:
+                    segments.extend(flush_prose())
+                rows.append(cells)
+            elif rows and len(stripped) < 60:
+                # A wrapped cell: continue the last column of the previous row
+                rows[-1][-1] = f"{rows[-1][-1]} {stripped}"
+            else:
+                segments.extend(flush_table())
+                prose.append(stripped)
+        segments.extend(flush_table())
+        segments.extend(flush_prose())
+        return segments, clause, title
+
+    def _table_texts(self, caption, rows):
+        text = _table_markdown(caption, rows)
+        if len(text) <= self.max_table_chars:
+            return [text]
+        # Very large tables are split by rows, repeating the caption and header row
+        parts, current = [], [rows[0]]
+        for row in rows[1:]:
+            if len(_table_markdown(caption, current + [row])) > self.max_table_chars and len(current) > 1:
+                parts.append(_table_markdown(caption, current))
+                current = [rows[0]]
+            current.append(row)
+        parts.append(_table_markdown(caption, current))
+        return parts
+
+    def split(self, documents):
+        """
+        Return one (context, nodes) pair per page document. `context` is the clause the page
+        starts in; it belongs in the page hash because it changes the metadata of the page's nodes.
+        """
+        # The clause a page ends in carries over to the next page
+        clause, title = "", ""
+        pages = []
+        for position, document in enumerate(documents):
+            context = f"{clause} {title}".strip()
+            source = document.metadata.get("source") or document.metadata.get("file_name", "")
+            nodes = []
+            segments, clause, title = self._segments(document.text, clause, title)
+            for segment_clause, segment_title, kind, block, caption in segments:
+                texts = self._table_texts(caption, block) if kind == "table" else self._splitter.split_text(block)
+                for text in texts:
+                    metadata = {
+                        **document.metadata,
+                        "clause": segment_clause,
+                        "clause_title": segment_title,
+                        "section_id": f"{source}#{segment_clause}" if segment_clause else "",
+                        "node_type": kind,
+                        "position": position,
+                        "chunk_index": len(nodes),
+                    }
+                    if caption:
+                        metadata["table_caption"] = caption
+                    nodes.append(TextNode(
+                        text=text,
+                        metadata=metadata,
+                        excluded_embed_metadata_keys=[*document.excluded_embed_metadata_keys, *INTERNAL_METADATA],
+                        excluded_llm_metadata_keys=[*document.excluded_llm_metadata_keys, *INTERNAL_METADATA],
+                    ))
+            pages.append((context, nodes))
+        return pages
+
+    def get_nodes(self, documents):
+        return [node for _, nodes in self.split(documents) for node in nodes]
+
+
+class PlainChunker:
+    """
+    The default splitter from Settings, one page at a time.
+    """
+
+    name = "plain-v1"
+
+    def split(self, documents):
+        return [("", Settings.node_parser.get_nodes_from_documents([document])) for document in documents]
+
+    def get_nodes(self, documents):
+        return Settings.node_parser.get_nodes_from_documents(documents)
+
+
+class SectionStore:
+    """
+    Maps each clause section to its child chunks, using the texts held by a keyword index, so a
+    section can be reassembled without another store.
+    """
+
+    def __init__(self, keyword_index):
+        self._keyword_index = keyword_index
+        self._children = keyword_index.sections()
+        for children in self._children.values():
+            children.sort()
+
+    def __contains__(self, section_id):
+        return section_id in self._children
+
+    def text(self, section_id):
+        return "\n".join(self._keyword_index.texts[node_id] for _, _, node_id in self._children.get(section_id, []))
+
+    def pages(self, section_id):
+        labels = []
+        for _, _, node_id in self._children.get(section_id, []):
+            label = self._keyword_index.metadata[node_id].get("page_label")
+            if label and label not in labels:
+                labels.append(label)
+        return labels
+
+
+class SectionExpansionPostprocessor(BaseNodePostprocessor):
+    """
+    Parent-child retrieval: small chunks are searched, and when at least `min_children` hits come
+    from the same clause they are replaced by that whole section (if it fits `max_section_chars`).
+    Lone hits stay as they are, so the LLM only gets the extra context when a section is clearly relevant.
+    """
+
+    section_store: Any = None
+    min_children: int = 2
+    max_section_chars: int = 6000
+
+    @classmethod
+    def class_name(cls):
+        return "SectionExpansionPostprocessor"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        groups = {}
+        for n in nodes:
+            section_id = n.node.metadata.get("section_id")
+            if section_id and section_id in self.section_store:
+                groups.setdefault(section_id, []).append(n)
+
+        results, expanded = [], set()
+        for n in nodes:
+            section_id = n.node.metadata.get("section_id")
+            children = groups.get(section_id, [])
+            if len(children) < self.min_children:
+                results.append(n)
+                continue
+            if section_id in expanded:
+                continue
+            text = self.section_store.text(section_id)
+            if len(text) > self.max_section_chars:
+                results.append(n)
+                continue
+            expanded.add(section_id)
+            first = children[0].node
+            metadata = {key: value for key, value in first.metadata.items() if key not in ("node_type", "chunk_index", "table_caption")}
+            metadata["page_label"] = ", ".join(self.section_store.pages(section_id)) or metadata.get("page_label", "")
+            section = TextNode(
+                id_=f"section:{section_id}",
+                text=text,
+                metadata=metadata,
+                excluded_embed_metadata_keys=first.excluded_embed_metadata_keys,
+                excluded_llm_metadata_keys=first.excluded_llm_metadata_keys,
+            )
+            scores = [child.score for child in children if child.score is not None]
+            results.append(NodeWithScore(node=section, score=max(scores) if scores else None))
+        return results
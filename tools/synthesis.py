@@ -0,0 +1,114 @@
+import logging
+from llama_index.core import Settings
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.response_synthesizers import BaseSynthesizer
+from llama_index.core.schema import QueryBundle, MetadataMode
+
+# Configure logging for consistent output
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Prompt used to turn a verbose user request into a short search query for the retriever
+QUERY_REWRITE_PROMPT = PromptTemplate(
+    """
+    Rewrite the following request as a short search query for O-RAN specifications and documentation.
+    Keep every identifier, acronym, IE name and measurement name exactly as written. Return only the query.
+
+    Request: {query_str}
+    Search query:
+    """
+)
+
+
+def rewrite_query(query_str, llm=None):
+    # Ask the LLM for a compact search query; fall back to the original text on any failure
+    try:
+        rewritten = (llm or Settings.llm).predict(QUERY_REWRITE_PROMPT, query_str=query_str).strip()
+        return rewritten or query_str
+    except Exception as e:
+        logger.warning(f"[!] Query rewriting failed, using the original query: {str(e)}")
+        return query_str
+
+
+async def arewrite_query(query_str, llm=None):
+    try:
+        rewritten = (await (llm or Settings.llm).apredict(QUERY_REWRITE_PROMPT, query_str=query_str)).strip()
+        return rewritten or query_str
+    except Exception as e:
+        logger.warning(f"[!] Query rewriting failed, using the original query: {str(e)}")
+        return query_str
+
+
+def build_query_bundle(query_str, rewrite=False, llm=None):
+    """
+    Build the QueryBundle sent to a retriever. Only the user's question (or its rewrite) is
+    embedded; the instruction template is applied later, at synthesis time.
+    """
+    if not rewrite:
+        return QueryBundle(query_str=query_str)
+    search_query = rewrite_query(query_str, llm=llm)
+    logger.info(f"Rewrote query for retrieval: {search_query[:100]}")
+    return QueryBundle(query_str=query_str, custom_embedding_strs=[search_query])
+
+
+async def abuild_query_bundle(query_str, rewrite=False, llm=None):
+    if not rewrite:
+        return QueryBundle(query_str=query_str)
+    search_query = await arewrite_query(query_str, llm=llm)
+    logger.info(f"Rewrote query for retrieval: {search_query[:100]}")
+    return QueryBundle(query_str=query_str, custom_embedding_strs=[search_query])
+
+
+def format_context(text_chunks):
+    return "\n\n".join(f"[{position}] {chunk}" for position, chunk in enumerate(text_chunks, start=1))
+
+
+class ReportSynthesizer(BaseSynthesizer):
+    """
+    Synthesizer that sends all retrieved chunks plus an instruction template to the LLM in a
+    single call. The template must accept `{context_str}` and `{query_str}`.
+    """
+
+    def __init__(self, report_template, llm=None, streaming=False):
+        super().__init__(llm=llm, streaming=streaming)
+        self._report_template = report_template
+
+    def _get_prompts(self):
+        return {"report_template": self._report_template}
+
+    def _update_prompts(self, prompts):
+        if "report_template" in prompts:
+            self._report_template = prompts["report_template"]
+
+    def get_response(self, query_str, text_chunks, **response_kwargs):
+        context_str = format_context(text_chunks)
+        if self._streaming:
+            return self._llm.stream(self._report_template, context_str=context_str, query_str=query_str, **response_kwargs)
+        return self._llm.predict(self._report_template, context_str=context_str, query_str=query_str, **response_kwargs)
+
+    async def aget_response(self, query_str, text_chunks, **response_kwargs):
+        context_str = format_context(text_chunks)
+        if self._streaming:
+            return await self._llm.astream(self._report_template, context_str=context_str, query_str=query_str, **response_kwargs)
+        return await self._llm.apredict(self._report_template, context_str=context_str, query_str=query_str, **response_kwargs)
+
+    async def astream_response(self, query_str, nodes):
+        # Stream answer tokens for already-retrieved nodes straight from the LLM
+        text_chunks = [n.node.get_content(metadata_mode=MetadataMode.LLM) for n in nodes]
+        return await self._llm.astream(self._report_template, context_str=format_context(text_chunks), query_str=query_str)
+
+
+def node_sources(nodes):
+    # Describe retrieved nodes for attribution, strongest hit per source first
+    sources = {}
+    for n in nodes:
+        metadata = n.node.metadata
+        source = metadata.get("source") or metadata.get("file_name") or "unknown"
+        score = round(float(n.score), 4) if n.score is not None else None
+        entry = sources.setdefault(source, {"source": source, "pages": [], "score": score})
+        page = metadata.get("page_label")
+        if page and page not in entry["pages"]:
+            entry["pages"].append(page)
+        if score is not None and (entry["score"] is None or score > entry["score"]):
+            entry["score"] = score
+    return list(sources.values())
@@ -1,20 +1,20 @@
 import os
 import logging
+import threading
 from llama_index.core import VectorStoreIndex, Document
-from llama_index.readers.web import SimpleWebPageReader
-from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
 from urllib.parse import urlparse
 import validators
-from llama_index.core import Settings
-import chromadb
 import config
+from tools.ingestion import sync_collection, web_sources
+from tools.crawler import WebCrawler
+from tools.context_compression import context_compressor
 
 # Configure logging for consistent debug output
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-def load_index(url: str = None, index_name: str = "web", use_chroma=True):
+def load_index(url: str = None, index_name: str = "web", use_chroma=True, crawler=None):
     # Set a default URL if none is provided
     if not url:
         url = "https://docs.o-ran-sc.org/projects/o-ran-sc-nonrtric/en/latest/overview.html#nonrtric-components"
@@ -24,30 +24,18 @@ def load_index(url: str = None, index_name: str = "web", use_chroma=True):
         logger.error(f"[!] Invalid URL: {url}")
         raise ValueError(f"Invalid URL: {url}")
 
-    # Ensure the embedding model is initialized
-    if not Settings.embed_model:
-        logger.error("[!] Embedding model not initialized")
-        raise ValueError("Embedding model not initialized")
+    # Ensure the embedding model is initialized (built lazily on first use)
+    config.configure_settings()
 
     try:
-        # Load and parse the webpage into documents
-        documents = SimpleWebPageReader(html_to_text=True).load_data([url])
+        # Crawl from the URL (WEB_CRAWL_DEPTH levels deep); unchanged pages come from the page cache
+        documents = (crawler or WebCrawler.from_env()).crawl_documents([url])
         logger.info(f"Loaded {len(documents)} documents from {url}")
 
         if use_chroma:
-            # Initialize Chroma client
-            chroma_client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
-            chroma_collection = chroma_client.get_or_create_collection(name=index_name)
-
-            # Create Chroma vector store
-            vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-
-            # Create and persist the index
-            index = VectorStoreIndex.from_documents(
-                documents,
-                vector_store=vector_store
-            )
-            logger.info(f"Created and persisted index for {index_name} in Chroma")
+            # Re-embed only the pages whose content changed since the last sync
+            index = sync_collection(index_name, web_sources(documents))
+            logger.info(f"Opened persistent index for {index_name} in Chroma")
         else:
             # Create in-memory index for LlamaIndex
             index = VectorStoreIndex.from_documents(documents)
@@ -63,7 +51,9 @@ def asQueryEngineTool(index):
         logger.error("[!] Web index could not be loaded")
         raise ValueError("Web index could not be loaded")
     
-    query_engine = index.as_query_engine(response_mode="compact")
+    # Drop duplicate page boilerplate and irrelevant sentences before the compact synthesis
+    compressor = context_compressor()
+    query_engine = index.as_query_engine(response_mode="compact", node_postprocessors=[compressor] if compressor else [])
     return QueryEngineTool(
         query_engine=query_engine,
         metadata=ToolMetadata(
@@ -72,9 +62,24 @@ def asQueryEngineTool(index):
         )
     )
 
-try:
-    index = load_index(use_chroma=True)  # Default to Chroma
-    web_reader_engine = asQueryEngineTool(index)
-except Exception as e:
-    logger.error(f"[!] Failed to initialize web_reader_engine: {str(e)}")
-    raise
+# The tool is built on first use so importing this module stays free of side effects
+_web_reader_engine = None
+_engine_lock = threading.Lock()
+
+def get_web_reader_engine():
+    global _web_reader_engine
+    with _engine_lock:
+        if _web_reader_engine is None:
+            try:
+                index = load_index(use_chroma=True)  # Default to Chroma
+                _web_reader_engine = asQueryEngineTool(index)
+            except Exception as e:
+                logger.error(f"[!] Failed to initialize web_reader_engine: {str(e)}")
+                raise
+        return _web_reader_engine
+
+def warmup():
+    get_web_reader_engine()
+
+if __name__ == "__main__":
+    warmup()